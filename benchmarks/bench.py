@@ -0,0 +1,251 @@
+"""Benchmark suite of pytrec_eval.
+
+    python benchmarks/bench.py run [--scale small|medium|large] [--seed S] [--repeat N] [--output results.json]
+                                   [--root DIR]
+    python benchmarks/bench.py compare old.json new.json [--threshold 0.1]
+    python benchmarks/bench.py compare --commits OLD NEW [--scale ...]
+
+run times (and measures the peak memory allocated by) parsing, every metric and the main
+utilities on seeded synthetic data (see synthetic.py) and writes the results as JSON.
+compare flags the benchmarks whose time or peak memory grew by more than threshold between two
+result files, or between two commits (each benchmarked in a temporary git worktree), and exits
+with status 1 if there are regressions. Benchmarks using functions missing from the benchmarked
+version are skipped. run benchmarks the pytrec_eval of the checkout in --root (by default, the
+one containing this file).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# the checkout containing this file
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+__author__ = 'alberto'
+
+
+class Skip(Exception):
+    """Raised by the setup of a benchmark using functions missing from pytrec_eval."""
+
+
+def _get(module, name):
+    value = getattr(module, name, None)
+    if value is None: raise Skip(name + ' not available')
+    return value
+
+
+def benchmarks(data, tmpDir):
+    """Yields pairs (name, setup) where setup() returns the function to benchmark."""
+    import pytrec_eval
+
+    runFile, qrelsFile = os.path.join(tmpDir, 'run0.trecrun'), os.path.join(tmpDir, 'qrels.txt')
+    synthetic.writeRun(data['runs'][0], runFile)
+    synthetic.writeQRels(data['qrels'], qrelsFile)
+
+    runs = [pytrec_eval.TrecRun(entries, 'run%d' % i) for i, entries in enumerate(data['runs'])]
+    qrels = pytrec_eval.QRels(data['qrels'])
+
+    yield 'parse.TrecRun', lambda: lambda: pytrec_eval.TrecRun(runFile)
+    yield 'parse.TrecRun.columnar', lambda: lambda: pytrec_eval.TrecRun(runFile, columnar=True)
+    yield 'parse.QRels', lambda: lambda: pytrec_eval.QRels(qrelsFile)
+
+    # metrics.py: the functions themselves and their evaluation through evaluate
+    metrics = [('precision', lambda: pytrec_eval.precision), ('recall', lambda: pytrec_eval.recall),
+               ('avgPrec', lambda: pytrec_eval.avgPrec), ('ndcg', lambda: pytrec_eval.ndcg),
+               ('precisionAt10', lambda: pytrec_eval.precisionAt(10))]
+    for name, metric in metrics:
+        yield 'metrics.' + name, lambda metric=metric: lambda m=metric(): m(runs[0], qrels)
+        yield 'evaluate.' + name, lambda metric=metric: lambda m=metric(): pytrec_eval.evaluate(runs[0], qrels, m)
+    yield 'evaluate.cutoffMeasures', lambda: lambda m=_get(pytrec_eval, 'cutoffMeasures')(
+        ['P', 'recall', 'ndcg'], [5, 10, 20, 100, 1000]): pytrec_eval.evaluate(runs[0], qrels, m)
+
+    single, singleQRels = data['classification']
+    classificationRun, classificationQRels = pytrec_eval.TrecRun(single), pytrec_eval.QRels(singleQRels)
+    for name in ['confusion_matrix', 'precision_classification', 'recall_classification', 'f1_classification',
+                 'classification_scores']:
+        yield 'classification.' + name, lambda name=name: lambda m=_get(pytrec_eval, name): \
+            m(classificationRun, classificationQRels)
+    multi, multiQRels = data['multiLabel']
+    multiRun, multiQRels = pytrec_eval.TrecRun(multi), pytrec_eval.QRels(multiQRels)
+    for name in ['precision_multitopic', 'recall_multitopic', 'accuracy_multitopic', 'exact_match_ratio',
+                 'retrieval_fscore']:
+        yield 'classification.' + name, lambda name=name: lambda m=_get(pytrec_eval, name): m(multiRun, multiQRels)
+
+    clusters, classes = data['clustering']
+    clusteringRun, clusteringQRels = pytrec_eval.TrecRun(clusters), pytrec_eval.QRels(classes)
+    for name in ['purity', 'nmi', 'rand_index', 'adjusted_rand_index']:
+        yield 'clustering.' + name, lambda name=name: lambda m=_get(pytrec_eval, name): \
+            m(clusteringRun, clusteringQRels)
+    yield 'clustering.f_clustering', lambda: lambda m=pytrec_eval.f_clustering(1): m(clusteringRun, clusteringQRels)
+
+    def evaluateAll():
+        # evaluateAll also prints to sys.stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            pytrec_eval.evaluateAll(runs, qrels, pytrec_eval.STD_METRICS, streamOut=io.StringIO())
+
+    yield 'utils.evaluateAll', lambda: evaluateAll
+    yield 'utils.ttest', lambda: lambda: pytrec_eval.ttest(runs[0], runs[1:], qrels, pytrec_eval.ndcg)
+    yield 'pandas.df_evaluateAll', lambda: lambda f=_get(pytrec_eval, 'df_evaluateAll'): \
+        f(runs, qrels, pytrec_eval.STD_METRICS)
+
+
+def measure(function, repeat):
+    """Returns the timings (seconds) of repeat calls of function and the peak memory allocated by one call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runSuite(scale, seed=0, repeat=5, select=None, log=sys.stderr):
+    """Runs the benchmarks whose name contains select (all if None) and returns the results as a dictionary."""
+    import numpy
+    import pytrec_eval
+    data = synthetic.generate(scale, seed)
+    results = {}
+    tmpDir = tempfile.mkdtemp()
+    try:
+        for name, setup in benchmarks(data, tmpDir):
+            if select is not None and select not in name: continue
+            try:
+                function = setup()
+                function()  # warm-up
+                times, peak = measure(function, repeat)
+            except Skip as e:
+                results[name] = {'skipped': str(e)}
+            except Exception as e:
+                results[name] = {'error': repr(e)}
+            else:
+                results[name] = {'min': min(times), 'median': statistics.median(times), 'times': times,
+                                 'peakBytes': peak}
+            print('{:40s} {}'.format(name, _describe(results[name])), file=log)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return {
+        'meta': {'pytrec_eval': os.path.dirname(os.path.abspath(pytrec_eval.__file__)), 'commit': _commit(),
+                 'python': platform.python_version(), 'numpy': numpy.__version__, 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': seed, 'repeat': repeat,
+                 'scale': scale.toDict()},
+        'results': results,
+    }
+
+
+def _describe(result):
+    if 'min' in result:
+        return '{:10.4f}s {:10.1f}MB'.format(result['min'], result['peakBytes'] / (1 << 20))
+    return result.get('skipped') or result.get('error')
+
+
+def compare(old, new, threshold=0.1, memoryThreshold=0.1):
+    """Compares two results of runSuite. Returns a list of tuples (name, oldTime, newTime, oldPeak, newPeak,
+    regression) for the benchmarks in both, where regression is True if the minimum time grew by more
+    than threshold or the peak memory by more than memoryThreshold (relative)."""
+    rows = []
+    for name, newResult in new['results'].items():
+        oldResult = old['results'].get(name)
+        if oldResult is None or 'min' not in oldResult or 'min' not in newResult: continue
+        regression = newResult['min'] > oldResult['min'] * (1 + threshold) or \
+            newResult['peakBytes'] > oldResult['peakBytes'] * (1 + memoryThreshold)
+        rows.append((name, oldResult['min'], newResult['min'], oldResult['peakBytes'], newResult['peakBytes'],
+                     regression))
+    return rows
+
+
+def _benchmarkCommit(commit, args):
+    """Runs this suite on pytrec_eval as of commit, in a temporary git worktree."""
+    root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    workTree = tempfile.mkdtemp()
+    output = os.path.join(workTree, 'results.json')
+    subprocess.run(['git', 'worktree', 'add', '--detach', os.path.join(workTree, 'tree'), commit], cwd=root,
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'run', '--scale', args.scale, '--seed', str(args.seed),
+                   '--repeat', str(args.repeat), '--output', output, '--root', os.path.join(workTree, 'tree')]
+        if args.select is not None: command += ['--select', args.select]
+        subprocess.run(command, check=True)
+        with open(output, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+        results['meta']['commit'] = commit
+        return results
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', os.path.join(workTree, 'tree')], cwd=root)
+        shutil.rmtree(workTree, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pytrec_eval benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('run', 'compare'):
+        subparser = commands.add_parser(command)
+        subparser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='medium')
+        subparser.add_argument('--seed', type=int, default=0)
+        subparser.add_argument('--repeat', type=int, default=5)
+        subparser.add_argument('--select', default=None, help='run only the benchmarks whose name contains this')
+        if command == 'run':
+            subparser.add_argument('--output', default=None, help='JSON file (default: standard output)')
+            subparser.add_argument('--root', default=ROOT, help='checkout of pytrec_eval to benchmark')
+        else:
+            subparser.add_argument('files', nargs='*', help='two result files')
+            subparser.add_argument('--commits', nargs=2, default=None, metavar=('OLD', 'NEW'))
+            subparser.add_argument('--threshold', type=float, default=0.1)
+            subparser.add_argument('--memory-threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        sys.path.insert(0, os.path.abspath(args.root))
+        results = runSuite(synthetic.SCALES[args.scale], args.seed, args.repeat, args.select)
+        if args.output is None:
+            json.dump(results, sys.stdout, indent=2)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    if args.commits is not None:
+        old, new = [_benchmarkCommit(commit, args) for commit in args.commits]
+    elif len(args.files) == 2:
+        old, new = [json.load(open(fileName, 'r', encoding='utf-8')) for fileName in args.files]
+    else:
+        parser.error('compare needs two result files or --commits OLD NEW')
+    rows = compare(old, new, args.threshold, args.memory_threshold)
+    print('{:40s} {:>10s} {:>10s} {:>7s} {:>10s} {:>10s}'.format('benchmark', 'old (s)', 'new (s)', 'ratio',
+                                                                  'old (MB)', 'new (MB)'))
+    for name, oldTime, newTime, oldPeak, newPeak, regression in rows:
+        print('{:40s} {:10.4f} {:10.4f} {:7.2f} {:10.1f} {:10.1f}{}'.format(
+            name, oldTime, newTime, newTime / oldTime if oldTime > 0 else float('inf'), oldPeak / (1 << 20),
+            newPeak / (1 << 20), '  REGRESSION' if regression else ''))
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
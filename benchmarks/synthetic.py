@@ -0,0 +1,126 @@
+import numpy as np
+
+__author__ = 'alberto'
+
+
+# Seeded generator of synthetic TREC-like data.
+# All the data is derived from a numpy.random.Generator, so that the same seed and scale
+# always produce the same runs and qrels. Runs are dictionaries
+# entries[topicID] = [ (docID, score, annotation) ] and qrels are dictionaries
+# judgements[topicID][docID] = relevanceScore, as accepted by TrecRun and QRels.
+
+
+class Scale:
+    """Size of the generated data.
+    topics, depth: number of topics and of entries per topic of each run;
+    poolSize: number of distinct documents per topic;
+    judgedFraction: fraction of the pool of each topic that is judged;
+    grades: number of relevance grades (judged documents get a grade in 0 .. grades - 1);
+    runs: number of runs;
+    items, classes, labelsPerItem: size of the classification data;
+    clusterItems, clusters: number of items and of clusters of the clustering run (items have one of
+    classes classes)."""
+
+    def __init__(self, topics=50, depth=1000, poolSize=None, judgedFraction=0.1, grades=3, runs=4,
+                 items=2000, classes=20, labelsPerItem=3, clusterItems=2000, clusters=100):
+        self.topics = topics
+        self.depth = depth
+        self.poolSize = poolSize if poolSize is not None else 4 * depth
+        self.judgedFraction = judgedFraction
+        self.grades = grades
+        self.runs = runs
+        self.items = items
+        self.classes = classes
+        self.labelsPerItem = labelsPerItem
+        self.clusterItems = clusterItems
+        self.clusters = clusters
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+
+SCALES = {
+    'small': Scale(topics=20, depth=100, runs=3, items=500, classes=10, clusterItems=500, clusters=20),
+    'medium': Scale(),
+    'large': Scale(topics=250, depth=1000, runs=8, items=20000, classes=50, clusterItems=10000, clusters=500),
+}
+
+
+def _topicIds(scale):
+    return ['q%d' % t for t in range(scale.topics)]
+
+
+def qrelsJudgements(rng, scale):
+    """Judges judgedFraction of the pool of each topic; higher grades are geometrically less likely."""
+    weights = 0.5 ** np.arange(scale.grades)
+    nJudged = max(1, int(scale.poolSize * scale.judgedFraction))
+    judgements = {}
+    for topicId in _topicIds(scale):
+        docs = rng.choice(scale.poolSize, size=nJudged, replace=False)
+        grades = rng.choice(scale.grades, size=nJudged, p=weights / weights.sum())
+        judgements[topicId] = {'d%d' % d: int(g) for d, g in zip(docs.tolist(), grades.tolist())}
+    return judgements
+
+
+def runEntries(rng, scale, name=''):
+    """Retrieves depth documents of the pool of each topic with decreasing random scores."""
+    entries = {}
+    depth = min(scale.depth, scale.poolSize)
+    for topicId in _topicIds(scale):
+        docs = rng.choice(scale.poolSize, size=depth, replace=False)
+        scores = np.sort(rng.random(depth))[::-1]
+        entries[topicId] = [('d%d' % d, s, name) for d, s in zip(docs.tolist(), scores.tolist())]
+    return entries
+
+
+def classificationData(rng, scale, multiLabel=False):
+    """Returns (entries, judgements): the predicted and the true classes of each item. Each item has
+    one class (labelsPerItem classes if multiLabel), predictions are right with probability 0.7."""
+    nLabels = min(scale.labelsPerItem, scale.classes) if multiLabel else 1
+    entries, judgements = {}, {}
+    for item in range(scale.items):
+        itemId = 'i%d' % item
+        real = rng.choice(scale.classes, size=nLabels, replace=False).tolist()
+        noise = rng.choice(scale.classes, size=nLabels, replace=False).tolist()
+        predicted = [r if rng.random() < 0.7 else n for r, n in zip(real, noise)]
+        judgements[itemId] = {'c%d' % c: 1 for c in real}
+        entries[itemId] = [('c%d' % c, 1.0, '') for c in dict.fromkeys(predicted)]
+    return entries, judgements
+
+
+def clusteringData(rng, scale):
+    """Returns (entries, judgements): the cluster and the class of each item. Items of the same class
+    tend to be in the same cluster."""
+    classes = rng.integers(scale.classes, size=scale.clusterItems)
+    clusters = np.where(rng.random(scale.clusterItems) < 0.6, classes * scale.clusters // scale.classes,
+                        rng.integers(scale.clusters, size=scale.clusterItems))
+    entries = {'i%d' % i: [('k%d' % k, 1.0, '')] for i, k in enumerate(clusters.tolist())}
+    judgements = {'i%d' % i: {'c%d' % c: 1} for i, c in enumerate(classes.tolist())}
+    return entries, judgements
+
+
+def generate(scale, seed=0):
+    """Returns a dictionary with the data of the given scale: 'runs' (a list of run entries), 'qrels',
+    'classification' and 'multiLabel' (pairs (entries, judgements)) and 'clustering' (a pair)."""
+    rng = np.random.default_rng(seed)
+    return {
+        'qrels': qrelsJudgements(rng, scale),
+        'runs': [runEntries(rng, scale, 'run%d' % r) for r in range(scale.runs)],
+        'classification': classificationData(rng, scale),
+        'multiLabel': classificationData(rng, scale, multiLabel=True),
+        'clustering': clusteringData(rng, scale),
+    }
+
+
+def writeRun(entries, fileName):
+    with open(fileName, 'w', encoding='utf-8') as f:
+        for topicId, entryList in entries.items():
+            for rank, (docId, score, annotation) in enumerate(entryList, start=1):
+                f.write('{}\tQ0\t{}\t{}\t{}\t{}\n'.format(topicId, docId, rank, score, annotation))
+
+
+def writeQRels(judgements, fileName):
+    with open(fileName, 'w', encoding='utf-8') as f:
+        for topicId, docsRelevance in judgements.items():
+            for docId, relevanceScore in docsRelevance.items():
+                f.write('{}\t0\t{}\t{}\n'.format(topicId, docId, relevanceScore))
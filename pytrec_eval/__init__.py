@@ -9,3 +9,15 @@ from pytrec_eval.pandas_utils import *
 from pytrec_eval.classification_metrics import *
 from pytrec_eval.clustering_metrics import *
 from pytrec_eval.clustering_utils import *
+from pytrec_eval.streaming import *
+from pytrec_eval.significance import *
+from pytrec_eval.concurrent_io import iterRuns, writeRuns
+from pytrec_eval.server import EvaluationServer
+from pytrec_eval_client import EvaluationClient
+from pytrec_eval.sharding import PartialResult, evaluateShard, evaluateSharded
+from pytrec_eval.results import EvaluationResults
+from pytrec_eval.recall_precision import RecallPrecisionCurves, recallPrecisionTable
+from pytrec_eval.vocabulary import Vocabulary
+from pytrec_eval.pooling import pool, overlap
+from pytrec_eval.result_cache import ResultCache, enableResultCache, disableResultCache
+from pytrec_eval.instrumentation import Instrumentation, enableInstrumentation, disableInstrumentation
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+__author__ = 'alberto'
+
+
+# Binary on-disk cache of parsed runs and qrels.
+# Each entry is a directory containing one .npy file per array (loaded memory-mapped)
+# and one text file per list of identifiers (one identifier per line). Entries are keyed
+# by the absolute path, size and modification time of the source file (or by a hash of
+# its content) plus the options used to parse it. After each store, the least recently
+# used entries are evicted until the cache takes at most maxBytes bytes (entries stored as
+# single files by other modules, e.g. pytrec_eval.result_cache, are evicted in the same way).
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pytrec_eval')
+
+DEFAULT_MAX_BYTES = 10 * (1 << 30)
+
+FORMAT_VERSION = 1
+
+
+def _cacheDir(cacheDir):
+    return DEFAULT_CACHE_DIR if cacheDir is True else cacheDir
+
+
+def entryPath(fileName, kind, cacheDir=True, contentHash=False, **options):
+    """Returns the path of the cache entry of fileName parsed as kind ('run' or 'qrels') with the given options."""
+    digest = hashlib.sha1()
+    if contentHash:
+        with open(fileName, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        stat = os.stat(fileName)
+        digest.update(repr((os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    digest.update(repr((kind, FORMAT_VERSION, sorted(options.items()))).encode('utf-8'))
+    return os.path.join(_cacheDir(cacheDir), kind + '-' + digest.hexdigest())
+
+
+def load(path):
+    """Returns the pair (arrays, stringLists) stored in the cache entry path, or None if the entry does not exist.
+    Arrays are memory-mapped."""
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in meta['arrays']}
+        stringLists = {}
+        for name in meta['stringLists']:
+            with open(os.path.join(path, name + '.txt'), 'r', encoding='utf-8', newline='\n') as f:
+                content = f.read()
+            stringLists[name] = content.split('\n') if meta['stringLists'][name] > 0 else []
+    except (OSError, ValueError, KeyError):
+        return None
+    os.utime(path)  # for the LRU eviction
+    return arrays, stringLists
+
+
+def store(path, arrays, stringLists, maxBytes=DEFAULT_MAX_BYTES):
+    """Stores arrays (a dictionary name -> NumPy array) and stringLists (a dictionary name -> list of strings
+    without newlines) in the cache entry path, then evicts old entries. If another process stores the same
+    entry concurrently, the entry written first is kept."""
+    cacheDir = os.path.dirname(path)
+    os.makedirs(cacheDir, exist_ok=True)
+    tmpPath = tempfile.mkdtemp(dir=cacheDir, prefix='.tmp-')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmpPath, name + '.npy'), np.ascontiguousarray(array))
+        for name, strings in stringLists.items():
+            with open(os.path.join(tmpPath, name + '.txt'), 'w', encoding='utf-8', newline='\n') as f:
+                f.write('\n'.join(strings))
+        with open(os.path.join(tmpPath, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'arrays': list(arrays),
+                       'stringLists': {name: len(strings) for name, strings in stringLists.items()}}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.replace(tmpPath, path)
+        except OSError:
+            # another process stored the same entry in the meantime: its copy is kept
+            if not os.path.isdir(path): raise
+            shutil.rmtree(tmpPath, ignore_errors=True)
+    except OSError:
+        shutil.rmtree(tmpPath, ignore_errors=True)
+        raise
+    evict(cacheDir, maxBytes)
+
+
+def _size(path):
+    if not os.path.isdir(path): return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def evict(cacheDir=True, maxBytes=DEFAULT_MAX_BYTES):
+    """Removes the least recently used entries of the cache until it takes at most maxBytes bytes."""
+    cacheDir = _cacheDir(cacheDir)
+    entries = []
+    for name in os.listdir(cacheDir):
+        path = os.path.join(cacheDir, name)
+        if name.startswith('.tmp-'): continue
+        try:
+            entries.append((os.path.getmtime(path), _size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= maxBytes: break
+        if _remove(path): total -= size
+
+
+def _remove(path):
+    """Removes the entry path (a directory, or a file for results); returns False if it could not be removed."""
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        # removed by another process
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def clear(cacheDir=True):
+    """Removes all the entries of the cache."""
+    shutil.rmtree(_cacheDir(cacheDir), ignore_errors=True)
@@ -1,5 +1,8 @@
 __author__ = 'alberto'
 
+from pytrec_eval.confusion import ConfusionMatrix
+from pytrec_eval.indicator import IndicatorMatrices
+
 
 def confusion_matrix(run, qrels, detailed=False):
     """
@@ -7,27 +10,22 @@ def confusion_matrix(run, qrels, detailed=False):
     Doesn't work for a multi-topic classification task.
     Details has no effect here.
     Use the utils.confusion_matrix_toString() to get a visual representation of the matrix.
+    Use confusion.ConfusionMatrix to compute several metrics from a single (NumPy) matrix.
     :returns a 2d-dictionary cm[predicted][real] = count
     """
-    classes_sorted = qrels.getDocIds()
-    # cm[predicted][actual] = count
-    cm = {c_pred: {c_real: 0 for c_real in classes_sorted} for c_pred in classes_sorted}
-    for test_instance, entries in run.entries.items():
-        predicted_classes = [docId for docId, _, _ in entries]
-        if not predicted_classes: continue
-        real_classes = qrels.allJudgements[test_instance].keys()
-        assert (len(predicted_classes) == 1 and len(real_classes) == 1)
-        for pc in predicted_classes:
-            for rc in real_classes:
-                cm[pc][rc] += 1
-    return cm
+    return ConfusionMatrix(run, qrels).toDict()
 
 
 def precision_classification(run, qrels, detailed=False, conf_matrix=None):
     """
     Computes the precision of the result of a classification task.
+    conf_matrix may be a dictionary returned by confusion_matrix or a ConfusionMatrix.
     """
-    cf = conf_matrix if conf_matrix is not None else confusion_matrix(run, qrels)
+    if conf_matrix is None or isinstance(conf_matrix, ConfusionMatrix):
+        cm = conf_matrix if conf_matrix is not None else ConfusionMatrix(run, qrels)
+        avg = cm.precision()
+        return (avg, cm.perClass(cm.precisions())) if detailed else avg
+    cf = conf_matrix
     precisions = {cl: 0 for cl in cf.keys()}
     for predicted_class, d in cf.items():
         precisions[predicted_class] = cf[predicted_class][predicted_class] / sum(tp_fp for tp_fp in d.values())
@@ -37,8 +35,13 @@ def precision_classification(run, qrels, detailed=False, conf_matrix=None):
 def recall_classification(run, qrels, detailed=False, conf_matrix=None):
     """
     Computes the recall of the result of a classification task.
+    conf_matrix may be a dictionary returned by confusion_matrix or a ConfusionMatrix.
     """
-    cf = conf_matrix if conf_matrix is not None else confusion_matrix(run, qrels)
+    if conf_matrix is None or isinstance(conf_matrix, ConfusionMatrix):
+        cm = conf_matrix if conf_matrix is not None else ConfusionMatrix(run, qrels)
+        avg = cm.recall()
+        return (avg, cm.perClass(cm.recalls())) if detailed else avg
+    cf = conf_matrix
     classes = cf.keys()
     recalls = {cl: 0 for cl in classes}
     for real_class in classes:
@@ -47,9 +50,39 @@ def recall_classification(run, qrels, detailed=False, conf_matrix=None):
     return (sum(recalls.values()) / len(recalls), recalls) if detailed else sum(recalls.values()) / len(recalls)
 
 
+def f1_classification(run, qrels, detailed=False, conf_matrix=None):
+    """
+    Computes the (macro-averaged) F1 score of the result of a classification task.
+    conf_matrix may be a ConfusionMatrix.
+    """
+    cm = conf_matrix if conf_matrix is not None else ConfusionMatrix(run, qrels)
+    avg = cm.fScore()
+    return (avg, cm.perClass(cm.fScores())) if detailed else avg
+
+
+def accuracy_classification(run, qrels, detailed=False, conf_matrix=None):
+    """
+    Computes the accuracy of the result of a classification task.
+    Details has no effect here.
+    """
+    cm = conf_matrix if conf_matrix is not None else ConfusionMatrix(run, qrels)
+    return cm.accuracy()
+
+
+def classification_scores(run, qrels):
+    """
+    Computes accuracy, precision, recall and F1 (macro, micro and weighted averages) of the result
+    of a classification task from a single confusion matrix.
+    :returns a dictionary d['accuracy'] = accuracy, d[metric][average] = score (see ConfusionMatrix.scores)
+    """
+    return ConfusionMatrix(run, qrels).scores()
+
+
 # #### multi topic metrics.
+# They are computed from the indicator matrices of the run (see indicator.IndicatorMatrices);
+# indicators may be an IndicatorMatrices already built for run and qrels.
 
-def precision_multitopic(run, qrels, detailed=False):
+def precision_multitopic(run, qrels, detailed=False, indicators=None):
     """
     Computes the precision of a multitopic classifier.
     :param run:
@@ -59,21 +92,11 @@ def precision_multitopic(run, qrels, detailed=False):
     :return:
     :rtype: float
     """
-    sum_precisions = 0.0
-    count = 0
-    if detailed: all_precisions = {}
-    for instance, entries in run.entries.items():
-        real_classes = set(qrels.allJudgements[instance].keys())
-        predicted_classes = set(clazz for clazz, _, _ in entries)
-        precision = (len(real_classes & predicted_classes) / len(predicted_classes)) if len(
-            predicted_classes) > 0 else 0
-        if detailed: all_precisions[instance] = precision
-        sum_precisions += precision
-        count += 1
-    return (sum_precisions / count, all_precisions) if detailed else sum_precisions / count
+    indicators = indicators if indicators is not None else IndicatorMatrices(run, qrels)
+    return indicators.precision(detailed)
 
 
-def recall_multitopic(run, qrels, detailed=False):
+def recall_multitopic(run, qrels, detailed=False, indicators=None):
     """
     Computes the recall of a multitopic classifier.
     :param run:
@@ -83,20 +106,11 @@ def recall_multitopic(run, qrels, detailed=False):
     :return:
     :rtype: float
     """
-    sum_recalls = 0.0
-    count = 0
-    if detailed: all_recalls = {}
-    for instance, entries in run.entries.items():
-        real_classes = set(qrels.allJudgements[instance].keys())
-        predicted_classes = set(clazz for clazz, _, _ in entries)
-        recall = (len(real_classes & predicted_classes) / len(real_classes))
-        sum_recalls += recall
-        if detailed: all_recalls[instance] = recall
-        count += 1
-    return (sum_recalls / count, all_recalls) if detailed else sum_recalls / count
+    indicators = indicators if indicators is not None else IndicatorMatrices(run, qrels)
+    return indicators.recall(detailed)
 
 
-def accuracy_multitopic(run, qrels, detailed=False):
+def accuracy_multitopic(run, qrels, detailed=False, indicators=None):
     """
     Computes the accuracy of a multitopic classifier.
     :param run:
@@ -106,20 +120,11 @@ def accuracy_multitopic(run, qrels, detailed=False):
     :return:
     :rtype: float
     """
-    sum_accuracies = 0.0
-    count = 0
-    if detailed: all_accuracies = {}
-    for instance, entries in run.entries.items():
-        real_classes = set(qrels.allJudgements[instance].keys())
-        predicted_classes = set(clazz for clazz, _, _ in entries)
-        accuracy = (len(real_classes & predicted_classes) / len(real_classes | predicted_classes))
-        sum_accuracies += accuracy
-        if detailed: all_accuracies[instance] = accuracy
-        count += 1
-    return (sum_accuracies / count, all_accuracies) if detailed else sum_accuracies / count
+    indicators = indicators if indicators is not None else IndicatorMatrices(run, qrels)
+    return indicators.accuracy(detailed)
 
 
-def exact_match_ratio(run, qrels, detailed=False):
+def exact_match_ratio(run, qrels, detailed=False, indicators=None):
     """
     Computes the exact match ration
     :param run:
@@ -129,20 +134,11 @@ def exact_match_ratio(run, qrels, detailed=False):
     :return:
     :rtype: float
     """
-    count_matches = 0.0
-    count = 0
-    if detailed: all_emr = {}
-    for instance, entries in run.entries.items():
-        real_classes = set(qrels.allJudgements[instance].keys())
-        predicted_classes = set(clazz for clazz, _, _ in entries)
-        if real_classes == predicted_classes:
-            count_matches += 1
-            if detailed: all_emr[instance] = 1
-        count += 1
-    return (count_matches / count, all_emr) if detailed else count_matches / count
+    indicators = indicators if indicators is not None else IndicatorMatrices(run, qrels)
+    return indicators.exactMatchRatio(detailed)
 
 
-def retrieval_fscore(run, qrels, detailed=False):
+def retrieval_fscore(run, qrels, detailed=False, indicators=None):
     """
     Computes the retrieval_FScore fore each class.
     :param run:
@@ -152,20 +148,5 @@ def retrieval_fscore(run, qrels, detailed=False):
     :return: a dictionary mapping class -> FScore if detailed, its avg, otherwise.
     :rtype: dict
     """
-    all_classes = qrels.getDocIds()
-    num_byclass = {clazz: 0.0 for clazz in all_classes}
-    denom_byclass = {clazz: 0.0 for clazz in all_classes}
-    for instance, entries in run.entries.items():
-        real_classes = set(qrels.allJudgements[instance].keys())
-        predicted_classes = set(clazz for clazz, _, _ in entries)
-        for clazz in all_classes:
-            if clazz in real_classes and clazz in predicted_classes:
-                num_byclass[clazz] += 1
-            if clazz in real_classes:
-                denom_byclass[clazz] += 1
-            if clazz in predicted_classes:
-                denom_byclass[clazz] += 1
-    result = {clazz: 2 * num_byclass[clazz] / denom_byclass[clazz] for clazz in all_classes}
-    avg = sum(result.values()) / len(result)
-    return (avg, result) if detailed else avg
-
+    indicators = indicators if indicators is not None else IndicatorMatrices(run, qrels)
+    return indicators.retrievalFScore(detailed)
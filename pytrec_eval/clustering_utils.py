@@ -1,15 +1,81 @@
 __author__ = 'alberto'
 
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
 from pytrec_eval import TrecRun
+from pytrec_eval.vocabulary import Vocabulary
+
+
+# Matching of clusterings.
+# Clusters are encoded as lists of (cluster, item) memberships over a shared item vocabulary
+# (see EncodedClusters), so that the sizes of all the non-empty intersections between the
+# clusters of two clusterings are obtained from one sparse product of their cluster x item
+# incidence matrices; pairs of clusters sharing no item are never considered.
+
+
+class EncodedClusters:
+    """Clusters encoded as integers: the i-th membership says that the item itemCodes[i]
+    (a code of itemVocabulary) belongs to the cluster clusterIds[clusterCodes[i]]."""
+
+    def __init__(self, clusterIds, clusterCodes, itemCodes, itemVocabulary):
+        self.clusterIds = clusterIds
+        self.clusterCodes = np.asarray(clusterCodes, dtype=np.int64)
+        self.itemCodes = np.asarray(itemCodes, dtype=np.int64)
+        self.itemVocabulary = itemVocabulary
+        self.sizes = np.bincount(self.clusterCodes, minlength=len(clusterIds))
 
+    @classmethod
+    def fromDict(cls, clusters, itemVocabulary=None):
+        """Encodes a dictionary clusters[cluster_id] = set(items), adding the items to itemVocabulary."""
+        itemVocabulary = Vocabulary() if itemVocabulary is None else itemVocabulary
+        clusterIds = list(clusters)
+        clusterCodes = np.repeat(np.arange(len(clusterIds), dtype=np.int64),
+                                 [len(items) for items in clusters.values()])
+        itemCodes = itemVocabulary.encodeAll([item for items in clusters.values() for item in items])
+        return cls(clusterIds, clusterCodes, itemCodes, itemVocabulary)
 
-def get_clusters(run):
+    @classmethod
+    def fromRun(cls, run, itemVocabulary=None):
+        """Encodes the clusters of a clustering run (see get_clusters), adding the items to itemVocabulary."""
+        itemVocabulary = Vocabulary() if itemVocabulary is None else itemVocabulary
+        items, clusters = [], []
+        for itemId, entries in run.entries.items():
+            items.append(itemId)
+            clusters.append(entries[0][0])
+        clusterVocabulary = Vocabulary()
+        clusterCodes = clusterVocabulary.encodeAll(clusters)
+        return cls(clusterVocabulary.strings, clusterCodes, itemVocabulary.encodeAll(items), itemVocabulary)
+
+    def withVocabulary(self, itemVocabulary):
+        """Returns the same clusters with the items encoded through itemVocabulary."""
+        if itemVocabulary is self.itemVocabulary: return self
+        translation = np.array(itemVocabulary.encodeAll(self.itemVocabulary.strings), dtype=np.int64)
+        return EncodedClusters(self.clusterIds, self.clusterCodes, translation[self.itemCodes], itemVocabulary)
+
+    def incidence(self, nItems):
+        """Returns the clusters x items incidence matrix (scipy.sparse CSR)."""
+        return sparse.csr_matrix((np.ones(len(self.itemCodes), dtype=np.int64), (self.clusterCodes, self.itemCodes)),
+                                 shape=(len(self.clusterIds), nItems))
+
+    def toDict(self):
+        """Returns the dictionary clusters[cluster_id] = set(items)."""
+        clusters = {clusterId: set() for clusterId in self.clusterIds}
+        for clusterCode, itemCode in zip(self.clusterCodes.tolist(), self.itemCodes.tolist()):
+            clusters[self.clusterIds[clusterCode]].add(self.itemVocabulary.decode(itemCode))
+        return clusters
+
+
+def get_clusters(run, encoded=False):
     """
     get all clusters in run
     :param run:
     :type run: TrecRun
-    :return:
+    :param encoded: if True returns an EncodedClusters
+    :return: a dictionary clusters[cluster_id] = set(items)
     """
+    if encoded: return EncodedClusters.fromRun(run)
     clusters = {}
     for item_id, cluster_rnk in run.entries.items():
         cluster_id = cluster_rnk[0][0]
@@ -45,22 +111,87 @@ def max_jaccard(cluster, clusters):
     """
     return max([(jaccard_index(cluster, j), cluster_id)
                 for cluster_id, j in clusters.items()],
-               key=lambda x: x[1])
+               key=lambda x: x[0])
 
 
-def jaccard_map(clusters0, clusters1):
+def _encodePair(clusters0, clusters1):
+    if not isinstance(clusters0, EncodedClusters): clusters0 = EncodedClusters.fromDict(clusters0)
+    if isinstance(clusters1, EncodedClusters):
+        clusters1 = clusters1.withVocabulary(clusters0.itemVocabulary)
+    else:
+        clusters1 = EncodedClusters.fromDict(clusters1, clusters0.itemVocabulary)
+    return clusters0, clusters1
+
+
+def jaccard_matrix(clusters0, clusters1):
+    """
+    Computes the Jaccard index of all the pairs of clusters sharing at least one item.
+    :param clusters0: a dictionary clusters[cluster_id] = set(items) or an EncodedClusters
+    :param clusters1: a dictionary clusters[cluster_id] = set(items) or an EncodedClusters
+    :return: a triple (clusters0, clusters1, jaccard) where clusters0 and clusters1 are
+    EncodedClusters and jaccard is a scipy.sparse CSR matrix (clusters0 x clusters1).
+    """
+    clusters0, clusters1 = _encodePair(clusters0, clusters1)
+    nItems = len(clusters0.itemVocabulary)
+    intersections = (clusters0.incidence(nItems) @ clusters1.incidence(nItems).T).tocoo()
+    rows, columns = intersections.row, intersections.col
+    unions = clusters0.sizes[rows] + clusters1.sizes[columns] - intersections.data
+    jaccard = sparse.csr_matrix((intersections.data / unions, (rows, columns)),
+                                shape=(len(clusters0.clusterIds), len(clusters1.clusterIds)))
+    return clusters0, clusters1, jaccard
+
+
+def _bestMatches(jaccard):
+    """Returns, for each row, the column of the maximum (the first one in case of ties; 0 for empty rows)
+    and the maximum (0 for empty rows)."""
+    coo = jaccard.tocoo()
+    order = np.lexsort((coo.col, -coo.data, coo.row))
+    rows = coo.row[order]
+    first = order[np.r_[True, rows[1:] != rows[:-1]]] if len(order) else order
+    columns = np.zeros(jaccard.shape[0], dtype=np.int64)
+    scores = np.zeros(jaccard.shape[0], dtype=np.float64)
+    columns[coo.row[first]] = coo.col[first]
+    scores[coo.row[first]] = coo.data[first]
+    return columns, scores
+
+
+def _oneToOneMatches(jaccard):
+    """Returns, for each row, the column assigned to it by the one-to-one matching maximizing the
+    sum of the Jaccard indexes (-1 if the row is not matched) and the Jaccard index of the pair."""
+    nRows, nColumns = jaccard.shape
+    if nRows == 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    # a dummy column per row, with the cost of a pair sharing no item, makes a full matching exist
+    costs = sparse.hstack([jaccard.copy(), sparse.csr_matrix((nRows, nRows))], format='csr')
+    costs.data = 2 - costs.data
+    costs = costs + sparse.csr_matrix((np.full(nRows, 2.0), (np.arange(nRows), nColumns + np.arange(nRows))),
+                                      shape=costs.shape)
+    rows, columns = min_weight_full_bipartite_matching(costs)
+    matched = columns < nColumns
+    assignment = np.full(nRows, -1, dtype=np.int64)
+    assignment[rows[matched]] = columns[matched]
+    scores = np.zeros(nRows, dtype=np.float64)
+    scores[rows[matched]] = np.asarray(jaccard[rows[matched], columns[matched]]).ravel()
+    return assignment, scores
+
+
+def jaccard_map(clusters0, clusters1, one_to_one=False):
     """
     Creates a map between clusters in <clusters0>
     and clusters in <clusters1> based on the Jaccard similarity.
-    :param clusters0:
+    :param clusters0: a dictionary clusters[cluster_id] = set(items) or an EncodedClusters
     :type clusters0: dict
-    :param clusters1:
+    :param clusters1: a dictionary clusters[cluster_id] = set(items) or an EncodedClusters
     :type clusters1: dict
-    :return:
+    :param one_to_one: if True each cluster in <clusters1> is mapped to at most one cluster
+    in <clusters0> (the matching maximizes the sum of the Jaccard indexes); clusters that are
+    not matched are mapped to (None, 0.0)
+    :return: a dictionary m[cluster_id0] = (cluster_id1, jaccard_index). Each cluster is mapped
+    to the most similar cluster in <clusters1> (the first one in case of ties, as max_jaccard).
     """
-    m = {}
-    for c0, items0 in clusters0.items():
-        score, best_map = max_jaccard(items0, clusters1)
-        m[c0] = (best_map, score)
-    return m
-
+    clusters0, clusters1, jaccard = jaccard_matrix(clusters0, clusters1)
+    if not clusters1.clusterIds and clusters0.clusterIds:
+        raise ValueError('No clusters to map to')
+    columns, scores = _oneToOneMatches(jaccard) if one_to_one else _bestMatches(jaccard)
+    clusterIds1 = clusters1.clusterIds
+    return {c0: (clusterIds1[c1] if c1 >= 0 else None, score)
+            for c0, c1, score in zip(clusters0.clusterIds, columns.tolist(), scores.tolist())}
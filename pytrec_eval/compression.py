@@ -0,0 +1,187 @@
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+
+__author__ = 'alberto'
+
+
+# Transparent reading and writing of compressed runs and qrels.
+# The compression format is chosen by the extension of the file name (.gz, .bz2, .xz, .zst)
+# or, when reading files without such an extension, by their magic bytes. Compressed files
+# are decompressed while they are read: by default a background thread decompresses the
+# next READ_AHEAD chunks of CHUNK_SIZE bytes while the caller parses the current one
+# (zlib, bz2, lzma and zstandard release the GIL while decompressing). Symmetrically, files
+# being written are compressed by a background thread, at most WRITE_BEHIND chunks behind
+# the caller.
+# Zstandard support requires the zstandard package.
+
+SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+
+MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+CHUNK_SIZE = 1 << 20
+
+READ_AHEAD = 4
+
+WRITE_BEHIND = 4
+
+
+def compressionOf(fileName, sniff=True):
+    """Returns the compression format of fileName ('gzip', 'bz2', 'xz', 'zstd') or None if it is not compressed.
+    The format is given by the extension of fileName or, if sniff is True, by the first bytes of the file."""
+    for suffix, compression in SUFFIXES.items():
+        if fileName.endswith(suffix): return compression
+    if not sniff: return None
+    with open(fileName, 'rb') as f:
+        head = f.read(6)
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic): return compression
+    return None
+
+
+def stripSuffix(fileName):
+    """Returns fileName without its compression extension (if any)."""
+    for suffix in SUFFIXES:
+        if fileName.endswith(suffix): return fileName[:-len(suffix)]
+    return fileName
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading or writing .zst files requires the zstandard package')
+    return zstandard
+
+
+def _openBinary(fileName, mode, compression):
+    if compression == 'gzip': return gzip.open(fileName, mode)
+    if compression == 'bz2': return bz2.open(fileName, mode)
+    if compression == 'xz': return lzma.open(fileName, mode)
+    if compression == 'zstd':
+        zstandard = _zstandard()
+        f = open(fileName, mode)
+        try:
+            if mode == 'rb':
+                return zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+            return zstandard.ZstdCompressor().stream_writer(f, closefd=True)
+        except BaseException:
+            f.close()
+            raise
+    raise ValueError('Unknown compression ' + str(compression))
+
+
+class _BackgroundReader(io.RawIOBase):
+    """Read-only binary stream whose chunks are read from stream by a background thread,
+    at most READ_AHEAD chunks ahead of the consumer."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = queue.Queue(READ_AHEAD)
+        self._chunk = memoryview(b'')
+        self._stopped = False
+        self._eof = False
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while not self._stopped:
+                chunk = self._stream.read(CHUNK_SIZE)
+                self._put(chunk)
+                if not chunk: return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped:
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self._chunk) == 0:
+            if self._eof: return 0
+            chunk = self._chunks.get()
+            if isinstance(chunk, BaseException): raise chunk
+            if not chunk: self._eof = True
+            self._chunk = memoryview(chunk)
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped = True
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+
+class _BackgroundWriter(io.RawIOBase):
+    """Write-only binary stream whose chunks are written to stream by a background thread,
+    at most WRITE_BEHIND chunks behind the producer."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = queue.Queue(WRITE_BEHIND)
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None: return
+            if self._error is not None: continue
+            try:
+                self._stream.write(chunk)
+            except BaseException as e:
+                self._error = e
+
+    def _raiseError(self):
+        if self._error is not None: raise self._error
+
+    def writable(self):
+        return True
+
+    def write(self, buffer):
+        self._raiseError()
+        self._chunks.put(bytes(buffer))
+        return len(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._chunks.put(None)
+            self._thread.join()
+            self._stream.close()
+            super().close()
+            self._raiseError()
+        super().close()
+
+
+def openFile(fileName, mode='r', compression='auto', background=True):
+    """Opens a (possibly compressed) text file encoded in UTF-8; mode is 'r' or 'w'.
+    If compression is 'auto' the format is given by compressionOf (by the extension only when
+    writing); otherwise it is one of 'gzip', 'bz2', 'xz', 'zstd' or None (no compression).
+    If background is True compressed files are (de)compressed by a background thread.
+    fileName may also be a text stream open for reading, which is returned as is."""
+    if mode not in ('r', 'w'): raise ValueError('Unsupported mode ' + mode)
+    if mode == 'r' and hasattr(fileName, 'read'): return fileName
+    if compression == 'auto': compression = compressionOf(fileName, sniff=mode == 'r')
+    if compression is None: return open(fileName, mode, encoding='utf-8')
+    stream = _openBinary(fileName, mode + 'b', compression)
+    if mode == 'r':
+        stream = io.BufferedReader(_BackgroundReader(stream) if background else stream, CHUNK_SIZE)
+    elif background:
+        stream = io.BufferedWriter(_BackgroundWriter(stream), CHUNK_SIZE)
+    return io.TextIOWrapper(stream, encoding='utf-8')
@@ -0,0 +1,73 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pytrec_eval.trecrun import TrecRun
+
+__author__ = 'alberto'
+
+
+# Concurrent loading and writing of many runs.
+# Runs are parsed by a pool of threads, so that the reads of some files (which release the
+# GIL, as decompression does) overlap the parsing of others. Loading is driven by the
+# consumer: at most maxInFlight files are being parsed or parsed and not yet consumed, and no
+# new file is started while those files take more than maxBytes on disk (one file is always
+# allowed), so that memory stays bounded when runs are processed one at a time (e.g., evaluated
+# and dropped). Note that compressed files take several times their size once parsed.
+# Runs are written by threads as well, each run formatted a whole topic at a time (see
+# TrecRun.write).
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def _load(run, runKwargs):
+    return TrecRun(run, **runKwargs) if type(run) == str else run
+
+
+def _sizeOf(run):
+    return os.path.getsize(run) if type(run) == str else 0
+
+
+def iterRuns(runs, maxInFlight=4, maxBytes=DEFAULT_MAX_BYTES, **runKwargs):
+    """Yields the runs in runs (names of run files, parsed with runKwargs, or TrecRun s, yielded as they are)
+    in the same order, parsing up to maxInFlight files concurrently, ahead of the consumer, as long as
+    the files parsed and not yet consumed take at most maxBytes on disk."""
+    runs = list(runs)
+    maxInFlight = max(1, maxInFlight)
+    pending = deque()  # (future, size) of the files being parsed or not yet consumed
+    pendingBytes = 0
+    nextRun = 0
+    with ThreadPoolExecutor(max_workers=maxInFlight) as executor:
+
+        def submit():
+            nonlocal pendingBytes, nextRun
+            while nextRun < len(runs) and len(pending) < maxInFlight:
+                size = _sizeOf(runs[nextRun])
+                if pending and pendingBytes + size > maxBytes: return
+                pending.append((executor.submit(_load, runs[nextRun], runKwargs), size))
+                pendingBytes += size
+                nextRun += 1
+
+        try:
+            submit()
+            while pending:
+                future, size = pending.popleft()
+                run = future.result()
+                pendingBytes -= size
+                # the next files are parsed while the consumer processes run
+                submit()
+                yield run
+        finally:
+            for future, _ in pending: future.cancel()
+
+
+def writeRuns(runs, fileNames, threads=4):
+    """Writes each run in runs into the file with the same index in fileNames (compressed according to
+    its extension, see pytrec_eval.compression), writing up to threads files concurrently."""
+    fileNames = list(fileNames)
+    if threads <= 1:
+        for run, fileName in zip(runs, fileNames): run.write(fileName)
+        return
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(run.write, fileName) for run, fileName in zip(runs, fileNames)]:
+            future.result()
@@ -0,0 +1,124 @@
+import numpy as np
+import scipy.sparse as sparse
+
+from pytrec_eval.contingency import DENSE_CELLS
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Confusion-matrix engine for the (single-label) classification metrics.
+# A classification run has one entry per test instance (topic) whose docId is the predicted
+# class; the real class of the instance is its judged document in the qrels. Classes are
+# integer-encoded once, in sorted order (the order of the rows of confusion_matrix), and the
+# predicted x real counts are computed by a single bincount (a scipy.sparse matrix when there
+# are more than DENSE_CELLS cells). Precision, recall and F-scores of all the classes are
+# derived from the diagonal and the marginals, which are counted directly from the codes.
+# Macro averages are summed in class order, as the original metrics do, and give exactly
+# the same results; classes never predicted (or never real) get a precision (recall) of 0.
+
+AVERAGES = ('macro', 'micro', 'weighted')
+
+
+class ConfusionMatrix:
+    """Predicted x real class counts of the instances of a classification run that have an entry.
+    Classes are all the classes judged in the qrels or predicted in the run, sorted."""
+
+    def __init__(self, run, qrels):
+        predicted, real = [], []
+        judgements = qrels.allJudgements
+        for instance, entries in run.entries.items():
+            if not entries: continue
+            if len(entries) != 1 or len(judgements[instance]) != 1:
+                raise ValueError('Instance ' + str(instance) + ' has more than one class '
+                                 '(use the multi topic metrics)')
+            predicted.append(entries[0][0])
+            real.append(next(iter(judgements[instance])))
+        classes = set(docId for docsRelevance in judgements.values() for docId in docsRelevance)
+        classes.update(predicted)
+        self.classIds = sorted(classes)
+        vocabulary = Vocabulary.fromList(self.classIds)
+        self.nItems = len(predicted)
+        nClasses = len(self.classIds)
+        self.predictedCodes = np.array(vocabulary.encodeAll(predicted), dtype=np.int64)
+        self.realCodes = np.array(vocabulary.encodeAll(real), dtype=np.int64)
+        # tp[c]: instances of class c predicted as c; predictedCounts (realCounts)[c]: instances predicted as (of) c
+        correct = self.predictedCodes == self.realCodes
+        self.tp = np.bincount(self.predictedCodes[correct], minlength=nClasses)
+        self.predictedCounts = np.bincount(self.predictedCodes, minlength=nClasses)
+        self.realCounts = np.bincount(self.realCodes, minlength=nClasses)
+        self._matrix = None
+
+    def matrix(self):
+        """Returns the predicted x real matrix of the counts: a NumPy array, or a scipy.sparse CSR
+        matrix if it has more than DENSE_CELLS cells."""
+        if self._matrix is None:
+            n = len(self.classIds)
+            if n * n > DENSE_CELLS:
+                self._matrix = sparse.csr_matrix((np.ones(self.nItems, dtype=np.int64),
+                                                  (self.predictedCodes, self.realCodes)), shape=(n, n))
+            else:
+                self._matrix = np.bincount(self.predictedCodes * n + self.realCodes,
+                                           minlength=n * n).reshape(n, n)
+        return self._matrix
+
+    def toDict(self):
+        """Returns the 2d-dictionary cm[predicted][real] = count (see confusion_matrix)."""
+        cm = {predicted: dict.fromkeys(self.classIds, 0) for predicted in self.classIds}
+        cells = sparse.coo_matrix(self.matrix())
+        for p, r, count in zip(cells.row.tolist(), cells.col.tolist(), cells.data.tolist()):
+            cm[self.classIds[p]][self.classIds[r]] = count
+        return cm
+
+    def precisions(self):
+        """Returns the precision of each class (0 for classes never predicted)."""
+        return _ratios(self.tp, self.predictedCounts)
+
+    def recalls(self):
+        """Returns the recall of each class (0 for classes of no instance)."""
+        return _ratios(self.tp, self.realCounts)
+
+    def fScores(self, beta=1):
+        """Returns the F-beta score of each class (0 for classes never predicted and of no instance)."""
+        b2 = beta * beta
+        return _ratios((1 + b2) * self.tp, b2 * self.realCounts + self.predictedCounts)
+
+    def accuracy(self):
+        return int(self.tp.sum()) / self.nItems
+
+    def _average(self, values, average):
+        if average == 'macro':
+            return sum(values.tolist()) / len(values)
+        if average == 'weighted':
+            return float(np.dot(values, self.realCounts)) / self.nItems
+        raise ValueError('Unknown average ' + str(average) + ', expected one of ' + ', '.join(AVERAGES))
+
+    def precision(self, average='macro'):
+        # in single-label classification micro-averaged precision, recall and F-scores equal the accuracy
+        return self.accuracy() if average == 'micro' else self._average(self.precisions(), average)
+
+    def recall(self, average='macro'):
+        return self.accuracy() if average == 'micro' else self._average(self.recalls(), average)
+
+    def fScore(self, beta=1, average='macro'):
+        return self.accuracy() if average == 'micro' else self._average(self.fScores(beta), average)
+
+    def perClass(self, values):
+        """Returns the dictionary d[classId] = values[code of classId]."""
+        return dict(zip(self.classIds, values.tolist()))
+
+    def scores(self):
+        """Returns a dictionary with the accuracy and the macro, micro and weighted averages of
+        precision, recall and F1: scores['accuracy'], scores['precision']['macro'], ..."""
+        result = {'accuracy': self.accuracy()}
+        for name, values in (('precision', self.precisions()), ('recall', self.recalls()),
+                             ('f1', self.fScores())):
+            result[name] = {average: self.accuracy() if average == 'micro' else self._average(values, average)
+                            for average in AVERAGES}
+        return result
+
+
+def _ratios(numerators, denominators):
+    result = np.zeros(len(numerators), dtype=np.float64)
+    np.divide(numerators, denominators, out=result, where=denominators > 0)
+    return result
@@ -0,0 +1,117 @@
+import math
+
+import numpy as np
+import scipy.sparse as sparse
+
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Contingency-table engine for the clustering metrics.
+# A clustering run has one entry per item (topic) whose docId is the cluster of the item;
+# the class of the item is its relevant document in the qrels. Clusters and classes are
+# encoded as integers and the cluster x class counts are computed once, as the list of the
+# non-zero cells; every metric is then derived from the cells and the marginals, so that
+# pair-based metrics need no loop over the pairs of items:
+#   same cluster and same class      tp = sum_cells C(n_kj, 2)
+#   same cluster                     tp + fp = sum_k C(n_k, 2)
+#   same class                       tp + fn = sum_j C(n_j, 2)
+# Clusters are numbered in sorted order and classes in order of first appearance when items
+# are visited cluster by cluster, so that sums are performed in the same order as the
+# original metrics and give exactly the same results.
+
+# above this number of cells matrix() returns a scipy.sparse matrix
+DENSE_CELLS = 1 << 22
+
+
+def _pairs(n):
+    return n * (n - 1) // 2
+
+
+class ContingencyTable:
+    """Cluster x class counts of the items of a clustering run that have an entry."""
+
+    def __init__(self, run, qrels):
+        clusters, classes = [], []
+        for itemId, entries in run.entries.items():
+            if not entries: continue
+            clusters.append(entries[0][0])
+            classes.append(qrels.getAllRelevants(itemId).pop())
+        self.nItems = len(clusters)
+        self.clusterIds = sorted(set(clusters))
+        clusterCodes = Vocabulary.fromList(self.clusterIds).encodeAll(clusters)
+        order = np.argsort(np.array(clusterCodes, dtype=np.int64), kind='stable')
+        classVocabulary = Vocabulary()
+        classCodes = np.empty(self.nItems, dtype=np.int64)
+        classCodes[order] = classVocabulary.encodeAll([classes[i] for i in order])
+        self.classIds = classVocabulary.strings
+        nClasses = len(self.classIds)
+
+        # cells in row-major order, with the position (in the cluster by cluster visit) of their first item
+        cellCodes = np.array(clusterCodes, dtype=np.int64)[order] * nClasses + classCodes[order]
+        cellCodes, self.cellFirst, self.cellCounts = np.unique(cellCodes, return_index=True, return_counts=True)
+        self.cellClusters, self.cellClasses = np.divmod(cellCodes, max(nClasses, 1))
+        self.clusterSizes = np.bincount(self.cellClusters, self.cellCounts, len(self.clusterIds)).astype(np.int64)
+        self.classSizes = np.bincount(self.cellClasses, self.cellCounts, nClasses).astype(np.int64)
+
+    def matrix(self):
+        """Returns the clusters x classes matrix of the counts: a NumPy array, or a scipy.sparse CSR
+        matrix if it has more than DENSE_CELLS cells."""
+        shape = (len(self.clusterIds), len(self.classIds))
+        if shape[0] * shape[1] > DENSE_CELLS:
+            return sparse.csr_matrix((self.cellCounts, (self.cellClusters, self.cellClasses)), shape=shape)
+        counts = np.zeros(shape, dtype=np.int64)
+        counts[self.cellClusters, self.cellClasses] = self.cellCounts
+        return counts
+
+    def majorityClasses(self):
+        """Returns a dictionary majority[clusterId] = (classId, count) with the most common class of each
+        cluster (ties are broken in favour of the class appearing first in the cluster)."""
+        order = np.lexsort((self.cellFirst, -self.cellCounts, self.cellClusters))
+        first = order[np.r_[True, self.cellClusters[order][1:] != self.cellClusters[order][:-1]]] \
+            if len(order) else order
+        return {self.clusterIds[k]: (self.classIds[j], n) for k, j, n in
+                zip(self.cellClusters[first].tolist(), self.cellClasses[first].tolist(),
+                    self.cellCounts[first].tolist())}
+
+    def purity(self):
+        return sum(n for _, n in self.majorityClasses().values()) / self.nItems
+
+    def nmi(self):
+        """Normalized mutual information between clusters and classes."""
+        N = self.nItems
+        clusterSizes, classSizes = self.clusterSizes.tolist(), self.classSizes.tolist()
+        I = sum(n / N * math.log((N * n) / (clusterSizes[k] * classSizes[j]))
+                for k, j, n in zip(self.cellClusters.tolist(), self.cellClasses.tolist(), self.cellCounts.tolist()))
+        h_omega = - sum(n / N * math.log(n / N) for n in clusterSizes)
+        h_c = - sum(n / N * math.log(n / N) for n in classSizes)
+        return I / ((h_c + h_omega) / 2)
+
+    def pairCounts(self):
+        """Returns (tp, tn, fp, fn): the number of pairs of items in the same cluster and class,
+        in different clusters and classes, in the same cluster only and in the same class only."""
+        tp = int(_pairs(self.cellCounts).sum())
+        sameCluster = int(_pairs(self.clusterSizes).sum())
+        sameClass = int(_pairs(self.classSizes).sum())
+        fp, fn = sameCluster - tp, sameClass - tp
+        return tp, _pairs(self.nItems) - tp - fp - fn, fp, fn
+
+    def randIndex(self):
+        tp, tn, fp, fn = self.pairCounts()
+        return (tp + tn) / (tp + tn + fp + fn)
+
+    def adjustedRandIndex(self):
+        """Rand index adjusted for chance (Hubert and Arabie)."""
+        tp, tn, fp, fn = self.pairCounts()
+        sameCluster, sameClass = tp + fp, tp + fn
+        expected = sameCluster * sameClass / (tp + tn + fp + fn)
+        maximum = (sameCluster + sameClass) / 2
+        return (tp - expected) / (maximum - expected)
+
+    def fScore(self, beta):
+        """F-beta score of the pairs of items in the same cluster with respect to the pairs in the same class."""
+        tp, tn, fp, fn = self.pairCounts()
+        p = tp / (tp + fp)
+        r = tp / (tp + fn)
+        return ((beta * beta + 1) * p * r) / (beta * beta * p + r)
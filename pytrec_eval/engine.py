@@ -0,0 +1,308 @@
+import numbers
+
+import numpy as np
+
+from pytrec_eval.instrumentation import instrumented
+
+__author__ = 'alberto'
+
+
+# Vectorized evaluation engine.
+# A run is joined against the qrels only once (see JoinedRun); the built-in metrics
+# are then computed by kernels working on the per-topic relevance arrays with NumPy
+# cumulative sums and segment reductions.
+# A kernel is a function k(joinedRun, detailed=False) that returns exactly what the
+# corresponding metric in pytrec_eval.metrics returns; metrics expose their kernel
+# through the attribute "kernel", which pytrec_eval.evaluate uses when available.
+# A details kernel is a function d(joinedRun) returning a pair (details, denominator):
+# the per-topic scores and the number their sum is divided by to obtain the aggregated
+# score. Denominators of disjoint sets of topics add up, so that a run can be evaluated
+# a few topics at a time; metrics expose it through the attribute "detailsKernel".
+# Details kernels declare the order of the topics of their details in the attribute
+# "detailsOrder": 'qrels' (the topics of the qrels, in order) or 'run' (the topics of the run,
+# in order); the one of cutoffDetails is a dictionary indexed by kind.
+
+
+# maximum number of cells of the matrices used by JoinedRun.cumulativeAt
+CUMULATIVE_BLOCK = 1 << 22
+
+
+def _segmentSums(values, offsets):
+    """Returns the sums of values[offsets[i]:offsets[i + 1]] for each segment i."""
+    sums = np.zeros(len(offsets) - 1, dtype=np.float64)
+    nonEmpty = offsets[1:] > offsets[:-1]
+    if nonEmpty.any():
+        sums[nonEmpty] = np.add.reduceat(values, offsets[:-1][nonEmpty])
+    return sums
+
+
+def _spansToPositions(starts, lengths):
+    """Returns the concatenation of arange(starts[i], starts[i] + lengths[i]) for all i."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1] - starts, lengths)
+
+
+class JoinedRun:
+    """Result of joining a run against the qrels.
+    The entries of all topics of the run are stored contiguously (in the order of run.entries):
+    the entries of the i-th topic are at positions offsets[i]:offsets[i + 1] of gains (the
+    relevance score of each entry, 0 if not judged), relevant and ranks."""
+
+    @instrumented('JoinedRun', lambda self, *args: len(self.gains))
+    def __init__(self, run, qrels):
+        self.topicIds = list(run.entries.keys())
+        self.rows = {topicId: row for row, topicId in enumerate(self.topicIds)}
+        if run.columnar:
+            self._joinColumnar(run, qrels)
+        else:
+            self._joinDict(run, qrels)
+        self.lengths = np.diff(self.offsets)
+        self.relevant = self.gains >= 1
+        # ranks start from 1 within each topic
+        self.ranks = np.arange(1, len(self.gains) + 1, dtype=np.int64) - np.repeat(self.offsets[:-1], self.lengths)
+        cumRelevant = np.zeros(len(self.gains) + 1, dtype=np.int64)
+        np.cumsum(self.relevant, out=cumRelevant[1:])
+        # cumRelevant[j] = number of relevant entries in the topic of entry j up to the rank of j
+        self.cumRelevant = cumRelevant[1:] - np.repeat(cumRelevant[self.offsets[:-1]], self.lengths)
+        self.nRelevantRetrieved = cumRelevant[self.offsets[1:]] - cumRelevant[self.offsets[:-1]]
+
+        self.qrelsTopicIds = list(qrels.allJudgements.keys())
+        self.nQrelsTopics = qrels.getNTopics()
+        # number of relevant documents per qrels topic and per run topic
+        self.qrelsNRelevant = np.array([qrels.getNRelevant(topicId) for topicId in self.qrelsTopicIds],
+                                       dtype=np.int64)
+        nRelevantByTopic = dict(zip(self.qrelsTopicIds, self.qrelsNRelevant.tolist()))
+        self.nRelevant = np.array([nRelevantByTopic.get(topicId, 0) for topicId in self.topicIds], dtype=np.int64)
+        # values derived from the join, shared by the kernels (see derived)
+        self.cache = {}
+
+    def derived(self, key, compute):
+        """Returns cache[key], computing it as compute() the first time."""
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def topicRows(self):
+        """Returns the index of the topic of each entry."""
+        return self.derived('topicRows', lambda: np.repeat(np.arange(len(self.topicIds)), self.lengths))
+
+    def discounts(self):
+        """Returns the DCG discount of each entry: 1 at rank 1, log_2(rank) otherwise."""
+        return self.derived('discounts', lambda: np.log2(np.maximum(self.ranks, 2)))
+
+    def idealGains(self):
+        """Returns the gains of the entries of each topic sorted in descending order."""
+        return self.derived('idealGains', lambda: self.gains[np.lexsort((-self.gains, self.topicRows()))])
+
+    def cumulativeAt(self, values, cutoffs):
+        """Returns the matrix (topics x cutoffs) of the sums of values over the entries of each topic
+        up to each cutoff (a sorted array of ranks). The sums of each topic are accumulated in rank
+        order, a block of topics at a time."""
+        result = np.zeros((len(self.topicIds), len(cutoffs)), dtype=np.float64)
+        if len(values) == 0: return result
+        maxLength = int(self.lengths.max())
+        columns = np.minimum(cutoffs, maxLength) - 1
+        blockRows = max(1, CUMULATIVE_BLOCK // maxLength)
+        topicRows = self.topicRows()
+        for first in range(0, len(self.topicIds), blockRows):
+            last = min(first + blockRows, len(self.topicIds))
+            start, end = self.offsets[first], self.offsets[last]
+            block = np.zeros((last - first, maxLength), dtype=np.float64)
+            block[topicRows[start:end] - first, self.ranks[start:end] - 1] = values[start:end]
+            np.cumsum(block, axis=1, out=block)
+            result[first:last] = block[:, columns]
+        return result
+
+    def _joinDict(self, run, qrels):
+        gains = []
+        lengths = []
+        for topicId, entryList in run.entries.items():
+            judgements = qrels.allJudgements.get(topicId)
+            if judgements:
+                gains.extend([judgements.get(docId, 0) for docId, _, _ in entryList])
+            else:
+                gains.extend([0] * len(entryList))
+            lengths.append(len(entryList))
+        self.gains = np.array(gains, dtype=np.float64)
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+
+    def _joinColumnar(self, run, qrels):
+        columns = run.entries
+        spans = np.array([columns.span(topicId) for topicId in self.topicIds], dtype=np.int64).reshape(-1, 2)
+        lengths = spans[:, 1] - spans[:, 0]
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        docCodes = columns.docCodes[_spansToPositions(spans[:, 0], lengths)].astype(np.int64)
+        shared = qrels.vocabulary is not None and columns.docVocabulary is qrels.vocabulary
+        # encoding the judgements may add docIDs to the vocabulary, hence it precedes its size
+        if shared: qrels.judgementCodes()
+        # join on keys row * |vocabulary| + docCode
+        vocabularySize = max(len(columns.docVocabulary), 1)
+        keys = np.repeat(np.arange(len(self.topicIds), dtype=np.int64), lengths) * vocabularySize + docCodes
+        if shared:
+            judgedKeys, judgedGains = self._judgedKeysShared(qrels, vocabularySize)
+        else:
+            judgedKeys, judgedGains = self._judgedKeys(columns, qrels, vocabularySize)
+        self.gains = np.zeros(len(keys), dtype=np.float64)
+        if len(judgedKeys):
+            judgedKeys = np.asarray(judgedKeys, dtype=np.int64)
+            judgedGains = np.asarray(judgedGains, dtype=np.float64)
+            order = np.argsort(judgedKeys)
+            judgedKeys, judgedGains = judgedKeys[order], judgedGains[order]
+            positions = np.minimum(np.searchsorted(judgedKeys, keys), len(judgedKeys) - 1)
+            found = judgedKeys[positions] == keys
+            self.gains[found] = judgedGains[positions[found]]
+
+    def _judgedKeys(self, columns, qrels, vocabularySize):
+        judgedKeys, judgedGains = [], []
+        for row, topicId in enumerate(self.topicIds):
+            judgements = qrels.allJudgements.get(topicId)
+            if not judgements: continue
+            for docId, relevanceScore in judgements.items():
+                code = columns.docVocabulary.lookup(docId)
+                if code >= 0:
+                    judgedKeys.append(row * vocabularySize + code)
+                    judgedGains.append(relevanceScore)
+        return judgedKeys, judgedGains
+
+    def _judgedKeysShared(self, qrels, vocabularySize):
+        # the run and the qrels share the vocabulary: the judgements are already encoded (see QRels.judgementCodes)
+        qrelsRows, qrelsOffsets, docCodes, relevanceScores = qrels.judgementCodes()
+        qrelsRows = np.array([qrelsRows.get(topicId, -1) for topicId in self.topicIds], dtype=np.int64)
+        judged = np.flatnonzero(qrelsRows >= 0)
+        starts = qrelsOffsets[qrelsRows[judged]]
+        lengths = qrelsOffsets[qrelsRows[judged] + 1] - starts
+        positions = _spansToPositions(starts, lengths)
+        return np.repeat(judged, lengths) * vocabularySize + docCodes[positions], relevanceScores[positions]
+
+
+def _kernel(detailsKernel):
+    """Returns the kernel aggregating the per-topic scores computed by detailsKernel."""
+
+    def kernel(joined, detailed=False, **kwargs):
+        details, denominator = detailsKernel(joined, **kwargs)
+        avg = sum(details.values()) / denominator
+        return avg if not detailed else (avg, details)
+
+    kernel.__doc__ = detailsKernel.__doc__
+    return kernel
+
+
+def precisionDetails(joined):
+    """Vectorized pytrec_eval.precision"""
+    precisions = (joined.nRelevantRetrieved / np.maximum(joined.lengths, 1)).tolist()
+    details = {topicId: precisions[joined.rows[topicId]] if topicId in joined.rows else 0
+               for topicId in joined.qrelsTopicIds}
+    return details, joined.nQrelsTopics
+
+
+def recallDetails(joined):
+    """Vectorized pytrec_eval.recall"""
+    return _recallDetails(joined, joined.nRelevantRetrieved)
+
+
+def _recallDetails(joined, nRelevantRetrieved):
+    nRelevantRetrieved = nRelevantRetrieved.tolist()
+    details = {}
+    nTopicsWRelevant = 0
+    for topicId, numRelevant in zip(joined.qrelsTopicIds, joined.qrelsNRelevant.tolist()):
+        if topicId in joined.rows:
+            if numRelevant > 0:
+                details[topicId] = nRelevantRetrieved[joined.rows[topicId]] / numRelevant
+                nTopicsWRelevant += 1
+        else:
+            details[topicId] = 0
+            if numRelevant > 0: nTopicsWRelevant += 1
+    return details, nTopicsWRelevant
+
+
+def avgPrecDetails(joined):
+    """Vectorized pytrec_eval.avgPrec"""
+    precisions = np.where(joined.relevant, joined.cumRelevant / joined.ranks, 0)
+    sumPrec = _segmentSums(precisions, joined.offsets)
+    aps = np.where(joined.nRelevant > 0, sumPrec / np.maximum(joined.nRelevant, 1), 0).tolist()
+    return dict(zip(joined.topicIds, aps)), joined.nQrelsTopics
+
+
+def precisionAtDetails(joined, rank=10):
+    """Vectorized pytrec_eval.precisionAt(rank)"""
+    topRelevant = _segmentSums((joined.relevant & (joined.ranks <= rank)).astype(np.float64), joined.offsets)
+    precisions = (topRelevant / rank).tolist()
+    return dict(zip(joined.topicIds, precisions)), joined.nQrelsTopics
+
+
+def ndcgDetails(joined):
+    """Vectorized pytrec_eval.ndcg"""
+    dcg = _segmentSums(joined.gains / joined.discounts(), joined.offsets)
+    idcg = _segmentSums(joined.idealGains() / joined.discounts(), joined.offsets)
+    return dict(zip(joined.topicIds, _ratios(dcg, idcg).tolist())), joined.nQrelsTopics
+
+
+def _ratios(numerators, denominators):
+    """numerators / denominators, 0 where denominators are 0."""
+    return np.where(denominators != 0, numerators / np.where(denominators != 0, denominators, 1), 0)
+
+
+class CutoffFamily:
+    """A family of measures of several kinds ('P', 'recall', 'ndcg') at several cutoffs.
+    The cumulative relevance and DCG of each topic are computed once per JoinedRun for all the
+    cutoffs of the family and shared by all its measures.
+    P@k is precisionAt(k); recall@k is recall computed on the top k entries of each topic;
+    ndcg@k divides the DCG of the top k entries by the DCG of the top k entries of the ideal
+    ordering of all the retrieved entries (as ndcg does, it equals ndcg for k >= depth)."""
+
+    KINDS = ('P', 'recall', 'ndcg')
+
+    def __init__(self, kinds, cutoffs):
+        for kind in kinds:
+            if kind not in CutoffFamily.KINDS: raise ValueError('Unknown cutoff measure ' + kind)
+        for cutoff in cutoffs:
+            if not isinstance(cutoff, numbers.Integral) or isinstance(cutoff, bool) or cutoff < 1:
+                raise ValueError('Cutoffs must be positive integers, given ' + repr(cutoff))
+        self.kinds = list(dict.fromkeys(kinds))
+        self.cutoffs = list(dict.fromkeys(int(cutoff) for cutoff in cutoffs))
+        self.sortedCutoffs = np.array(sorted(self.cutoffs), dtype=np.int64)
+        self.columns = {cutoff: column for column, cutoff in enumerate(self.sortedCutoffs.tolist())}
+
+    def values(self, joined):
+        """Returns a dictionary values[kind] = matrix (topics x sorted cutoffs) with the number of relevant
+        entries for 'P' and 'recall' and nDCG for 'ndcg'."""
+        return joined.derived(self, lambda: self._compute(joined))
+
+    def _compute(self, joined):
+        values = {}
+        if 'P' in self.kinds or 'recall' in self.kinds:
+            values['P'] = values['recall'] = joined.cumulativeAt(joined.relevant.astype(np.float64),
+                                                                 self.sortedCutoffs)
+        if 'ndcg' in self.kinds:
+            dcg = joined.cumulativeAt(joined.gains / joined.discounts(), self.sortedCutoffs)
+            idcg = joined.cumulativeAt(joined.idealGains() / joined.discounts(), self.sortedCutoffs)
+            values['ndcg'] = _ratios(dcg, idcg)
+        return values
+
+
+def cutoffDetails(joined, family=None, kind='P', cutoff=10):
+    """Vectorized kind@cutoff of a CutoffFamily"""
+    column = family.values(joined)[kind][:, family.columns[cutoff]]
+    if kind == 'recall':
+        return _recallDetails(joined, column)
+    if kind == 'P':
+        column = column / cutoff
+    return dict(zip(joined.topicIds, column.tolist())), joined.nQrelsTopics
+
+
+precisionDetails.detailsOrder = 'qrels'
+recallDetails.detailsOrder = 'qrels'
+avgPrecDetails.detailsOrder = 'run'
+precisionAtDetails.detailsOrder = 'run'
+ndcgDetails.detailsOrder = 'run'
+cutoffDetails.detailsOrder = {'P': 'run', 'recall': 'qrels', 'ndcg': 'run'}
+
+precisionKernel = _kernel(precisionDetails)
+recallKernel = _kernel(recallDetails)
+avgPrecKernel = _kernel(avgPrecDetails)
+precisionAtKernel = _kernel(precisionAtDetails)
+ndcgKernel = _kernel(ndcgDetails)
+cutoffKernel = _kernel(cutoffDetails)
@@ -0,0 +1,94 @@
+from pytrec_eval import instrumentation
+from pytrec_eval.engine import JoinedRun
+from pytrec_eval.result_cache import metricKey
+from pytrec_eval.trecrun import TrecRun
+
+__author__ = 'alberto'
+
+
+# Incremental re-evaluation of runs.
+# Runs built with incremental=True keep, for each (qrels, measure) they are evaluated with,
+# the per-topic scores computed by the details kernel of the measure (see pytrec_eval.engine)
+# and the version of the run they refer to. When the run is evaluated again, only the topics
+# changed since that version (see TrecRun.changedTopics: added, modified and removed topics)
+# are joined and scored, and their scores replace the old ones (topics that the details kernel
+# does not score any more are dropped). The denominators of the built-in metrics depend only on
+# the qrels, hence they do not change. The aggregated score is the sum of the per-topic scores
+# in the same order used by a full evaluation (see detailsOrder), so that results are identical.
+# If more than MAX_CHANGED_FRACTION of the topics changed the run is evaluated from scratch.
+
+MAX_CHANGED_FRACTION = 0.5
+
+
+class EvaluationState:
+    """Per-topic scores (details) and denominator of a measure on the given version of a run."""
+
+    def __init__(self, version, details, denominator):
+        self.version = version
+        self.details = details
+        self.denominator = denominator
+
+    def copy(self, version):
+        return EvaluationState(version, dict(self.details), self.denominator)
+
+
+def detailsOrder(measure):
+    """Returns 'run' if the per-topic scores of measure (computed by its details kernel) follow the
+    order of the topics of the run, 'qrels' if they follow the order of the topics of the qrels, as
+    declared by the details kernel (see pytrec_eval.engine); kernels declaring no order follow the run."""
+    detailsKernel = measure.detailsKernel
+    # the keyword arguments of partial kernels (e.g., the kind of cutoffDetails)
+    keywords = getattr(detailsKernel, 'keywords', {})
+    order = getattr(getattr(detailsKernel, 'func', detailsKernel), 'detailsOrder', 'run')
+    return order[keywords.get('kind', 'P')] if type(order) == dict else order
+
+
+def isIncremental(run, measure):
+    """Returns True if evaluate computes measure on run incrementally."""
+    return getattr(run, 'incremental', False) and hasattr(measure, 'detailsKernel')
+
+
+def _subRun(run, topicIds):
+    topicIds = [topicId for topicId in topicIds if topicId in run.entries]
+    if run.columnar: return TrecRun(run.entries.subset(topicIds))
+    return TrecRun({topicId: run.entries[topicId] for topicId in topicIds})
+
+
+def evaluate(run, qrels, measures, detailed=False):
+    """Evaluates the measures in the list measures (which must have a details kernel) on run, recomputing
+    only the topics changed since the previous evaluation of each measure. Returns a list with what
+    pytrec_eval.evaluate returns for each measure."""
+    qrelsKey = qrels.fingerprint()
+    nTopics = max(len(run.entries), 1)
+    # joins shared by the measures: joins[version] = JoinedRun of the topics changed since version
+    joins = {}
+    results = []
+    for measure in measures:
+        key = (qrelsKey, metricKey(measure) or measure)
+        state = run._evaluations.get(key)
+        changed = None if state is None else run.changedTopics(state.version)
+        if changed is None or len(changed) > MAX_CHANGED_FRACTION * nTopics:
+            if None not in joins: joins[None] = JoinedRun(run, qrels)
+            with instrumentation.metricPhase(measure, len(joins[None].gains)):
+                state = EvaluationState(run.version, *measure.detailsKernel(joins[None]))
+            run._evaluations[key] = state
+        elif changed:
+            if state.version not in joins:
+                joins[state.version] = JoinedRun(_subRun(run, changed), qrels.subset(changed))
+            with instrumentation.metricPhase(measure, len(joins[state.version].gains)):
+                details, _ = measure.detailsKernel(joins[state.version])
+            # scores of known topics are replaced in place (which keeps their order)
+            added = False
+            for topicId in changed:
+                if topicId in details:
+                    added = added or topicId not in state.details
+                    state.details[topicId] = details[topicId]
+                else:
+                    state.details.pop(topicId, None)
+            if added:
+                topicIds = qrels.allJudgements if detailsOrder(measure) == 'qrels' else run.entries
+                state.details = {topicId: state.details[topicId] for topicId in topicIds if topicId in state.details}
+            state.version = run.version
+        avg = sum(state.details.values()) / state.denominator
+        results.append(avg if not detailed else (avg, dict(state.details)))
+    return results
@@ -0,0 +1,110 @@
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+import scipy.sparse as sparse
+
+from pytrec_eval.confusion import _ratios
+from pytrec_eval.engine import _spansToPositions
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Indicator-matrix engine for the multi-label (multi topic) classification metrics.
+# The predicted and the real classes of the instances (topics) of a run are encoded once as
+# two sparse binary instances x classes matrices (the real classes of an instance are all
+# its judged documents in the qrels). The sizes of the intersections come from their
+# element-wise product, every other count from row and column sums, so that no metric
+# loops over instances or classes in Python. Classes are sorted; per-instance values are
+# in run order and averages are summed in that order, as the original metrics do.
+# Ratios with a zero denominator (e.g., instances without real classes) are 0.
+
+
+class IndicatorMatrices:
+    """Predicted and real instance x class indicator matrices (scipy.sparse CSR) of a multi-label
+    classification run. instanceIds are the topics of the run (in run order), classIds the classes
+    judged in the qrels or predicted in the run (sorted); judged[c] is True for the former."""
+
+    def __init__(self, run, qrels):
+        judgements = qrels.allJudgements
+        self.instanceIds = list(run.entries.keys())
+        realLists = [judgements[instance] for instance in self.instanceIds]
+        judgedClasses = set(chain.from_iterable(judgements.values()))
+        if run.columnar:
+            entries = run.entries
+            rows = np.fromiter(entries.rows.values(), dtype=np.int64, count=len(entries.rows))
+            starts, ends = entries.offsets[rows], entries.offsets[rows + 1]
+            docCodes = entries.docCodes[_spansToPositions(starts, ends - starts)]
+            usedCodes = np.unique(docCodes)
+            strings = entries.docVocabulary.strings
+            self.classIds = sorted(judgedClasses.union(strings[code] for code in usedCodes.tolist()))
+            vocabulary = Vocabulary.fromList(self.classIds)
+            translation = np.zeros(len(strings), dtype=np.int64)
+            translation[usedCodes] = vocabulary.lookupAll([strings[code] for code in usedCodes.tolist()])
+            predictedCodes, predictedLengths = translation[docCodes], ends - starts
+        else:
+            predictedIds = list(map(itemgetter(0), chain.from_iterable(run.entries.values())))
+            self.classIds = sorted(judgedClasses.union(predictedIds))
+            vocabulary = Vocabulary.fromList(self.classIds)
+            predictedCodes = vocabulary.lookupAll(predictedIds)
+            predictedLengths = list(map(len, run.entries.values()))
+        self.judged = np.zeros(len(self.classIds), dtype=bool)
+        self.judged[vocabulary.lookupAll(judgedClasses)] = True
+        realCodes = vocabulary.lookupAll(chain.from_iterable(realLists))
+        self.predicted = self._indicator(predictedCodes, predictedLengths)
+        self.real = self._indicator(realCodes, list(map(len, realLists)))
+        self.correct = self.predicted.multiply(self.real).tocsr()
+
+    def _indicator(self, codes, lengths):
+        rows = np.repeat(np.arange(len(self.instanceIds), dtype=np.int64), lengths)
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, np.asarray(codes, dtype=np.int64))),
+                                   shape=(len(self.instanceIds), len(self.classIds)))
+        # classes repeated in the entries of an instance count once
+        matrix.data[:] = 1
+        return matrix
+
+    def instanceCounts(self):
+        """Returns (correct, predicted, real): the number of correctly predicted, predicted and real
+        classes of each instance."""
+        return self.correct.getnnz(axis=1), self.predicted.getnnz(axis=1), self.real.getnnz(axis=1)
+
+    def classCounts(self):
+        """Returns (correct, predicted, real): the number of instances where each class is correctly
+        predicted, predicted and real."""
+        return self.correct.getnnz(axis=0), self.predicted.getnnz(axis=0), self.real.getnnz(axis=0)
+
+    def _perInstance(self, values, detailed):
+        avg = sum(values.tolist()) / len(values)
+        return (avg, dict(zip(self.instanceIds, values.tolist()))) if detailed else avg
+
+    def precision(self, detailed=False):
+        correct, predicted, _ = self.instanceCounts()
+        return self._perInstance(_ratios(correct, predicted), detailed)
+
+    def recall(self, detailed=False):
+        correct, _, real = self.instanceCounts()
+        return self._perInstance(_ratios(correct, real), detailed)
+
+    def accuracy(self, detailed=False):
+        """Jaccard index of the predicted and the real classes, averaged over the instances."""
+        correct, predicted, real = self.instanceCounts()
+        return self._perInstance(_ratios(correct, predicted + real - correct), detailed)
+
+    def exactMatchRatio(self, detailed=False):
+        """Fraction of instances whose predicted classes are exactly the real ones; details list the
+        instances matching (with value 1)."""
+        correct, predicted, real = self.instanceCounts()
+        matches = (correct == predicted) & (correct == real)
+        ratio = float(np.count_nonzero(matches)) / len(matches)
+        if not detailed: return ratio
+        return ratio, {self.instanceIds[i]: 1 for i in np.flatnonzero(matches).tolist()}
+
+    def retrievalFScore(self, detailed=False):
+        """F1 score of each judged class, averaged over the classes."""
+        correct, predicted, real = self.classCounts()
+        scores = _ratios(2 * correct, predicted + real)[self.judged]
+        avg = sum(scores.tolist()) / len(scores)
+        if not detailed: return avg
+        return avg, dict(zip([c for c, judged in zip(self.classIds, self.judged.tolist()) if judged], scores.tolist()))
+
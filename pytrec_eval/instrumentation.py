@@ -0,0 +1,217 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+__author__ = 'alberto'
+
+
+# Opt-in instrumentation of the hot paths of pytrec_eval.
+# Once enabled (see enableInstrumentation), the parsing of runs and qrels, their join
+# (see pytrec_eval.engine.JoinedRun), evaluate, evaluateAll and the computation of each
+# measure inside evaluate are recorded as phases: for each phase name the Instrumentation
+# accumulates the number of calls, the wall time, the number of entries processed and,
+# if memory is True, the peak memory allocated (traced by tracemalloc, which slows Python
+# down noticeably). The single calls are also kept as events, which can be exported in the
+# Chrome trace format (chrome://tracing, https://ui.perfetto.dev).
+# When instrumentation is disabled every hook costs a global lookup and a comparison.
+# Phases executed by worker processes (see pytrec_eval.parallel) are not recorded.
+
+# the instrumentation recording the phases (None if disabled)
+current = None
+
+_NULL_PHASE = nullcontext()
+
+
+class PhaseStats:
+    """Statistics of the calls of a phase: number of calls, total and maximum wall time (seconds),
+    total entries processed and maximum peak of allocated memory (bytes, None if not traced)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.maxTime = 0.0
+        self.entries = 0
+        self.peakBytes = None
+
+    def add(self, duration, entries, peakBytes):
+        self.calls += 1
+        self.time += duration
+        self.maxTime = max(self.maxTime, duration)
+        self.entries += entries
+        if peakBytes is not None: self.peakBytes = max(self.peakBytes or 0, peakBytes)
+
+    def toDict(self):
+        return {'calls': self.calls, 'time': self.time, 'maxTime': self.maxTime, 'entries': self.entries,
+                'peakBytes': self.peakBytes}
+
+
+class _Phase:
+    """Context manager recording one call of a phase in an Instrumentation."""
+
+    def __init__(self, instrumentation, name, entries):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.entries = entries
+
+    def __enter__(self):
+        if self.instrumentation.memory: self.instrumentation._enterMemory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        end = time.perf_counter()
+        peakBytes = self.instrumentation._exitMemory() if self.instrumentation.memory else None
+        entries = self.entries() if callable(self.entries) else self.entries
+        self.instrumentation._record(self.name, self.start, end - self.start, entries or 0, peakBytes)
+        return False
+
+
+class Instrumentation:
+    """Statistics of the phases recorded while enabled: stats[name] = PhaseStats.
+    At most maxEvents single calls are kept for the traces. If memory is True tracemalloc
+    traces the allocations (see enableInstrumentation)."""
+
+    def __init__(self, memory=False, maxEvents=100000):
+        self.memory = memory
+        self.maxEvents = maxEvents
+        self.stats = {}
+        # (name, start, duration, thread, entries, peakBytes) of each call
+        self.events = []
+        self.droppedEvents = 0
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._startedTracing = False
+        # per-thread stack of [memory at the start of the phase, peak seen so far] of the open phases
+        self._local = threading.local()
+
+    def phase(self, name, entries=None):
+        """Returns a context manager recording a call of the phase name. entries is the number of
+        entries processed, or a function returning it (called at the end of the phase)."""
+        return _Phase(self, name, entries)
+
+    def _enterMemory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+        stack = self._local.__dict__.setdefault('stack', [])
+        current, peak = tracemalloc.get_traced_memory()
+        if stack: stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        stack.append([current, current])
+
+    def _exitMemory(self):
+        stack = self._local.stack
+        _, peak = tracemalloc.get_traced_memory()
+        start, peakSoFar = stack.pop()
+        peak = max(peak, peakSoFar)
+        # the peak of the enclosing phase includes the one of this phase
+        if stack: stack[-1][1] = max(stack[-1][1], peak)
+        return peak - start
+
+    def _record(self, name, start, duration, entries, peakBytes):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None: stats = self.stats[name] = PhaseStats()
+            stats.add(duration, entries, peakBytes)
+            if len(self.events) < self.maxEvents:
+                self.events.append((name, start, duration, threading.get_ident(), entries, peakBytes))
+            else:
+                self.droppedEvents += 1
+
+    def clear(self):
+        """Forgets all the recorded phases."""
+        with self._lock:
+            self.stats = {}
+            self.events = []
+            self.droppedEvents = 0
+
+    def toDict(self):
+        """Returns the statistics as a dictionary d[name] = {'calls', 'time', 'maxTime', 'entries', 'peakBytes'}."""
+        return {name: stats.toDict() for name, stats in self.stats.items()}
+
+    def toJSON(self, fileName=None):
+        """Returns the statistics (see toDict) as a JSON string, also written to fileName if it is not None."""
+        text = json.dumps(self.toDict(), indent=2)
+        if fileName is not None:
+            with open(fileName, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def toChromeTrace(self, fileName=None):
+        """Returns the recorded calls as a dictionary in the Chrome trace event format, also written
+        to fileName (as JSON) if it is not None."""
+        events = []
+        for name, start, duration, thread, entries, peakBytes in self.events:
+            args = {'entries': entries}
+            if peakBytes is not None: args['peakBytes'] = peakBytes
+            events.append({'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': os.getpid(),
+                           'tid': thread, 'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6, 'args': args})
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if fileName is not None:
+            with open(fileName, 'w', encoding='utf-8') as f:
+                json.dump(trace, f)
+        return trace
+
+    def __str__(self):
+        lines = ['{:40s} {:>8s} {:>12s} {:>12s} {:>12s} {:>12s}'.format('phase', 'calls', 'time (s)',
+                                                                      'max (s)', 'entries', 'peak (MB)')]
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].time):
+            lines.append('{:40s} {:8d} {:12.6f} {:12.6f} {:12d} {:>12s}'.format(
+                name, stats.calls, stats.time, stats.maxTime, stats.entries,
+                '' if stats.peakBytes is None else '{:.2f}'.format(stats.peakBytes / (1 << 20))))
+        return '\n'.join(lines)
+
+
+def phase(name, entries=None):
+    """Returns a context manager recording a call of the phase name in the current instrumentation
+    (one doing nothing if instrumentation is disabled). See Instrumentation.phase."""
+    if current is None: return _NULL_PHASE
+    return current.phase(name, entries)
+
+
+def metricPhase(measure, entries=None):
+    """Returns the phase (see phase) of the computation of measure; its name is built only if
+    instrumentation is enabled, from the name of measure (its repr for, e.g., functools.partial)."""
+    if current is None: return _NULL_PHASE
+    return current.phase('metric.' + getattr(measure, '__name__', repr(measure)), entries)
+
+
+def instrumented(name, entries=None):
+    """Decorator recording each call of the decorated function as a call of the phase name.
+    entries, if not None, is a function receiving the arguments of the call and returning the
+    number of entries processed (called after the call)."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if current is None: return function(*args, **kwargs)
+            with current.phase(name, None if entries is None else lambda: entries(*args, **kwargs)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def countEntries(entries):
+    """Returns the number of entries of a run (TrecRun.entries) or of judgements (QRels.allJudgements)."""
+    if hasattr(entries, 'docCodes'): return len(entries.docCodes)
+    return sum(len(values) for values in entries.values())
+
+
+def enableInstrumentation(memory=False, maxEvents=100000):
+    """Starts recording the phases of pytrec_eval in a new Instrumentation, which is returned.
+    If memory is True the peak memory allocated by each phase is traced too."""
+    global current
+    current = Instrumentation(memory, maxEvents)
+    return current
+
+
+def disableInstrumentation():
+    """Stops recording; returns the Instrumentation that was recording (None if there was none)."""
+    global current
+    instrumentation, current = current, None
+    if instrumentation is not None and instrumentation._startedTracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return instrumentation
@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 
 import pytrec_eval
+from pytrec_eval.recall_precision import RecallPrecisionCurves
 
 
 __author__ = 'alberto'
@@ -34,30 +35,10 @@ def plotEvaluation(trecRun, qrels, measure, outputFile=None, showPlot=True):
     if outputFile is not None: plt.savefig(outputFile, bbox_inches=0)
 
 
-def _recallPrecisionPerTopic(trecRun, qrels, topicId):
-    """
-    Computes interpolate precision for all recall levels in _recallLevels.
-    Returns a list containing the interpolated precisions.
-    """
-    entries = trecRun.getEntriesBy(topicId)
-    intPrecisions = [0] * 11  # contains max precision for each level of recall
-    retrievedRelevants, allRelevants = 0, qrels.getNRelevant(topicId)
-    for rank, (docId, _, _) in enumerate(entries, start=1):
-        if qrels.isRelevant(topicId, docId): retrievedRelevants += 1
-        currentRecall = retrievedRelevants / allRelevants
-        currentPrecision = retrievedRelevants / rank
-
-        recallLevel = int(currentRecall * 10)
-        # print('currentRecall:', currentRecall, 'currentPrecision:', currentPrecision, 'recallLevel:', recallLevel)
-        if currentPrecision > intPrecisions[recallLevel]: intPrecisions[recallLevel] = currentPrecision
-        if currentRecall == (recallLevel / 10) > 0 and intPrecisions[recallLevel - 1] < currentPrecision:
-            intPrecisions[recallLevel - 1] = currentPrecision
-    return [max(intPrecisions[rank:]) for rank, _ in enumerate(intPrecisions)]
-
-
 def plotRecallPrecisionAll(trecRuns, qrels, outputFile=None, showPlot=True):
     """
-    Plots a recall/precision graphs showing the precision/recall curves of all the runs contained in trecRuns.
+    Plots a recall/precision graphs showing the precision/recall curves of all the runs contained in trecRuns
+    (TrecRun s or RecallPrecisionCurves, which are not recomputed).
     If outputFile contains a file name, then the plot is printed in the specified file.
     If showPlot is True then the plot is shown to the user before the termination of the function.
     """
@@ -75,7 +56,8 @@ def plotRecallPrecisionAll(trecRuns, qrels, outputFile=None, showPlot=True):
 
 def plotRecallPrecision(trecRun, qrels, perQuery=False, outputFile=None, showPlot=True):
     """
-    Plots a recall/precision graphs showing the precision/recall curve of the given TrecRun.
+    Plots a recall/precision graphs showing the precision/recall curve of the given TrecRun
+    (or RecallPrecisionCurves, which are not recomputed).
     If perQuery is True then a dashed precision/recall curve is drawn for each topic together
     with the solid precision/recall curve obtained by averaging precision at each recall point
     among all topics.
@@ -90,19 +72,14 @@ def plotRecallPrecision(trecRun, qrels, perQuery=False, outputFile=None, showPlo
 
 
 def _plotRecallPrecision(trecRun, qrels, perQuery=False):
-    avgs = [0] * 11
-    recallLevels = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
-    for tId in qrels.getTopicIds():
-        intPrec = _recallPrecisionPerTopic(trecRun, qrels, tId)
-        avgs = map(lambda x, y: x + y, avgs, intPrec)
-        if perQuery: plt.plot(recallLevels, intPrec, '--', label=tId)
-
-    nquery = qrels.getNTopics()
-    avgs = [avg / nquery for avg in avgs]
+    curves = trecRun if isinstance(trecRun, RecallPrecisionCurves) else RecallPrecisionCurves(trecRun, qrels)
+    recallLevels = curves.recallLevels
     if perQuery:
-        plt.plot(recallLevels, avgs, 'r-', lw=2, label='Average')
+        for tId, intPrec in zip(curves.topicIds, curves.precisions):
+            plt.plot(recallLevels, intPrec, '--', label=tId)
+        plt.plot(recallLevels, curves.average(), 'r-', lw=2, label='Average')
     else:
-        plt.plot(recallLevels, avgs, label=trecRun.name)
+        plt.plot(recallLevels, curves.average(), label=curves.name)
     plt.xlabel('Recall')
     plt.ylabel('Precision')
-    plt.title('Recall/Precision chart for ' + trecRun.name)
\ No newline at end of file
+    plt.title('Recall/Precision chart for ' + curves.name)
@@ -1,4 +1,7 @@
 import math
+from functools import partial
+
+from pytrec_eval import engine
 
 __author__ = 'alberto'
 
@@ -8,6 +11,11 @@ __author__ = 'alberto'
 # If detailed is True only the aggregated score among all topics is returned (a double);
 # otherwise, a pair (aggregatedScore, details) where
 # details is a dictionary details[topicID] = score is returned.
+# Built-in metrics also expose a vectorized implementation through the attribute
+# "kernel" and the per-topic scores with their denominator through the attribute
+# "detailsKernel" (see pytrec_eval.engine).
+# Metrics whose closure captures values other than numbers and strings should expose a
+# hashable "cacheKey" identifying them to the result cache (see pytrec_eval.result_cache).
 
 
 def precision(run, qrels, detailed=False):
@@ -90,6 +98,9 @@ def precisionAt(rank):
         numtopics = qrels.getNTopics()
         return avg / numtopics if not detailed else (avg / numtopics, details)
 
+    precisionAtRank.kernel = partial(engine.precisionAtKernel, rank=rank)
+    precisionAtRank.detailsKernel = partial(engine.precisionAtDetails, rank=rank)
+    precisionAtRank.cacheKey = ('precisionAt', rank)
     return precisionAtRank
 
 
@@ -123,4 +134,51 @@ def ndcg(run, qrels, detailed=False):
     return avg / numtopics if not detailed else (avg / numtopics, details)
 
 
+def cutoffMeasures(kinds, cutoffs):
+    """
+    Returns a list of metrics, one for each kind in kinds ('P', 'recall' or 'ndcg')
+    and each rank in cutoffs, named kind@rank (e.g., P@10, recall@100, ndcg@20).
+    P@k is precisionAt(k); recall@k is recall computed on the top k entries of each topic;
+    ndcg@k is ndcg cut at rank k (see pytrec_eval.engine.CutoffFamily). When they are evaluated together (e.g., by evaluate or evaluateAll)
+    all of them are computed from a single pass over the cumulative relevance of each topic.
+    """
+    family = engine.CutoffFamily(kinds, cutoffs)
+    return [_cutoffMeasure(family, kind, cutoff) for kind in family.kinds for cutoff in family.cutoffs]
+
+
+def _cutoffMeasure(family, kind, cutoff):
+    def cutoffMeasure(run, qrels, detailed=False):
+        return cutoffMeasure.kernel(engine.JoinedRun(run, qrels), detailed)
+
+    cutoffMeasure.__name__ = kind + '@' + str(cutoff)
+    cutoffMeasure.cacheKey = ('cutoffMeasure', kind, cutoff)
+    cutoffMeasure.kernel = partial(engine.cutoffKernel, family=family, kind=kind, cutoff=cutoff)
+    cutoffMeasure.detailsKernel = partial(engine.cutoffDetails, family=family, kind=kind, cutoff=cutoff)
+    return cutoffMeasure
+
+
+precision.kernel = engine.precisionKernel
+recall.kernel = engine.recallKernel
+avgPrec.kernel = engine.avgPrecKernel
+ndcg.kernel = engine.ndcgKernel
+precision.detailsKernel = engine.precisionDetails
+recall.detailsKernel = engine.recallDetails
+avgPrec.detailsKernel = engine.avgPrecDetails
+ndcg.detailsKernel = engine.ndcgDetails
+
 STD_METRICS = [avgPrec, ndcg]
+
+# names of the metrics accepted by parseMeasure (besides kind@rank)
+MEASURE_NAMES = {'precision': precision, 'recall': recall, 'avgPrec': avgPrec, 'map': avgPrec, 'ndcg': ndcg}
+
+
+def parseMeasure(name):
+    """
+    Returns the metric named name: one of the keys of MEASURE_NAMES or kind@rank, where kind is
+    'P', 'recall' or 'ndcg' (e.g., P@10, see cutoffMeasures). Raises ValueError for unknown names.
+    """
+    if name in MEASURE_NAMES: return MEASURE_NAMES[name]
+    kind, at, cutoff = name.partition('@')
+    if at and kind in engine.CutoffFamily.KINDS and cutoff.isdigit() and int(cutoff) > 0:
+        return cutoffMeasures([kind], [int(cutoff)])[0]
+    raise ValueError('Unknown measure ' + name)
@@ -1,7 +1,13 @@
 __author__ = 'alberto'
 
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
 import pandas as pd
+from pytrec_eval.engine import _spansToPositions
 from pytrec_eval.utils import *
+from pytrec_eval.results import EvaluationResults
 
 
 def df_evaluate(run, qrels, measures, details=False):
@@ -17,52 +23,75 @@ def df_evaluate(run, qrels, measures, details=False):
     of the metrics for the topic.
     :return:
     """
+    results = EvaluationResults.fromRuns([run], qrels, measures)
     if not details:
-        if type(measures) == list:
-            details = evaluate(run, qrels, measures)
-            d = {m.__name__: pd.Series(details[i]) for i, m in enumerate(measures)}
-            return pd.DataFrame(d)
-        else:
-            avg = evaluate(run, qrels, measures)
-            return pd.DataFrame({measures.__name__: [avg]})
-    else:
-        if type(measures) == list:
-            details = evaluate(run, qrels, measures, True)
-            return pd.DataFrame({m.__name__: pd.Series(details[i][1]) for i, m in enumerate(measures)})
-        else:
-            _, details = evaluate(run, qrels, measures, True)
-            return pd.DataFrame({run.name: pd.Series(details)})
+        return pd.DataFrame(results.averages, columns=results.measureNames)
+    if type(measures) == list:
+        return pd.DataFrame(results.scores[:, 0, :], index=results.topicIds, columns=results.measureNames)
+    return results.toWide(measures)
 
 
-def df_evaluateAll(runs, qrels, measures):
+def df_evaluateAll(runs, qrels, measures, processes=1):
     """
     Evaluates all the runs given as input with the given qrels by evaluating all the provided measures.
     The output is a DataFrame containing the result of the evaluation.
 
-    :param runs: a list of runs
+    :param runs: a list of runs (or of names of run files)
     :param qrels:
     :param measures: either a list of metrics or a single metric.
     In the first case, the resulting dataframe has one row per run and one column per metric
     In the latter case, the resulting dataframe has one row per topic and one column reporting the value
     of the metrics for the topic.
+    :param processes: if > 1, runs are parsed and evaluated by up to processes worker processes.
     :return:
     :rtype:
     """
-    if type(measures) == list:
-        data = {metrics.__name__: [evaluate(run, qrels, metrics, False) for run in runs] for metrics in measures}
-        return pd.DataFrame(data, index=[run.name for run in runs])
-    else:
-        series = {run.name: pd.Series(evaluate(run, qrels, measures, True)[1]) for run in runs}
-        return pd.DataFrame(series)
+    results = EvaluationResults.fromRuns(runs, qrels, measures, processes)
+    return results.averagesFrame() if type(measures) == list else results.toWide(measures)
 
 
 def df_relevanceScores(trecRun, qrels, top_n=10):
     """
     Outputs a DataFrame with the relevance scores for the top_n entries of trecrun for each topic
+    (-1 for the documents that are not judged). Each column is built as a whole; relevance scores are floats.
     """
-    return pd.DataFrame([[topicId, rank, docId, ann,
-                          qrels.getRelevanceScore(topicId, docId) if docId in qrels.allJudgements[topicId] else -1]
-                         for topicId in trecRun.entries
-                         for rank, (docId, _, ann) in enumerate(trecRun.getEntriesBy(topicId), start=1) if
-                         rank <= top_n],
+    topicIds = list(trecRun.entries)
+    if trecRun.columnar:
+        entries = trecRun.entries
+        spans = np.array([entries.span(topicId) for topicId in topicIds], dtype=np.int64).reshape(-1, 2)
+        lengths = np.minimum(spans[:, 1] - spans[:, 0], top_n)
+        positions = _spansToPositions(spans[:, 0], lengths)
+        docIds = np.array(entries.docVocabulary.strings, dtype=object)[entries.docCodes[positions]]
+        annotations = np.full(len(positions), '', dtype=object) if entries.annotationCodes is None else \
+            np.array(entries.annotationVocabulary.strings, dtype=object)[entries.annotationCodes[positions]]
+    else:
+        topEntries = [trecRun.entries[topicId][:top_n] for topicId in topicIds]
+        lengths = np.array(list(map(len, topEntries)), dtype=np.int64)
+        entryList = list(chain.from_iterable(topEntries))
+        docIds = np.array(list(map(itemgetter(0), entryList)), dtype=object)
+        annotations = np.array(list(map(itemgetter(2), entryList)), dtype=object)
+    topicColumn = np.repeat(np.array(topicIds, dtype=object), lengths)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ranks = np.arange(1, offsets[-1] + 1, dtype=np.int64) - np.repeat(offsets[:-1], lengths)
+    # join the entries with the judgements of their topics on the keys row * |docIDs| + docCode
+    judgements = [qrels.allJudgements.get(topicId, {}) for topicId in topicIds]
+    judgedLengths = np.array(list(map(len, judgements)), dtype=np.int64)
+    judgedScores = np.fromiter(chain.from_iterable(docsRelevance.values() for docsRelevance in judgements),
+                               dtype=np.float64, count=int(judgedLengths.sum()))
+    docCodes, uniqueDocIds = pd.factorize(np.concatenate([docIds, np.array(list(chain.from_iterable(judgements)),
+                                                                           dtype=object)]))
+    nDocIds = max(len(uniqueDocIds), 1)
+    rows = np.arange(len(topicIds), dtype=np.int64)
+    keys = np.repeat(rows, lengths) * nDocIds + docCodes[:len(docIds)]
+    judgedKeys = np.repeat(rows, judgedLengths) * nDocIds + docCodes[len(docIds):]
+    order = np.argsort(judgedKeys)
+    judgedKeys, judgedScores = judgedKeys[order], judgedScores[order]
+    relevanceScores = np.full(len(keys), -1.0)
+    if len(judgedKeys):
+        positions = np.minimum(np.searchsorted(judgedKeys, keys), len(judgedKeys) - 1)
+        found = judgedKeys[positions] == keys
+        relevanceScores[found] = judgedScores[positions[found]]
+    return pd.DataFrame({'topicId': topicColumn, 'rank': ranks, 'docId': docIds, 'annotation': annotations,
+                         'relevance_score': relevanceScores},
                         columns=['topicId', 'rank', 'docId', 'annotation', 'relevance_score'])
@@ -0,0 +1,85 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytrec_eval
+from pytrec_eval.concurrent_io import iterRuns
+
+__author__ = 'alberto'
+
+
+# Process-pool execution of the evaluation of many runs.
+# The qrels, the measures and the runs are shipped to the workers once, as the arguments of
+# the initializer of the pool: where the 'fork' start method is available they are inherited
+# by the forked workers and tasks are just indexes; otherwise qrels and measures are pickled
+# once per worker and each run once per task. Runs given as file names are parsed in the
+# workers. The parent process keeps no global state, so that pools can be nested or run
+# concurrently.
+# Note that with the 'spawn' start method measures must be picklable (precisionAt(k)
+# closures are not).
+
+# (qrels, measures, runs, detailed, returnRuns, runKwargs) of the pool of a worker process
+_shared = None
+
+
+def _initWorker(shared):
+    global _shared
+    _shared = shared
+
+
+def _loadTask(i, fileName=None):
+    _, _, fileNames, _, _, runKwargs = _shared
+    return pytrec_eval.TrecRun(fileNames[i] if fileName is None else fileName, **runKwargs)
+
+
+def _evaluateTask(i, run=None):
+    qrels, measures, runs, detailed, returnRuns, runKwargs = _shared
+    return _evaluate(runs[i] if run is None else run, qrels, measures, detailed, returnRuns, runKwargs)
+
+
+def _evaluate(run, qrels, measures, detailed, returnRuns, runKwargs):
+    parsed = type(run) == str
+    if parsed: run = pytrec_eval.TrecRun(run, **runKwargs)
+    return run if parsed and returnRuns else run.name, pytrec_eval.evaluate(run, qrels, measures, detailed)
+
+
+def _map(task, items, shared, processes):
+    chunksize = max(1, len(items) // (4 * processes))
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # the arguments of the initializer are not pickled by forked workers
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork'), initializer=_initWorker,
+                                 initargs=(shared[:2] + (items,) + shared[3:],)) as executor:
+            return list(executor.map(task, range(len(items)), chunksize=chunksize))
+    with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(shared,)) as executor:
+        return list(executor.map(task, range(len(items)), items, chunksize=chunksize))
+
+
+def loadRuns(runFilenames, processes=1, **runKwargs):
+    """Loads the runs in runFilenames by using up to processes worker processes.
+    Returns a list of TrecRun s; runKwargs are passed to the constructor of TrecRun.
+    A shared vocabulary (runKwargs['vocabulary']) is shared by the runs once they are back from the workers."""
+    if processes <= 1:
+        return [pytrec_eval.TrecRun(fileName, **runKwargs) for fileName in runFilenames]
+    vocabulary = runKwargs.pop('vocabulary', None)
+    runs = _map(_loadTask, list(runFilenames), (None, None, None, False, False, runKwargs), processes)
+    if vocabulary is not None:
+        for run in runs: run.shareVocabulary(vocabulary)
+    return runs
+
+
+def evaluateRuns(runs, qrels, measures=pytrec_eval.STD_METRICS, detailed=False, processes=1, returnRuns=False,
+                 threads=1, **runKwargs):
+    """Evaluates each run in runs (TrecRun s or names of run files, parsed with runKwargs) by using
+    up to processes worker processes.
+    Returns a list of pairs (name, results), one per run in the same order, where results is
+    what pytrec_eval.evaluate(run, qrels, measures, detailed) returns. If returnRuns is True the
+    runs parsed from files are returned in place of their name.
+    If processes <= 1 and threads > 1 up to threads run files are parsed concurrently (see
+    pytrec_eval.concurrent_io.iterRuns) while the runs are evaluated."""
+    if processes <= 1 and threads > 1:
+        runs = list(runs)
+        return [(run if type(source) == str and returnRuns else run.name,
+                 pytrec_eval.evaluate(run, qrels, measures, detailed))
+                for source, run in zip(runs, iterRuns(runs, threads, **runKwargs))]
+    if processes <= 1:
+        return [_evaluate(run, qrels, measures, detailed, returnRuns, runKwargs) for run in runs]
+    return _map(_evaluateTask, list(runs), (qrels, measures, None, detailed, returnRuns, runKwargs), processes)
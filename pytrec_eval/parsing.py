@@ -0,0 +1,177 @@
+import csv
+import io
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from pytrec_eval.compression import openFile
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Bulk parsers for TREC runs and qrels.
+# Files are read in blocks of about BLOCK_SIZE characters made of whole lines; every block is
+# tokenized by the C parser of pandas (pandas.read_csv), which also parses the scores, and the
+# identifiers of runs are factorized (pandas.factorize) block by block; the distinct identifiers
+# of the blocks are merged into the vocabularies once, at the end. Blocks that the C parser cannot
+# read exactly (lines with a wrong number of fields, tab-separated lines with leading or trailing
+# blanks, scores that pandas does not parse) are tokenized line by line in Python, which raises
+# ValueError for malformed lines. Both tab-separated and whitespace-separated files are accepted;
+# annotations containing blanks are supported in tab-separated files only. Blank lines are skipped.
+# Blocks are small enough to keep the memory needed to tokenize them low.
+# Building the dictionaries of qrels dominates their parsing, hence QRels uses the line parser
+# unless bulk=True.
+
+BLOCK_SIZE = 1 << 22
+
+
+def _readBlocks(fileName):
+    """Yields blocks of about BLOCK_SIZE characters made of whole lines."""
+    with openFile(fileName) as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if block == '': break
+            if not block.endswith('\n'): block += f.readline()
+            yield block
+
+
+def _tokenize(block, nFields, trailing=False):
+    """Returns (tokens, stride): the fields of the non-blank lines of block in order, and the number
+    of fields per line. Lines containing a tab are split at tabs (fields may contain blanks), other
+    lines at blanks. If the lines of the block have a varying number of fields, shorter lines are
+    padded with empty strings up to nFields[-1] fields. Lines must have one of the number of fields
+    in nFields (or more than nFields[-1] if trailing is True: the exceeding fields are ignored),
+    otherwise ValueError is raised."""
+    lines = block.split('\n')
+    if lines[-1] == '': lines.pop()
+    # blank lines have a different number of fields, hence their blocks are tokenized line by line
+    if '\t' in block:
+        # splitting at blanks gives the fields of tab-separated lines only if no field contains blanks
+        counts = set() if ' ' in block else set(map(str.count, lines, repeat('\t')))
+        counts = set(count + 1 for count in counts)
+    else:
+        counts = set(map(len, map(str.split, lines)))
+    if len(counts) == 1:
+        n = counts.pop()
+        if n in nFields or (trailing and n > nFields[-1]):
+            tokens = block.split()
+            # fails if some line has empty fields (consecutive tabs)
+            if len(tokens) == n * len(lines): return tokens, n
+    tokens = []
+    for line in lines:
+        line = line.strip()
+        if line == '': continue
+        fields = line.split('\t') if '\t' in line else line.split()
+        if trailing: fields = fields[:nFields[-1]]
+        if len(fields) not in nFields: raise ValueError('Wrong number of fields: ' + line)
+        tokens.extend(fields)
+        tokens.extend([''] * (nFields[-1] - len(fields)))
+    return tokens, nFields[-1]
+
+
+def _readColumnsC(block, nFields, columns, trailing):
+    """Reads the columns of block by the C parser of pandas (see _readColumns); returns None if the
+    block cannot be read exactly, ValueError is raised for malformed values."""
+    tabs = '\t' in block
+    # the line parser strips lines before splitting them at tabs
+    if tabs and (block.startswith(' ') or '\n ' in block or ' \n' in block): return None
+    firstLine = block.lstrip()
+    if firstLine == '': return None
+    firstLine = firstLine[:firstLine.find('\n')].strip()
+    nFirst = len(firstLine.split('\t') if tabs else firstLine.split())
+    if trailing:
+        # the exceeding fields of the following lines are ignored by usecols
+        nNames, usecols = max(nFields[-1], nFirst), list(columns)
+    else:
+        # the exceeding fields of the first line would be dropped, those of the following lines fill the
+        # last column, which is empty otherwise, or make the parser fail
+        if nFirst > nFields[-1]: return None
+        nNames, usecols = nFields[-1] + 1, None
+    scoreColumn = nFields[0] - 1
+    frame = pd.read_csv(io.StringIO(block), sep='\t' if tabs else r'\s+', header=None, names=range(nNames),
+                        index_col=False, usecols=usecols,
+                        dtype={column: np.float64 if column == scoreColumn else object
+                               for column in (range(nNames) if usecols is None else usecols)},
+                        na_filter=False, quoting=csv.QUOTE_NONE, engine='c', float_precision='round_trip')
+    if not trailing and (frame[nFields[-1]] != '').any(): return None
+    return [frame[column].to_numpy() for column in columns]
+
+
+def _readColumns(block, nFields, columns, trailing=False):
+    """Returns one NumPy array per index in columns with the fields in that position of the non-blank lines
+    of block: floats for the last mandatory field (nFields[0] - 1, the score), strings for the others
+    ('' for fields missing from lines shorter than nFields[-1]). See _tokenize for nFields and trailing."""
+    try:
+        result = _readColumnsC(block, nFields, columns, trailing)
+    except ValueError:
+        result = None
+    if result is not None: return result
+    tokens, stride = _tokenize(block, nFields, trailing)
+    nLines = len(tokens) // stride
+    return [np.array(list(map(float, tokens[column::stride])), dtype=np.float64) if column == nFields[0] - 1
+            else np.array(tokens[column::stride], dtype=object) if column < stride
+            else np.full(nLines, '', dtype=object) for column in columns]
+
+
+def _encode(factorized, initial=()):
+    """Merges the pairs (codes, uniques) returned by pandas.factorize for consecutive blocks into a
+    Vocabulary (the strings in initial first, then in order of first appearance) and the codes of all
+    the values; the values themselves are looked up only once per block in which they appear."""
+    uniqueCodes, uniques = pd.factorize(np.concatenate([np.array(initial, dtype=object)] +
+                                                       [blockUniques for _, blockUniques in factorized]))
+    codes, offset = [], len(initial)
+    for blockCodes, blockUniques in factorized:
+        codes.append(uniqueCodes[offset:offset + len(blockUniques)].astype(np.int32)[blockCodes])
+        offset += len(blockUniques)
+    return Vocabulary.fromList(uniques.tolist()), _concatenate(codes, np.int32)
+
+
+def parseRunColumns(fileName, topics=None):
+    """Parses a TREC run file. Returns a tuple
+    (topicVocabulary, topicCodes, docVocabulary, docCodes, scores, annotationVocabulary, annotationCodes)
+    containing one code/score per line in file order; topic codes follow the order of first
+    appearance of the topics. If topics (a set) is not None the lines of other topics are skipped
+    before their fields are encoded."""
+    # per column, the factorized values of each block
+    topicIds, docIds, annotations, scores = [], [], [], []
+    for block in _readBlocks(fileName):
+        try:
+            columns = _readColumns(block, (5, 6), (0, 2, 4, 5))
+        except ValueError:
+            raise BaseException('Unparsable run')
+        codes, uniques = pd.factorize(columns[0])
+        if topics is not None:
+            keep = np.fromiter(map(topics.__contains__, uniques), dtype=bool, count=len(uniques))[codes]
+            if not keep.all():
+                columns = [column[keep] for column in columns]
+                codes, uniques = pd.factorize(columns[0])
+        topicIds.append((codes, uniques))
+        docIds.append(pd.factorize(columns[1]))
+        scores.append(columns[2])
+        annotations.append(pd.factorize(columns[3]))
+    topicVocabulary, topicCodes = _encode(topicIds)
+    docVocabulary, docCodes = _encode(docIds)
+    annotationVocabulary, annotationCodes = _encode(annotations, [''])
+    return (topicVocabulary, topicCodes, docVocabulary, docCodes, _concatenate(scores, np.float64),
+            annotationVocabulary, annotationCodes)
+
+
+def parseQRels(fileName):
+    """Parses a TREC qrels file into a dictionary judgements[topicID][docID] = relevanceScore.
+    Fields after the fourth are ignored, as QRels does."""
+    judgements = {}
+    for block in _readBlocks(fileName):
+        topicIds, docIds, relevanceScores = _readColumns(block, (4,), (0, 2, 3), trailing=True)
+        if len(topicIds) == 0: continue
+        # judgements of the same topic are usually contiguous: insert them one run at a time
+        bounds = [0] + (np.flatnonzero(topicIds[1:] != topicIds[:-1]) + 1).tolist() + [len(topicIds)]
+        topicIds, docIds, relevanceScores = topicIds.tolist(), docIds.tolist(), relevanceScores.tolist()
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            judgements.setdefault(topicIds[start], {}).update(zip(docIds[start:end], relevanceScores[start:end]))
+    return judgements
+
+
+def _concatenate(arrays, dtype):
+    return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
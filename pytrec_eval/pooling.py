@@ -0,0 +1,76 @@
+import numpy as np
+
+from pytrec_eval.engine import _spansToPositions
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Cross-run operations on the documents retrieved for each topic.
+# When all the runs are columnar and share their doc vocabulary (see TrecRun.shareVocabulary)
+# the documents retrieved by a run are the integer keys topicCode * |vocabulary| + docCode,
+# and pools and overlaps are computed by NumPy set operations on those keys; otherwise by
+# Python sets of docIDs. Both give the same results.
+
+
+def _sharedVocabulary(runs):
+    vocabularies = set(id(run.entries.docVocabulary) if run.columnar else None for run in runs)
+    return runs[0].entries.docVocabulary if len(vocabularies) == 1 and None not in vocabularies else None
+
+
+def _keys(run, topics, vocabularySize, depth):
+    """Returns the sorted keys topicCode * vocabularySize + docCode of the first depth entries of each topic
+    of the (columnar) run; topic codes are assigned by the Vocabulary topics."""
+    entries = run.entries
+    rows = np.fromiter(entries.rows.values(), dtype=np.int64, count=len(entries.rows))
+    starts, lengths = entries.offsets[rows], entries.offsets[rows + 1] - entries.offsets[rows]
+    if depth is not None: lengths = np.minimum(lengths, depth)
+    topicCodes = np.array(topics.encodeAll(entries.rows), dtype=np.int64)
+    docCodes = entries.docCodes[_spansToPositions(starts, lengths)].astype(np.int64)
+    return np.unique(np.repeat(topicCodes, lengths) * vocabularySize + docCodes)
+
+
+def _docSets(run, depth):
+    return {topicId: set(docId for docId, _, _ in run.getEntriesBy(topicId)[:depth]) for topicId in run.entries}
+
+
+def pool(runs, depth=100):
+    """Returns the pool of the runs: a dictionary pool[topicID] = set of the docIDs retrieved by at least
+    one run among its first depth entries for topicID (all of them if depth is None)."""
+    runs = list(runs)
+    vocabulary = _sharedVocabulary(runs)
+    if vocabulary is None:
+        result = {}
+        for run in runs:
+            for topicId, docIds in _docSets(run, depth).items():
+                result.setdefault(topicId, set()).update(docIds)
+        return result
+    topics, vocabularySize = Vocabulary(), max(len(vocabulary), 1)
+    keys = np.unique(np.concatenate([_keys(run, topics, vocabularySize, depth) for run in runs]))
+    topicCodes, docCodes = np.divmod(keys, vocabularySize)
+    bounds = np.searchsorted(topicCodes, np.arange(len(topics) + 1))
+    docIds = list(map(vocabulary.strings.__getitem__, docCodes.tolist()))
+    return {topicId: set(docIds[start:end]) for topicId, start, end in zip(topics.strings, bounds[:-1].tolist(),
+                                                                             bounds[1:].tolist())}
+
+
+def overlap(run0, run1, depth=None):
+    """Returns a dictionary overlap[topicID] = Jaccard index (size of the intersection over size of the
+    union) of the sets of docIDs retrieved among their first depth entries (all of them if depth is None)
+    by run0 and run1, for each topicID retrieved by both runs."""
+    vocabulary = _sharedVocabulary([run0, run1])
+    if vocabulary is None:
+        docSets0, docSets1 = _docSets(run0, depth), _docSets(run1, depth)
+        return {topicId: len(docIds & docSets1[topicId]) / len(docIds | docSets1[topicId])
+                for topicId, docIds in docSets0.items() if topicId in docSets1 and (docIds or docSets1[topicId])}
+    topics, vocabularySize = Vocabulary(), max(len(vocabulary), 1)
+    keys0, keys1 = _keys(run0, topics, vocabularySize, depth), _keys(run1, topics, vocabularySize, depth)
+    counts0 = np.bincount(keys0 // vocabularySize, minlength=len(topics))
+    counts1 = np.bincount(keys1 // vocabularySize, minlength=len(topics))
+    shared = np.bincount(np.intersect1d(keys0, keys1, assume_unique=True) // vocabularySize, minlength=len(topics))
+    union = counts0 + counts1 - shared
+    both = np.zeros(len(topics), dtype=bool)
+    both[[topics.lookup(topicId) for topicId in run1.entries if topicId in run0.entries]] = True
+    both &= union > 0
+    return {topics.strings[code]: ratio for code, ratio in zip(np.flatnonzero(both).tolist(),
+                                                               (shared[both] / union[both]).tolist())}
@@ -1,6 +1,32 @@
+import hashlib
+import pickle
+from types import MappingProxyType
+
+import numpy as np
+
+from pytrec_eval import cache
+from pytrec_eval.compression import openFile
+from pytrec_eval.instrumentation import countEntries, instrumented
+from pytrec_eval.parsing import parseQRels
+
 __author__ = 'alberto'
 
 
+class QRelsIndex:
+    """Per-topic statistics of frozen QRels, computed once:
+    nRelevant[topicID] = number of relevant documents,
+    relevant[topicID] = frozenset of the relevant docIDs,
+    docIds = sorted list of the docIDs of all judgements."""
+
+    def __init__(self, allJudgements):
+        self.nRelevant = {}
+        self.relevant = {}
+        for topicId, docsRelevance in allJudgements.items():
+            self.relevant[topicId] = frozenset(docId for docId, score in docsRelevance.items() if score >= 1)
+            self.nRelevant[topicId] = len(self.relevant[topicId])
+        self.docIds = sorted([docId for docsRelevance in allJudgements.values() for docId in docsRelevance])
+
+
 class QRels:
     """ Contains relevance judgements in TREC format.
     Relevance scores are floating points values.
@@ -13,26 +39,178 @@ class QRels:
     """
 
     # a dictionary allJudgements[topicID][docID] = relevanceScore
+    # (a read-only view of it if the qrels are frozen)
     allJudgements = None
 
-    def __init__(self, judgements):
+    # incremented by every change of the judgements made through the methods of QRels
+    version = 0
+
+    # (version, digest) of the last computed fingerprint
+    _fingerprint = None
+
+    # vocabulary shared with the runs (see TrecRun.shareVocabulary), None if there is none
+    vocabulary = None
+
+    # (version, codes) of the last result of judgementCodes
+    _judgementCodes = None
+
+    def __init__(self, judgements, bulk=False, frozen=False, cacheDir=None, vocabulary=None,
+                 contentHash=False):
         """Initialises the QRels starting from a dictionary
         judgements[topicID][docID] = relevanceScore, if judgements is such a dictionary;
-        or from an existing qrels file, if judgements is a string containing the file-name."""
+        or from an existing qrels file, if judgements is a string containing the file-name.
+        If bulk is True files are read by the block parser of pytrec_eval.parsing (which also accepts
+        whitespace-separated files, but is not faster for qrels), otherwise line by line.
+        If frozen is True the qrels are frozen (see freeze).
+        If cacheDir is not None, qrels read from files are cached in binary form in cacheDir
+        (True for pytrec_eval.cache.DEFAULT_CACHE_DIR) and loaded from there while the file is unchanged.
+        If contentHash is True cache entries are keyed by a hash of the content of the file instead of its
+        path, size and modification time (see pytrec_eval.cache.entryPath).
+        If vocabulary is not None (a pytrec_eval.Vocabulary shared with runs, see TrecRun.shareVocabulary)
+        the docIDs are encoded against it, so that runs sharing it are joined by integer codes; docIDs read
+        from files are replaced by the (identical) strings of the vocabulary, which are then stored once."""
         self.allJudgements = {}
+        self.vocabulary = vocabulary
         if type(judgements) == str:
             self.allJudgements = {}
-            self._parseFile(judgements)
+            if cacheDir is not None:
+                self._loadCached(judgements, cacheDir, bulk, contentHash)
+            else:
+                self._parseFile(judgements, bulk)
+            if vocabulary is not None: self._intern()
         elif type(judgements) == dict:
             self.allJudgements = judgements
         else:
             raise RuntimeError("QRels.__init__ accepts exactly one argument (either string or dictionary).")
+        self.frozen = False
+        self._index = None
+        if frozen: self.freeze()
+
+    @instrumented('QRels.loadCached', lambda self, *args: countEntries(self.allJudgements))
+    def _loadCached(self, fileName, cacheDir, bulk, contentHash):
+        path = cache.entryPath(fileName, 'qrels', cacheDir, contentHash, bulk=bulk)
+        cached = cache.load(path)
+        if cached is None:
+            self._parseFile(fileName, bulk)
+            lengths = [len(docsRelevance) for docsRelevance in self.allJudgements.values()]
+            cache.store(path, {'offsets': np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+                               'relevanceScores': np.array([score for docsRelevance in self.allJudgements.values()
+                                                            for score in docsRelevance.values()],
+                                                           dtype=np.float64)},
+                        {'topicIds': list(self.allJudgements),
+                         'docIds': [docId for docsRelevance in self.allJudgements.values() for docId in docsRelevance]})
+        else:
+            arrays, stringLists = cached
+            offsets, docIds = arrays['offsets'].tolist(), stringLists['docIds']
+            relevanceScores = arrays['relevanceScores'].tolist()
+            self.allJudgements = {topicId: dict(zip(docIds[start:end], relevanceScores[start:end]))
+                                  for topicId, start, end in zip(stringLists['topicIds'], offsets[:-1], offsets[1:])}
+
+    def _intern(self):
+        codes = self.vocabulary.encodeAll([docId for docsRelevance in self.allJudgements.values()
+                                           for docId in docsRelevance])
+        docIds = list(map(self.vocabulary.strings.__getitem__, codes))
+        start, judgements = 0, {}
+        for topicId, docsRelevance in self.allJudgements.items():
+            judgements[topicId] = dict(zip(docIds[start:start + len(docsRelevance)], docsRelevance.values()))
+            start += len(docsRelevance)
+        self.allJudgements = judgements
+
+    def judgementCodes(self):
+        """Returns (rows, offsets, docCodes, relevanceScores): the judgements of the topic topicID, with docIDs
+        encoded against the vocabulary of the qrels, are at positions offsets[rows[topicID]]:offsets[rows[topicID] + 1]
+        of the arrays docCodes and relevanceScores. They are computed once for each version of the judgements."""
+        if self.vocabulary is None: raise RuntimeError('The qrels have no vocabulary')
+        if self._judgementCodes is None or self._judgementCodes[0] != self.version:
+            judgements = self.allJudgements
+            lengths = [len(docsRelevance) for docsRelevance in judgements.values()]
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            docCodes = np.array(self.vocabulary.encodeAll([docId for docsRelevance in judgements.values()
+                                                           for docId in docsRelevance]), dtype=np.int64)
+            relevanceScores = np.array([score for docsRelevance in judgements.values()
+                                        for score in docsRelevance.values()], dtype=np.float64)
+            rows = {topicId: row for row, topicId in enumerate(judgements)}
+            self._judgementCodes = (self.version, (rows, offsets, docCodes, relevanceScores))
+        return self._judgementCodes[1]
+
+    def freeze(self):
+        """Freezes the qrels: allJudgements becomes a read-only view of the judgements and the per-topic
+        statistics (see QRelsIndex) are computed once, on first use, and read by all methods.
+        Judgements can still be changed through setRelevanceScore and removeTopic, which invalidate
+        the statistics. Note that the view does not protect a dictionary given to the constructor
+        from changes made through other references."""
+        if self.frozen: return
+        self._judgements = self.allJudgements
+        self.allJudgements = MappingProxyType({topicId: MappingProxyType(docsRelevance)
+                                               for topicId, docsRelevance in self._judgements.items()})
+        self.frozen = True
+        self._index = None
+
+    def getIndex(self):
+        """Returns the QRelsIndex of frozen qrels (building it if needed), None if the qrels are not frozen."""
+        if self.frozen and self._index is None:
+            self._index = QRelsIndex(self.allJudgements)
+        return self._index
+
+    def setRelevanceScore(self, topicId, docId, relevanceScore):
+        """Sets the relevance score of docId for topicId."""
+        judgements = self._judgements if self.frozen else self.allJudgements
+        if topicId not in judgements:
+            judgements[topicId] = {}
+            if self.frozen: self._refreshView()
+        judgements[topicId][docId] = relevanceScore
+        self.version += 1
+        self._index = None
+
+    def removeTopic(self, topicId):
+        """Removes all the judgements of topicId."""
+        (self._judgements if self.frozen else self.allJudgements).pop(topicId, None)
+        if self.frozen: self._refreshView()
+        self._index = None
+        self.version += 1
+
+    def fingerprint(self):
+        """Returns a digest (hex string) of the judgements, which changes whenever the judgements do.
+        It is recomputed only after changes made through the methods of QRels (e.g., setRelevanceScore,
+        removeTopic); changes made by modifying allJudgements directly are not detected."""
+        if self._fingerprint is None or self._fingerprint[0] != self.version:
+            judgements = self._judgements if self.frozen else self.allJudgements
+            self._fingerprint = (self.version, hashlib.sha1(pickle.dumps(judgements, protocol=4)).hexdigest())
+        return self._fingerprint[1]
+
+    def subset(self, topicIds):
+        """Returns new QRels containing only the judgements of the topics in topicIds (judgements are shared)."""
+        judgements = self._judgements if self.frozen else self.allJudgements
+        return QRels({topicId: judgements[topicId] for topicId in topicIds if topicId in judgements},
+                     vocabulary=self.vocabulary)
+
+    def _refreshView(self):
+        self.allJudgements = MappingProxyType({topicId: MappingProxyType(docsRelevance)
+                                               for topicId, docsRelevance in self._judgements.items()})
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.frozen:
+            state['allJudgements'] = state.pop('_judgements')
+        state['_index'] = None
+        state['_judgementCodes'] = None
+        return state
+
+    def __setstate__(self, state):
+        frozen = state.pop('frozen')
+        self.__dict__.update(state, frozen=False)
+        if frozen: self.freeze()
 
     def getDocIds(self):
+        index = self.getIndex()
+        if index is not None: return list(index.docIds)
         return sorted([docId for _, docsRelevance in self.allJudgements.items() for docId in docsRelevance])
 
     def getNRelevant(self, topicId):
         """Returns the number of relevant documents for the specified topicID"""
+        index = self.getIndex()
+        if index is not None: return index.nRelevant.get(topicId, 0)
         if topicId not in self.allJudgements: return 0
         return len([t for t, relevance in self.allJudgements[topicId].items() if relevance >= 1])
 
@@ -46,6 +224,8 @@ class QRels:
 
     def getAllRelevants(self, topicId):
         """ Returns a set containing all relevants docIds for the specified topic"""
+        index = self.getIndex()
+        if index is not None: return set(index.relevant[topicId])
         return {docId for docId, score in self.allJudgements[topicId].items()
                 if score >= 1}
 
@@ -77,14 +257,24 @@ class QRels:
         return len(self.allJudgements)
 
     def write(self, streamOut):
-        """Writes the qrels into a stream using TREC-format for qrels"""
+        """Writes the qrels into a stream using TREC-format for qrels.
+        If streamOut is a file name the qrels are written into that file, compressed according to
+        its extension (see pytrec_eval.compression)."""
+        if type(streamOut) == str:
+            with openFile(streamOut, 'w') as f:
+                return self.write(f)
         for topicId, dictDocs in self.allJudgements.items():
             for docId, relevanceScore in dictDocs.items():
                 streamOut.write('{}\t0\t{}\t{}\n'.format(topicId, docId, relevanceScore))
 
-    def _parseFile(self, otherQRelsPath):
-        """Initialises the structure by reading and existing trelsFile"""
-        fQRels = open(otherQRelsPath, 'r', encoding='utf-8')
+    @instrumented('QRels.parse', lambda self, *args: countEntries(self.allJudgements))
+    def _parseFile(self, otherQRelsPath, bulk=False):
+        """Initialises the structure by reading and existing trelsFile
+        (with the block parser of pytrec_eval.parsing if bulk is True)"""
+        if bulk:
+            self.allJudgements = parseQRels(otherQRelsPath)
+            return
+        fQRels = openFile(otherQRelsPath)
         for line in fQRels:
             line = line.strip()
             if line == '': continue
@@ -2,13 +2,18 @@ __author__ = 'alberto'
 
 import pytrec_eval
 import scipy.stats as stats
+from pytrec_eval.parallel import evaluateRuns
 
-def rankRuns(runs, qrels, measure):
+def rankRuns(runs, qrels, measure, processes=1):
     """Ranks the runs based on measure.
      Returns a list of pairs (run, score) ordered by
      score descending.
+     runs may also contain names of run files; if processes > 1 runs are parsed
+     and evaluated by up to processes worker processes.
     """
-    rank = [ (run, pytrec_eval.evaluate(run, qrels, [measure])[0]) for run in runs ]
+    runs = list(runs)
+    results = evaluateRuns(runs, qrels, [measure], processes=processes, returnRuns=True)
+    rank = [ (run if type(run) != str else parsed, scores[0]) for run, (parsed, scores) in zip(runs, results) ]
     rank.sort(key= lambda x : x[1], reverse=True)
     return rank
 
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from pytrec_eval.engine import JoinedRun
+
+__author__ = 'alberto'
+
+
+# Vectorized interpolated recall-precision curves.
+# The run is joined against the qrels once (see pytrec_eval.engine.JoinedRun); for every entry
+# of every topic the recall and the precision at its rank come from the cumulative number of
+# relevant entries. Each entry raises the precision of its recall level (recall * intervals,
+# truncated; also of the previous level when the recall is exactly on its boundary) through a
+# single maximum.at over a topics x levels table, and the precision is interpolated by a
+# reverse cumulative maximum along the levels. With intervals=10 the curves are exactly the
+# 11-point curves of the original per-topic implementation. Topics are those of the qrels (in
+# order); topics without relevant documents or not retrieved by the run have a curve of zeros.
+
+DEFAULT_INTERVALS = 10
+
+
+class RecallPrecisionCurves:
+    """Interpolated precisions (precisions[t, l]) of each topic topicIds[t] of the qrels at the
+    recall levels recallLevels[l] = l / intervals, for the run named name."""
+
+    def __init__(self, run, qrels, intervals=DEFAULT_INTERVALS):
+        self.name = run.name
+        self.intervals = intervals
+        self.recallLevels = np.arange(intervals + 1) / intervals
+        joined = JoinedRun(run, qrels)
+        self.topicIds = joined.qrelsTopicIds
+        qrelsRows = {topicId: row for row, topicId in enumerate(self.topicIds)}
+        # row in the table of each run topic, -1 for the topics that are not in the qrels
+        rows = np.array([qrelsRows.get(topicId, -1) for topicId in joined.topicIds], dtype=np.int64)
+        entryRows, entryNRelevant = rows[joined.topicRows()], joined.nRelevant[joined.topicRows()]
+        evaluated = (entryRows >= 0) & (entryNRelevant > 0)
+        cumRelevant = joined.cumRelevant[evaluated]
+        recalls = cumRelevant / entryNRelevant[evaluated]
+        precisions = cumRelevant / joined.ranks[evaluated]
+        entryRows = entryRows[evaluated]
+        levels = (recalls * intervals).astype(np.int64)
+        table = np.zeros((len(self.topicIds), intervals + 1), dtype=np.float64)
+        np.maximum.at(table, (entryRows, levels), precisions)
+        onBoundary = (recalls == levels / intervals) & (levels > 0)
+        np.maximum.at(table, (entryRows[onBoundary], levels[onBoundary] - 1), precisions[onBoundary])
+        self.precisions = np.maximum.accumulate(table[:, ::-1], axis=1)[:, ::-1]
+
+    def average(self):
+        """Returns the interpolated precision at each recall level averaged over the topics of the qrels."""
+        # rows are added one after the other, in topic order
+        return np.add.reduce(self.precisions, axis=0) / len(self.topicIds)
+
+    def topic(self, topicId):
+        """Returns the interpolated precisions of topicId as a list."""
+        return self.precisions[self.topicIds.index(topicId)].tolist()
+
+    def toDataFrame(self):
+        """Returns a DataFrame with one row per topic and one column per recall level."""
+        return pd.DataFrame(self.precisions, index=self.topicIds, columns=self.recallLevels)
+
+
+def recallPrecisionTable(runs, qrels, intervals=DEFAULT_INTERVALS, perTopic=False):
+    """Returns a DataFrame with one row per run (TrecRun s or RecallPrecisionCurves) and one column per
+    recall level containing the average interpolated precisions or, if perTopic is True, one row per
+    pair (run, topic) containing the interpolated precisions of the topic."""
+    curvesList = [run if isinstance(run, RecallPrecisionCurves) else RecallPrecisionCurves(run, qrels, intervals)
+                  for run in runs]
+    if not curvesList: raise ValueError('No runs')
+    recallLevels = curvesList[0].recallLevels
+    if not perTopic:
+        return pd.DataFrame([curves.average() for curves in curvesList], index=[curves.name for curves in curvesList],
+                            columns=recallLevels)
+    index = pd.MultiIndex.from_arrays([np.repeat([curves.name for curves in curvesList],
+                                                 [len(curves.topicIds) for curves in curvesList]),
+                                       [topicId for curves in curvesList for topicId in curves.topicIds]],
+                                      names=['run', 'topicId'])
+    return pd.DataFrame(np.concatenate([curves.precisions for curves in curvesList]), index=index,
+                        columns=recallLevels)
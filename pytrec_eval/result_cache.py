@@ -0,0 +1,160 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+from pytrec_eval import cache
+
+__author__ = 'alberto'
+
+
+# Memoization of the results of pytrec_eval.evaluate.
+# Once enabled (see enableResultCache), evaluate looks up the result of each measure by the
+# fingerprints of the run and of the qrels (TrecRun.fingerprint, QRels.fingerprint), the key
+# of the measure (see metricKey) and the detailed flag. Results are kept in a bounded LRU in
+# memory and, optionally, in a directory on disk shared with pytrec_eval.cache (one pickle
+# file per result). Fingerprints change whenever runs and qrels are modified through their
+# methods (removeEntries, restrictTopicsTo, setRelevanceScore, ...), which invalidates their
+# results.
+# Measures without a key are not memoized. Keys identify a metric by its name and a digest of
+# its bytecode and constants, hence redefining a metric (e.g., in a notebook) invalidates its
+# results; lambdas and nested functions are memoized only if they have an explicit cacheKey.
+# Changes to the functions a metric calls are not detected.
+
+# the cache used by evaluate (None if disabled)
+current = None
+
+_SIMPLE_TYPES = (int, float, str, bool, type(None))
+
+# the disk tier is trimmed to maxBytes every EVICTION_PERIOD stores
+EVICTION_PERIOD = 64
+
+
+def _codeDigest(code, digest):
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        # nested code objects (e.g., comprehensions) are digested, as their repr contains their address
+        if type(const) == type(code):
+            _codeDigest(const, digest)
+        elif type(const) == frozenset:
+            # the order of the elements depends on the hash seed of the process
+            digest.update(repr(sorted(map(repr, const))).encode('utf-8'))
+        else:
+            digest.update(repr(const).encode('utf-8'))
+
+
+def metricKey(measure):
+    """Returns a hashable key identifying the values computed by measure: its attribute cacheKey, if any,
+    otherwise its module, qualified name, a digest of its code and the values captured by its closure.
+    Returns None for lambdas and nested functions (which are told apart by their code only), for
+    objects without code and if the closure captures values other than numbers and strings."""
+    key = getattr(measure, 'cacheKey', None)
+    if key is not None: return key
+    qualname = getattr(measure, '__qualname__', None)
+    code = getattr(measure, '__code__', None)
+    if qualname is None or code is None or '<lambda>' in qualname or '<locals>' in qualname: return None
+    try:
+        values = tuple(cell.cell_contents for cell in measure.__closure__ or ())
+    except ValueError:
+        return None
+    if not all(type(value) in _SIMPLE_TYPES for value in values): return None
+    digest = hashlib.sha1()
+    _codeDigest(code, digest)
+    return (measure.__module__, qualname, digest.hexdigest()) + values
+
+
+def _copy(result):
+    # details are copied since callers may modify them
+    return (result[0], dict(result[1])) if type(result) == tuple else result
+
+
+class ResultCache:
+    """LRU cache of at most maxEntries results in memory, backed by the directory cacheDir if it
+    is not None (True for pytrec_eval.cache.DEFAULT_CACHE_DIR, which takes at most maxBytes bytes)."""
+
+    def __init__(self, maxEntries=1024, cacheDir=None, maxBytes=cache.DEFAULT_MAX_BYTES):
+        self.maxEntries = maxEntries
+        self.cacheDir = None if cacheDir is None else cache._cacheDir(cacheDir)
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._stores = 0
+
+    def key(self, run, qrels, measure, detailed):
+        """Returns the key of the result of measure on run and qrels, or None if the result cannot be cached."""
+        measureKey = metricKey(measure)
+        if measureKey is None: return None
+        return run.fingerprint(), qrels.fingerprint(), measureKey, bool(detailed)
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, 'result-' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        """Returns (a copy of) the result stored with key, or None if there is none."""
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+        elif self.cacheDir is not None:
+            result = self._load(key)
+            if result is not None: self._remember(key, result)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _copy(result)
+
+    def put(self, key, result):
+        """Stores (a copy of) result with key."""
+        result = _copy(result)
+        self._remember(key, result)
+        if self.cacheDir is not None: self._store(key, result)
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                storedKey, result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if storedKey != key: return None
+        os.utime(path)  # for the LRU eviction
+        return result
+
+    def _store(self, key, result):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, result), f, protocol=4)
+            os.replace(tmpPath, self._path(key))
+        except OSError:
+            if os.path.exists(tmpPath): os.remove(tmpPath)
+            raise
+        self._stores += 1
+        if self._stores % EVICTION_PERIOD == 0: cache.evict(self.cacheDir, self.maxBytes)
+
+    def clear(self):
+        """Removes all the results kept in memory (results on disk are removed by pytrec_eval.cache.clear)."""
+        self._entries.clear()
+
+
+def enableResultCache(maxEntries=1024, cacheDir=None, maxBytes=cache.DEFAULT_MAX_BYTES):
+    """Makes pytrec_eval.evaluate (and all the functions using it) memoize its results in a new ResultCache,
+    which is returned."""
+    global current
+    current = ResultCache(maxEntries, cacheDir, maxBytes)
+    return current
+
+
+def disableResultCache():
+    """Stops the memoization of the results of pytrec_eval.evaluate."""
+    global current
+    current = None
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from pytrec_eval.parallel import evaluateRuns
+from pytrec_eval.vocabulary import Vocabulary
+
+__author__ = 'alberto'
+
+
+# Columnar container of the results of the evaluation of many runs.
+# The per-topic scores are kept in a single topics x runs x measures NumPy array (NaN where a
+# measure has no score for a topic of a run, e.g. topics not retrieved by the run) and the
+# averages in a runs x measures array. Topics, runs and measures are identified by their index
+# in topicIds (topics in order of first appearance), runNames and measureNames, so that exports
+# never create one Python object per cell: wide DataFrames are views of the array and the
+# identifiers of long DataFrames and Arrow tables are categorical (dictionary-encoded) columns.
+# Arrow and Parquet exports require the pyarrow package.
+
+
+class EvaluationResults:
+    """scores[t, r, m] is the score of the run runNames[r] for the topic topicIds[t] according to
+    the measure measureNames[m] (NaN if not computed); averages[r, m] is what pytrec_eval.evaluate
+    returns for the run and the measure."""
+
+    def __init__(self, topicIds, runNames, measureNames, scores, averages):
+        self.topicIds = list(topicIds)
+        self.runNames = list(runNames)
+        self.measureNames = list(measureNames)
+        self.scores = scores
+        self.averages = averages
+
+    @classmethod
+    def fromRuns(cls, runs, qrels, measures, processes=1, threads=1, **runKwargs):
+        """Evaluates the runs (TrecRun s or names of run files, parsed with runKwargs) as
+        pytrec_eval.evaluateRuns does and returns their results."""
+        measureList = measures if type(measures) == list else [measures]
+        results = evaluateRuns(runs, qrels, measureList, True, processes, threads=threads, **runKwargs)
+        return cls.fromResults(results, [measure.__name__ for measure in measureList])
+
+    @classmethod
+    def fromResults(cls, results, measureNames):
+        """Builds the container from a list of pairs (runName, [(avg, details) for each measure]),
+        as returned by pytrec_eval.evaluateRuns with detailed=True."""
+        topics = Vocabulary()
+        runNames, averages, columns = [], [], []
+        for r, (name, measureResults) in enumerate(results):
+            runNames.append(name)
+            averages.append([avg for avg, _ in measureResults])
+            for m, (_, details) in enumerate(measureResults):
+                codes = np.array(topics.encodeAll(details), dtype=np.int64)
+                columns.append((r, m, codes, np.fromiter(details.values(), dtype=np.float64, count=len(details))))
+        scores = np.full((len(topics), len(runNames), len(measureNames)), np.nan)
+        for r, m, codes, values in columns:
+            scores[codes, r, m] = values
+        averages = np.array(averages, dtype=np.float64).reshape(len(runNames), len(measureNames))
+        return cls(topics.strings, runNames, measureNames, scores, averages)
+
+    def _measureIndex(self, measure):
+        name = measure if type(measure) == str else measure.__name__
+        if name not in self.measureNames: raise KeyError('Unknown measure ' + name)
+        return self.measureNames.index(name)
+
+    def averagesFrame(self):
+        """Returns a DataFrame with one row per run and one column per measure (see df_evaluateAll)."""
+        return pd.DataFrame(self.averages, index=self.runNames, columns=self.measureNames, copy=False)
+
+    def toWide(self, measure=None):
+        """Returns a DataFrame with one row per topic and one column per run with the scores of measure
+        (a measure or its name) or, if measure is None, one column per pair (run, measure)."""
+        if measure is not None:
+            return pd.DataFrame(self.scores[:, :, self._measureIndex(measure)], index=self.topicIds,
+                                columns=self.runNames, copy=False)
+        columns = pd.MultiIndex.from_product([self.runNames, self.measureNames], names=['run', 'measure'])
+        return pd.DataFrame(self.scores.reshape(len(self.topicIds), -1), index=self.topicIds, columns=columns,
+                            copy=False)
+
+    def _longColumns(self, dropMissing):
+        if len(set(self.runNames)) != len(self.runNames): raise ValueError('The names of the runs are not distinct')
+        nTopics, nRuns, nMeasures = self.scores.shape
+        # scores.ravel() is in (topic, run, measure) order
+        topicCodes = np.repeat(np.arange(nTopics, dtype=np.int32), nRuns * nMeasures)
+        runCodes = np.tile(np.repeat(np.arange(nRuns, dtype=np.int32), nMeasures), nTopics)
+        measureCodes = np.tile(np.arange(nMeasures, dtype=np.int32), nTopics * nRuns)
+        values = self.scores.ravel()
+        if dropMissing:
+            found = ~np.isnan(values)
+            topicCodes, runCodes, measureCodes, values = (topicCodes[found], runCodes[found], measureCodes[found],
+                                                          values[found])
+        return topicCodes, runCodes, measureCodes, values
+
+    def toLong(self, dropMissing=True):
+        """Returns a DataFrame with columns topicId, run, measure (categorical) and score, with one row per
+        score (scores that were not computed are dropped if dropMissing is True)."""
+        topicCodes, runCodes, measureCodes, values = self._longColumns(dropMissing)
+        return pd.DataFrame({'topicId': pd.Categorical.from_codes(topicCodes, self.topicIds),
+                             'run': pd.Categorical.from_codes(runCodes, self.runNames),
+                             'measure': pd.Categorical.from_codes(measureCodes, self.measureNames),
+                             'score': values})
+
+    def toArrow(self, dropMissing=True):
+        """Returns the long format (see toLong) as a pyarrow Table with dictionary-encoded identifiers."""
+        pa = _pyarrow()
+        topicCodes, runCodes, measureCodes, values = self._longColumns(dropMissing)
+        columns = [pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(strings, type=pa.string()))
+                   for codes, strings in ((topicCodes, self.topicIds), (runCodes, self.runNames),
+                                          (measureCodes, self.measureNames))]
+        return pa.Table.from_arrays(columns + [pa.array(values)], names=['topicId', 'run', 'measure', 'score'])
+
+    def toParquet(self, fileName, dropMissing=True):
+        """Writes the long format (see toArrow) into the Parquet file fileName."""
+        table = self.toArrow(dropMissing)
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, fileName)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError('Exporting results to Arrow or Parquet requires the pyarrow package')
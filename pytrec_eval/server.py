@@ -0,0 +1,209 @@
+import argparse
+import io
+import json
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytrec_eval
+from pytrec_eval.metrics import parseMeasure
+from pytrec_eval_client import DEFAULT_PORT
+
+__author__ = 'alberto'
+
+
+# Local evaluation server.
+# A long-lived process (python -m pytrec_eval.server --qrels name=fileName ...) keeps named,
+# frozen qrels in memory and evaluates runs sent by EvaluationClient (see pytrec_eval_client,
+# which does not import pytrec_eval) or by any HTTP client through a JSON API on localhost, so
+# that each evaluation pays neither the import of pytrec_eval nor the parsing of the qrels.
+# Requests are served by a pool of threads. Runs are given either as file names (read by the
+# server) or in the body of the request (Content-Type text/plain), which is parsed while it is
+# received; the other parameters are then given in the query string (lists by repeating them).
+# Measures are given by name (see pytrec_eval.metrics.parseMeasure).
+#   GET  /qrels                         names of the loaded qrels
+#   POST /qrels     {name, fileName}    loads (or replaces) qrels
+#   POST /evaluate  {qrels, run, measures, detailed}  {name, results: [score or [score, details]]}
+#   POST /evaluate?qrels=&name=&measures=&detailed=  (run in the body)
+#   POST /rank      {qrels, runs, measure}            [[name, score]] (see rankRuns)
+#   POST /ttest     {qrels, run, others, measure}     {name: p-value} (see ttest)
+#   POST /ttest?qrels=&name=&others=&measure=        (run in the body)
+# Errors are answered with status 400 (bad requests) or 500 and a JSON object {error}.
+# The server has no authentication: it binds to 127.0.0.1 and reads any file it is asked to.
+
+DEFAULT_WORKERS = 4
+
+
+class EvaluationServer(HTTPServer):
+    """HTTP server evaluating runs against the qrels in self.qrels (qrels[name] = QRels)
+    with a pool of workers threads."""
+
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT), workers=DEFAULT_WORKERS, columnar=True):
+        super().__init__(address, _Handler)
+        self.qrels = {}
+        self.columnar = columnar
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+
+    def loadQRels(self, name, fileName):
+        """Loads (frozen) qrels from fileName and serves them as name."""
+        qrels = pytrec_eval.QRels(fileName, frozen=True)
+        with self._lock:
+            self.qrels[name] = qrels
+
+    def process_request(self, request, clientAddress):
+        self._executor.submit(self._processRequest, request, clientAddress)
+
+    def _processRequest(self, request, clientAddress):
+        try:
+            self.finish_request(request, clientAddress)
+        except Exception:
+            self.handle_error(request, clientAddress)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+    # request handlers: they receive the JSON body and return the JSON answer
+
+    def _getQRels(self, request):
+        name = request.get('qrels')
+        with self._lock:
+            if name not in self.qrels: raise KeyError('Unknown qrels ' + str(name))
+            return self.qrels[name]
+
+    def _getRun(self, request, key='run'):
+        if 'runStream' in request and key == 'run':
+            return pytrec_eval.TrecRun(request['runStream'], request.get('name', 'run'), columnar=self.columnar)
+        fileName = request.get(key)
+        if type(fileName) != str: raise ValueError('Missing ' + key)
+        return pytrec_eval.TrecRun(fileName, columnar=self.columnar)
+
+    def _getMeasure(self, request):
+        return parseMeasure(request.get('measure', 'avgPrec'))
+
+    def handleQRels(self, request):
+        self.loadQRels(request['name'], request['fileName'])
+        return {'name': request['name']}
+
+    def handleEvaluate(self, request):
+        qrels, run = self._getQRels(request), self._getRun(request)
+        measures = [parseMeasure(name) for name in request.get('measures', ['avgPrec', 'ndcg'])]
+        results = pytrec_eval.evaluate(run, qrels, measures, request.get('detailed', False) in (True, 'True', 'true'))
+        return {'name': run.name, 'results': results}
+
+    def handleRank(self, request):
+        qrels, measure = self._getQRels(request), self._getMeasure(request)
+        runs = [pytrec_eval.TrecRun(fileName, columnar=self.columnar) for fileName in request['runs']]
+        return [[run.name, score] for run, score in pytrec_eval.rankRuns(runs, qrels, measure)]
+
+    def handleTTest(self, request):
+        qrels, measure = self._getQRels(request), self._getMeasure(request)
+        others = [pytrec_eval.TrecRun(fileName, columnar=self.columnar) for fileName in request['others']]
+        return pytrec_eval.ttest(self._getRun(request), others, qrels, measure)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    _POST = {'/qrels': 'handleQRels', '/evaluate': 'handleEvaluate', '/rank': 'handleRank', '/ttest': 'handleTTest'}
+
+    # parameters given as lists in query strings
+    _LISTS = {'measures', 'runs', 'others'}
+
+    def do_GET(self):
+        if self.path == '/qrels':
+            with self.server._lock:
+                self._answer(200, sorted(self.server.qrels))
+        else:
+            self._answer(404, {'error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        handler = self._POST.get(url.path)
+        if handler is None: return self._answer(404, {'error': 'Unknown path ' + url.path})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if self.headers.get_content_type() == 'text/plain':
+                # the body may be left unread by errors
+                self.close_connection = True
+                request = {key: values if key in self._LISTS else values[-1]
+                           for key, values in urllib.parse.parse_qs(url.query).items()}
+                request['runStream'] = io.TextIOWrapper(io.BufferedReader(_Body(self.rfile, length)),
+                                                        encoding='utf-8')
+            else:
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+            answer = getattr(self.server, handler)(request)
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            return self._answer(400, {'error': '{}: {}'.format(type(e).__name__, e)})
+        except Exception as e:
+            return self._answer(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            # raised by the parsers of runs ('Unparsable run')
+            return self._answer(400, {'error': '{}: {}'.format(type(e).__name__, e)})
+        self._answer(200, answer)
+
+    def _answer(self, status, answer):
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Body(io.RawIOBase):
+    """The first length bytes of stream (the body of a request); closing it leaves stream open."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.remaining <= 0: return 0
+        n = self.stream.readinto(memoryview(buffer)[:self.remaining])
+        self.remaining -= n
+        return n
+
+
+def serve(qrels, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, host='127.0.0.1'):
+    """Loads the qrels (a dictionary qrels[name] = fileName) and serves them until interrupted."""
+    server = EvaluationServer((host, port), workers)
+    for name, fileName in qrels.items():
+        server.loadQRels(name, fileName)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pytrec_eval evaluation server')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--qrels', action='append', default=[], metavar='NAME=FILE',
+                        help='qrels to load at start-up (may be repeated)')
+    args = parser.parse_args(argv)
+    qrels = {}
+    for spec in args.qrels:
+        name, _, fileName = spec.partition('=')
+        if not fileName: parser.error('--qrels expects NAME=FILE')
+        qrels[name] = fileName
+    serve(qrels, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import pytrec_eval
+from pytrec_eval import parallel
+from pytrec_eval.engine import JoinedRun
+from pytrec_eval.incremental import detailsOrder
+from pytrec_eval.trecrun import TrecRun
+
+__author__ = 'alberto'
+
+
+# Sharded (map-reduce) evaluation of runs split by topic.
+# Each shard is a run over a subset of the topics, evaluated against the slice of the qrels
+# it is responsible for (by default, the qrels of its topics): evaluateShard computes the
+# per-topic scores of each measure and the share of its denominator (the number of qrels
+# topics for most metrics, the number of topics with relevant documents for recall) through
+# the details kernels of the measures (see pytrec_eval.engine), and returns them as a
+# PartialResult, which is small and serializable (pickle or toDict). PartialResult.merge
+# combines any number of partials and results() aggregates them. To obtain exactly the results
+# of pytrec_eval.evaluate, scores are summed in the same order: the order of the topics of the
+# run (the concatenation of the shards, in the order of the merged partials) for metrics like
+# avgPrec and ndcg, the order of the topics of the qrels (if given to results) for metrics
+# like precision and recall, which are computed for every qrels topic (see detailsOrder).
+# The qrels slices of the partials must not overlap and, to evaluate against the whole qrels,
+# must cover all its topics: qrels topics retrieved by no shard can be covered by a shard
+# with an empty run (as evaluateSharded does).
+
+
+class PartialResult:
+    """Per-topic scores (details[i][topicId]) and share of the denominator (denominators[i]) of the
+    i-th measure in measureNames, computed on a shard with run topics topicIds and qrels topics
+    qrelsTopicIds. orders[i] is the detailsOrder of the i-th measure."""
+
+    def __init__(self, measureNames, details, denominators, topicIds, qrelsTopicIds, orders):
+        self.measureNames = list(measureNames)
+        self.orders = list(orders)
+        self.details = details
+        self.denominators = denominators
+        self.topicIds = list(topicIds)
+        self.qrelsTopicIds = list(qrelsTopicIds)
+
+    @classmethod
+    def merge(cls, partials):
+        """Returns the PartialResult of the union of the shards of partials (in their order).
+        Raises ValueError if the partials have different measures or share some topic."""
+        partials = list(partials)
+        if not partials: raise ValueError('No partial results to merge')
+        measureNames = partials[0].measureNames
+        details = [{} for _ in measureNames]
+        denominators = [0] * len(measureNames)
+        topicIds, qrelsTopicIds = [], []
+        seenTopics, seenQRelsTopics = set(), set()
+        for partial in partials:
+            if partial.measureNames != measureNames:
+                raise ValueError('Partial results of different measures: {} and {}'.format(measureNames,
+                                                                                      partial.measureNames))
+            for seen, ids, kind in ((seenTopics, partial.topicIds, 'run'), (seenQRelsTopics, partial.qrelsTopicIds,
+                                                                             'qrels')):
+                overlap = seen.intersection(ids)
+                if overlap: raise ValueError('The {} topic {} is in more than one shard'.format(kind, min(overlap)))
+                seen.update(ids)
+            for i in range(len(measureNames)):
+                details[i].update(partial.details[i])
+                denominators[i] += partial.denominators[i]
+            topicIds.extend(partial.topicIds)
+            qrelsTopicIds.extend(partial.qrelsTopicIds)
+        return cls(measureNames, details, denominators, topicIds, qrelsTopicIds, partials[0].orders)
+
+    def results(self, detailed=False, qrelsTopicIds=None):
+        """Returns a list with what pytrec_eval.evaluate returns for each measure. If qrelsTopicIds
+        (the topics of the whole qrels, in order) is not None the scores of the metrics computed for
+        every qrels topic are aggregated in that order, as pytrec_eval.evaluate does."""
+        results = []
+        for details, denominator, order in zip(self.details, self.denominators, self.orders):
+            if order == 'qrels' and qrelsTopicIds is not None:
+                details = {topicId: details[topicId] for topicId in qrelsTopicIds if topicId in details}
+            avg = sum(details.values()) / denominator
+            results.append((avg, dict(details)) if detailed else avg)
+        return results
+
+    def toDict(self):
+        """Returns the partial result as a dictionary of lists, strings and numbers (e.g., for JSON)."""
+        return {'measureNames': self.measureNames, 'details': [list(d.items()) for d in self.details],
+                'denominators': self.denominators, 'topicIds': self.topicIds, 'qrelsTopicIds': self.qrelsTopicIds,
+                'orders': self.orders}
+
+    @classmethod
+    def fromDict(cls, d):
+        """Inverse of toDict."""
+        return cls(d['measureNames'], [dict(map(tuple, items)) for items in d['details']], d['denominators'],
+                   d['topicIds'], d['qrelsTopicIds'], d['orders'])
+
+
+def evaluateShard(run, qrels, measures=pytrec_eval.STD_METRICS, qrelsTopicIds=None):
+    """Evaluates the shard run against the slice of qrels made of the topics qrelsTopicIds (the topics
+    of run if None). Measures must have a details kernel. Returns a PartialResult."""
+    measureList = measures if type(measures) == list else [measures]
+    for measure in measureList:
+        if not hasattr(measure, 'detailsKernel'):
+            raise ValueError(measure.__name__ + ' cannot be evaluated by shards (no detailsKernel)')
+    qrelsSlice = qrels.subset(run.getTopicIds() if qrelsTopicIds is None else qrelsTopicIds)
+    joined = JoinedRun(run, qrelsSlice)
+    details, denominators = [], []
+    for measure in measureList:
+        measureDetails, denominator = measure.detailsKernel(joined)
+        details.append(measureDetails)
+        denominators.append(denominator)
+    return PartialResult([measure.__name__ for measure in measureList], details, denominators,
+                         run.getTopicIds(), qrelsSlice.getTopicIds(), [detailsOrder(measure) for measure in measureList])
+
+
+def _shardTask(i, shard=None):
+    qrels, measures, shards, _, _, runKwargs = parallel._shared
+    shard = shards[i] if shard is None else shard
+    return evaluateShard(TrecRun(shard, **runKwargs) if type(shard) == str else shard, qrels, measures)
+
+
+def evaluateSharded(shards, qrels, measures=pytrec_eval.STD_METRICS, detailed=False, processes=1, **runKwargs):
+    """Evaluates the run made of the shards in shards (TrecRun s or names of run files, parsed with
+    runKwargs; each topic must be in one shard only) by mapping evaluateShard on up to processes worker
+    processes and reducing the partial results. Returns the same results as pytrec_eval.evaluate on
+    the concatenation of the shards."""
+    measureList = measures if type(measures) == list else [measures]
+    shards = list(shards)
+    if processes > 1:
+        partials = parallel._map(_shardTask, shards, (qrels, measureList, None, detailed, False, runKwargs),
+                                 processes)
+    else:
+        partials = [evaluateShard(TrecRun(shard, **runKwargs) if type(shard) == str else shard, qrels, measureList)
+                    for shard in shards]
+    # the qrels topics retrieved by no shard
+    covered = set(topicId for partial in partials for topicId in partial.qrelsTopicIds)
+    partials.append(evaluateShard(TrecRun({}), qrels, measureList,
+                                  [topicId for topicId in qrels.getTopicIds() if topicId not in covered]))
+    results = PartialResult.merge(partials).results(detailed, list(qrels.getTopicIds()))
+    return results if type(measures) == list else results[0]
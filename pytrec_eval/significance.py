@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from pytrec_eval.parallel import evaluateRuns
+
+__author__ = 'alberto'
+
+
+# All-pairs significance tests.
+# Each run is evaluated once into a topics x runs score matrix; the tests compare all the
+# pairs of columns of the matrix at once. Randomization and bootstrap tests draw the
+# resamples in blocks of at most RESAMPLING_BLOCK cells (resamples x topics), which can be
+# processed by several threads (NumPy releases the GIL in matrix products).
+
+RESAMPLING_BLOCK = 1 << 22
+
+
+def scoreMatrix(runs, qrels, measure, processes=1):
+    """Evaluates each run (TrecRun s or names of run files) once with measure.
+    Returns a triple (topicIds, runNames, scores) where scores is a topics x runs matrix;
+    topics are those evaluated for at least one run and missing scores are 0."""
+    results = evaluateRuns(runs, qrels, measure, True, processes=processes)
+    topicIds = list(dict.fromkeys(topicId for _, (_, details) in results for topicId in details))
+    scores = np.array([[details.get(topicId, 0) for _, (_, details) in results] for topicId in topicIds],
+                      dtype=np.float64).reshape(len(topicIds), len(results))
+    return topicIds, [name for name, _ in results], scores
+
+
+def pairedTTestMatrix(scores):
+    """Two-tailed paired Student's t-test between all the pairs of columns of scores (topics x runs),
+    as scipy.stats.ttest_rel. Returns a runs x runs matrix of p-values (nan on the diagonal)."""
+    n, nRuns = scores.shape
+    t = np.empty((nRuns, nRuns))
+    for i in range(nRuns):
+        # the differences between run i and every run, as in scipy.stats.ttest_rel
+        differences = scores[:, i:i + 1] - scores
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t[i] = differences.mean(axis=0) / np.sqrt(np.var(differences, axis=0, ddof=1) / n)
+    pValues = 2 * stats.t.sf(np.abs(t), n - 1)
+    np.fill_diagonal(pValues, np.nan)
+    return pValues
+
+
+def _resampledMeans(scores, nResamples, draw, seed, threads):
+    """Yields the matrices (resamples x runs) of the means of the runs over blocks of resamples,
+    where draw(generator, size) returns the weights (size x topics) of a block."""
+    blockSize = max(1, RESAMPLING_BLOCK // max(1, scores.shape[0]))
+    sizes = [min(blockSize, nResamples - start) for start in range(0, nResamples, blockSize)]
+    generators = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(sizes))]
+
+    def block(i):
+        return draw(generators[i], sizes[i]) @ scores / scores.shape[0]
+
+    if threads <= 1:
+        return map(block, range(len(sizes)))
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        return list(executor.map(block, range(len(sizes))))
+    finally:
+        executor.shutdown()
+
+
+def _countExtreme(resampledMeans, observed):
+    """Counts, for each pair (i, j), the resamples whose |mean_i - mean_j| >= |observed[i, j]|."""
+    counts = np.zeros(observed.shape, dtype=np.int64)
+    for means in resampledMeans:
+        for i in range(observed.shape[0]):
+            counts[i] += (np.abs(means[:, i:i + 1] - means) >= np.abs(observed[i]) - 1e-12).sum(axis=0)
+    return counts
+
+
+def randomizationTestMatrix(scores, nPermutations=10000, seed=None, threads=1):
+    """Two-sided paired randomization (permutation) test between all the pairs of columns of
+    scores (topics x runs): the sign of the per-topic differences is flipped at random.
+    Returns a runs x runs matrix of p-values (nan on the diagonal)."""
+    means = scores.mean(axis=0)
+    observed = means[:, None] - means[None, :]
+    signs = lambda generator, size: generator.choice([-1.0, 1.0], size=(size, scores.shape[0]))
+    counts = _countExtreme(_resampledMeans(scores, nPermutations, signs, seed, threads), observed)
+    pValues = (counts + 1) / (nPermutations + 1)
+    np.fill_diagonal(pValues, np.nan)
+    return pValues
+
+
+def bootstrapTestMatrix(scores, nSamples=10000, seed=None, threads=1):
+    """Two-sided paired bootstrap test between all the pairs of columns of scores (topics x runs):
+    topics are resampled with replacement and the bootstrap distribution of the mean difference
+    is shifted to have mean 0. Returns a runs x runs matrix of p-values (nan on the diagonal)."""
+    n = scores.shape[0]
+    means = scores.mean(axis=0)
+    observed = means[:, None] - means[None, :]
+    counts = lambda generator, size: generator.multinomial(n, np.full(n, 1 / n), size=size).astype(np.float64)
+    # shifting the means of the runs shifts every difference by -observed
+    shifted = (m - means for m in _resampledMeans(scores, nSamples, counts, seed, threads))
+    pValues = (_countExtreme(shifted, observed) + 1) / (nSamples + 1)
+    np.fill_diagonal(pValues, np.nan)
+    return pValues
+
+
+def correctPValues(pValues, method='holm'):
+    """Corrects the p-values of all the pairs (i, j), i < j, of a symmetric matrix of p-values for
+    multiple comparisons. method is one of 'bonferroni', 'holm' (family-wise error rate) and
+    'fdr_bh' (Benjamini-Hochberg false discovery rate). Returns the corrected matrix."""
+    rows, columns = np.triu_indices(pValues.shape[0], k=1)
+    p = pValues[rows, columns]
+    m = len(p)
+    order = np.argsort(p, kind='stable')
+    if method == 'bonferroni':
+        corrected = p * m
+    elif method == 'holm':
+        corrected = np.empty(m)
+        corrected[order] = np.maximum.accumulate(p[order] * (m - np.arange(m)))
+    elif method == 'fdr_bh':
+        corrected = np.empty(m)
+        corrected[order] = np.minimum.accumulate((p[order] * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError('Unknown correction method ' + method)
+    result = np.full(pValues.shape, np.nan)
+    result[rows, columns] = result[columns, rows] = np.minimum(corrected, 1)
+    return result
+
+
+def significanceMatrix(runs, qrels, measure, test='ttest', correction=None, processes=1, threads=1,
+                       nResamples=10000, seed=None):
+    """Compares all the pairs of runs (TrecRun s or names of run files) on measure.
+    test is one of 'ttest' (paired t-test), 'randomization' and 'bootstrap'; correction is None or
+    a method of correctPValues. Runs are evaluated by up to processes worker processes, resamples
+    are drawn by up to threads threads.
+    Returns a DataFrame of p-values with one row and one column per run."""
+    _, runNames, scores = scoreMatrix(runs, qrels, measure, processes)
+    if test == 'ttest':
+        pValues = pairedTTestMatrix(scores)
+    elif test == 'randomization':
+        pValues = randomizationTestMatrix(scores, nResamples, seed, threads)
+    elif test == 'bootstrap':
+        pValues = bootstrapTestMatrix(scores, nResamples, seed, threads)
+    else:
+        raise ValueError('Unknown test ' + test)
+    if correction is not None:
+        pValues = correctPValues(pValues, correction)
+    return pd.DataFrame(pValues, index=runNames, columns=runNames)
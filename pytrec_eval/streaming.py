@@ -0,0 +1,168 @@
+import heapq
+import os
+import tempfile
+from itertools import groupby
+
+import pytrec_eval
+from pytrec_eval.compression import openFile
+from pytrec_eval.engine import JoinedRun
+from pytrec_eval.incremental import detailsOrder
+from pytrec_eval.trecrun import TrecRun
+
+__author__ = 'alberto'
+
+
+# Streaming evaluation of run files that do not fit in memory.
+# The run file is read as a pipeline of generators (lines -> topics -> batches of topics)
+# and each batch is scored against the qrels as soon as it is complete, so that only the
+# entries of the current batch are kept in memory. Only metrics exposing a details kernel
+# (see pytrec_eval.engine) can be evaluated this way. Before they are summed, the per-topic scores
+# are put in the order in which a full evaluation computes them (see incremental.detailsOrder),
+# so that the results are identical to the ones of pytrec_eval.evaluate.
+
+
+def _topicOf(line):
+    return line.split(None, 1)[0]
+
+
+def iterRunLines(fileName):
+    """Yields the entries of a run file as tuples (topicId, docId, score, annotation), in file order."""
+    with openFile(fileName) as f:
+        for line in f:
+            line = line.strip()
+            if line == '': continue
+            splitLine = line.split('\t') if '\t' in line else line.split()
+            if len(splitLine) == 6:
+                topicId, Q0, docId, rank, score, annotation = splitLine
+            elif len(splitLine) == 5:
+                topicId, Q0, docId, rank, score = splitLine
+                annotation = ''
+            else:
+                raise BaseException('Unparsable run')
+            yield topicId, docId, float(score), annotation
+
+
+def iterRunTopics(lines):
+    """Groups the entries yielded by iterRunLines by topic and yields pairs
+    (topicId, [ (docID, score, annotation) ]).
+    Raises RuntimeError if the entries of a topic are not contiguous."""
+    seen = set()
+    for topicId, entries in groupby(lines, key=lambda entry: entry[0]):
+        if topicId in seen:
+            raise RuntimeError('Run not grouped by topic: topic ' + topicId + ' appears twice. Use sortRunFile.')
+        seen.add(topicId)
+        yield topicId, [(docId, score, annotation) for _, docId, score, annotation in entries]
+
+
+def iterTopicBatches(topics, batchSize=1):
+    """Groups the topics yielded by iterRunTopics into TrecRuns of (at most) batchSize topics."""
+    batch = {}
+    for topicId, entryList in topics:
+        batch[topicId] = entryList
+        if len(batch) == batchSize:
+            yield TrecRun(batch)
+            batch = {}
+    if batch:
+        yield TrecRun(batch)
+
+
+def _topicOrder(fileName):
+    """Returns the topics of the run file in order of first appearance."""
+    with openFile(fileName) as f:
+        return list(dict.fromkeys(_topicOf(line) for line in f if line.strip() != ''))
+
+
+def isGroupedByTopic(fileName):
+    """Returns True if the entries of each topic of the run file are contiguous."""
+    seen = set()
+    with openFile(fileName) as f:
+        for topicId, _ in groupby((line for line in f if line.strip() != ''), key=_topicOf):
+            if topicId in seen: return False
+            seen.add(topicId)
+    return True
+
+
+def sortRunFile(fileName, outFileName=None, maxLines=1000000):
+    """Sorts the lines of a run file by topic with an external merge sort that keeps at most
+    maxLines lines in memory. The relative order of the lines of each topic is preserved.
+    Returns the name of the sorted file (a temporary file if outFileName is None)."""
+    chunkNames = []
+    try:
+        with openFile(fileName) as f:
+            while True:
+                chunk = [line if line.endswith('\n') else line + '\n'
+                         for _, line in zip(range(maxLines), f) if line.strip() != '']
+                if not chunk: break
+                chunk.sort(key=_topicOf)
+                fd, chunkName = tempfile.mkstemp(suffix='.trecrun')
+                chunkNames.append(chunkName)
+                with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                    out.writelines(chunk)
+        if outFileName is None:
+            fd, outFileName = tempfile.mkstemp(suffix='.trecrun')
+            os.close(fd)
+        chunks = [open(chunkName, 'r', encoding='utf-8') for chunkName in chunkNames]
+        try:
+            with open(outFileName, 'w', encoding='utf-8') as out:
+                out.writelines(heapq.merge(*chunks, key=_topicOf))
+        finally:
+            for chunk in chunks: chunk.close()
+    finally:
+        for chunkName in chunkNames: os.remove(chunkName)
+    return outFileName
+
+
+def evaluateStream(fileName, qrels, measures=pytrec_eval.STD_METRICS, detailed=False, sort='auto',
+                   batchSize=1, maxSortLines=1000000):
+    """Evaluates the run contained in fileName without loading it into memory: the run is read
+    and evaluated batchSize topics at a time, and the per-topic scores are aggregated incrementally.
+    Returns the same results as pytrec_eval.evaluate(TrecRun(fileName), qrels, measures, detailed).
+    The entries of each topic must be contiguous in the file. If sort is 'auto' the file is checked
+    first and sorted by sortRunFile if needed; if sort is True it is always sorted; if sort is
+    False a RuntimeError is raised when a topic appears twice."""
+    measureList = measures if type(measures) == list else [measures]
+    for measure in measureList:
+        if not hasattr(measure, 'detailsKernel'):
+            raise ValueError(measure.__name__ + ' cannot be evaluated in streaming mode (no detailsKernel)')
+
+    sortedFileName = topicIds = None
+    if sort is True or (sort == 'auto' and not isGroupedByTopic(fileName)):
+        # the order of the topics of TrecRun(fileName)
+        topicIds = _topicOrder(fileName)
+        sortedFileName = fileName = sortRunFile(fileName, maxLines=maxSortLines)
+    try:
+        allDetails = [{} for _ in measureList]
+        denominators = [0] * len(measureList)
+        # topics of the run, in order
+        seen = {}
+        for run in iterTopicBatches(iterRunTopics(iterRunLines(fileName)), batchSize):
+            seen.update(dict.fromkeys(run.getTopicIds()))
+            _accumulate(JoinedRun(run, qrels.subset(run.getTopicIds())), measureList,
+                        allDetails, denominators)
+        # topics of the qrels that are not in the run
+        unseen = [topicId for topicId in qrels.getTopicIds() if topicId not in seen]
+        _accumulate(JoinedRun(TrecRun({}), qrels.subset(unseen)), measureList, allDetails, denominators)
+    finally:
+        if sortedFileName is not None: os.remove(sortedFileName)
+
+    if topicIds is None: topicIds = seen
+    results = []
+    for measure, details, denominator in zip(measureList, allDetails, denominators):
+        details = _reorder(details, qrels.allJudgements if detailsOrder(measure) == 'qrels' else topicIds)
+        avg = sum(details.values()) / denominator
+        results.append((avg, details) if detailed else avg)
+    return results if type(measures) == list else results[0]
+
+
+def _reorder(details, topicIds):
+    """Returns details with the topics in topicIds first, in that order."""
+    ordered = {topicId: details[topicId] for topicId in topicIds if topicId in details}
+    if len(ordered) < len(details): ordered.update(details)
+    return ordered
+
+
+def _accumulate(joined, measures, allDetails, denominators):
+    for i, measure in enumerate(measures):
+        details, denominator = measure.detailsKernel(joined)
+        allDetails[i].update(details)
+        denominators[i] += denominator
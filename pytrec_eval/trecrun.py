@@ -1,42 +1,290 @@
+import hashlib
+import heapq
+import pickle
 import sys
+from array import array
+from collections.abc import Mapping
+from itertools import repeat
+
+import numpy as np
+
+from pytrec_eval import cache
+from pytrec_eval.compression import openFile, stripSuffix
+from pytrec_eval.engine import _spansToPositions
+from pytrec_eval.instrumentation import countEntries, instrumented
+from pytrec_eval.parsing import parseRunColumns
+from pytrec_eval.vocabulary import Vocabulary
 
 __author__ = 'alberto'
 
+# write formats whole topics at once and writes them in chunks of at least WRITE_BUFFER characters
+WRITE_BUFFER = 1 << 22
+
+_LINE = '{}\tQ0\t{}\t{}\t{}\t{}'.format
+
+
+class ColumnarEntries(Mapping):
+    """Read-only mapping entries[topicID] = [ (docID, score, annotation) ] backed by NumPy arrays.
+    The entries of all topics are stored contiguously (CSR layout): the entries of the i-th topic
+    are found at positions offsets[i]:offsets[i + 1] of docCodes and scores, sorted by score.
+    DocIDs are integer-encoded through docVocabulary; annotations are stored only if at least
+    one entry has a non-empty annotation."""
+
+    def __init__(self, topicIds, offsets, docCodes, scores, docVocabulary,
+                 annotationCodes=None, annotationVocabulary=None):
+        # rows[topicID] = index of the topic in offsets
+        self.rows = {topicId: row for row, topicId in enumerate(topicIds)}
+        self.offsets = offsets
+        self.docCodes = docCodes
+        self.scores = scores
+        self.docVocabulary = docVocabulary
+        self.annotationCodes = annotationCodes
+        self.annotationVocabulary = annotationVocabulary
+
+    @classmethod
+    def fromColumns(cls, topicIds, topicCodes, docCodes, scores, docVocabulary,
+                    annotationCodes=None, annotationVocabulary=None, depth=None):
+        """Builds the entries from one value per line: topicCodes are indexes in the list
+        topicIds, docCodes, scores and annotationCodes are array-like. Lines may be in any order;
+        the entries of each topic are sorted by decreasing score (ties keep the input order).
+        If depth is not None only the first depth entries of each topic are kept."""
+        topicCodes = np.asarray(topicCodes, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        order = np.lexsort((-scores, topicCodes))
+        counts = np.bincount(topicCodes, minlength=len(topicIds))
+        if depth is not None and len(order) and counts.max() > depth:
+            starts = np.repeat(np.cumsum(counts) - counts, counts)
+            order = order[np.arange(len(order)) - starts < depth]
+            counts = np.minimum(counts, depth)
+        offsets = np.zeros(len(topicIds) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if annotationCodes is not None:
+            annotationCodes = np.asarray(annotationCodes, dtype=np.int32)
+            annotationCodes = annotationCodes[order] if annotationCodes.any() else None
+        return cls(topicIds, offsets, np.asarray(docCodes, dtype=np.int32)[order], scores[order],
+                   docVocabulary, annotationCodes, annotationVocabulary if annotationCodes is not None else None)
+
+    @classmethod
+    def fromDict(cls, entries):
+        """Builds the entries from a dictionary entries[topicID] = [ (docID, score, annotation) ]."""
+        docVocabulary, annotationVocabulary = Vocabulary(), Vocabulary([''])
+        topicCodes, docCodes, scores, annotationCodes = array('i'), array('i'), array('d'), array('i')
+        for topicCode, entryList in enumerate(entries.values()):
+            topicCodes.extend([topicCode] * len(entryList))
+            for docId, score, annotation in entryList:
+                docCodes.append(docVocabulary.encode(docId))
+                scores.append(score)
+                annotationCodes.append(annotationVocabulary.encode(annotation))
+        return cls.fromColumns(list(entries.keys()), topicCodes, docCodes, scores, docVocabulary,
+                               annotationCodes, annotationVocabulary)
+
+    def span(self, topicId):
+        """Returns the pair (start, end) delimiting the entries of topicId in the arrays."""
+        row = self.rows[topicId]
+        return int(self.offsets[row]), int(self.offsets[row + 1])
+
+    def getDocIds(self, topicId):
+        """Returns the list of docIDs retrieved for topicId, sorted by score."""
+        start, end = self.span(topicId)
+        strings = self.docVocabulary.strings
+        return [strings[code] for code in self.docCodes[start:end].tolist()]
+
+    def subset(self, topicIds):
+        """Returns a new ColumnarEntries containing only the topics in topicIds
+        (the doc vocabulary is shared)."""
+        topicIds = [t for t in topicIds if t in self.rows]
+        spans = [self.span(t) for t in topicIds]
+        lengths = np.array([end - start for start, end in spans], dtype=np.int64)
+        positions = np.concatenate([np.arange(start, end) for start, end in spans]) \
+            if spans else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(topicIds) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ColumnarEntries(topicIds, offsets, self.docCodes[positions], self.scores[positions],
+                               self.docVocabulary,
+                               None if self.annotationCodes is None else self.annotationCodes[positions],
+                               self.annotationVocabulary)
+
+    def removeTopic(self, topicId):
+        """Removes topicId from the mapping (its entries stay in the arrays until the next subset)."""
+        self.rows.pop(topicId, None)
+
+    def replaceTopics(self, entries):
+        """Replaces the entries of the topics in entries (a dictionary entries[topicID] = [ (docID, score, annotation) ]),
+        adding the topics that are not in the mapping. The new entries are appended to the arrays (the old
+        ones stay there until the next subset)."""
+        new = ColumnarEntries.fromDict(entries)
+        docCodes = np.array(self.docVocabulary.encodeAll(new.docVocabulary.strings), dtype=np.int32)[new.docCodes]
+        annotationCodes = self.annotationCodes
+        if self.annotationCodes is not None or new.annotationCodes is not None:
+            if self.annotationCodes is None:
+                self.annotationVocabulary = Vocabulary([''])
+                annotationCodes = np.zeros(len(self.docCodes), dtype=np.int32)
+            newAnnotationCodes = np.zeros(len(new.docCodes), dtype=np.int32) if new.annotationCodes is None else \
+                np.array(self.annotationVocabulary.encodeAll(new.annotationVocabulary.strings),
+                         dtype=np.int32)[new.annotationCodes]
+            annotationCodes = np.concatenate([annotationCodes, newAnnotationCodes])
+        firstRow = len(self.offsets) - 1
+        self.offsets = np.concatenate([self.offsets, new.offsets[1:] + self.offsets[-1]])
+        self.docCodes = np.concatenate([self.docCodes, docCodes])
+        self.scores = np.concatenate([self.scores, new.scores])
+        self.annotationCodes = annotationCodes
+        for topicId, row in new.rows.items():
+            self.rows[topicId] = firstRow + row
+
+    def useVocabulary(self, vocabulary):
+        """Encodes the docIDs against vocabulary (e.g., shared by several runs and their qrels), adding
+        the ones that are not there yet, and makes it the doc vocabulary."""
+        if self.docVocabulary is vocabulary: return
+        translation = np.array(vocabulary.encodeAll(self.docVocabulary.strings), dtype=np.int32)
+        self.docCodes = translation[self.docCodes]
+        self.docVocabulary = vocabulary
+
+    def updateDigest(self, digest):
+        """Feeds the content of the mapping (topics, entries and vocabularies) to digest (a hashlib object).
+        Only the docIDs of the entries are digested, hence the digest does not change with the size of a
+        shared vocabulary."""
+        rows = np.fromiter(self.rows.values(), dtype=np.int64, count=len(self.rows))
+        starts, ends = self.offsets[rows], self.offsets[rows + 1]
+        positions = _spansToPositions(starts, ends - starts)
+        usedCodes, docCodes = np.unique(self.docCodes[positions], return_inverse=True)
+        strings = self.docVocabulary.strings
+        digest.update(pickle.dumps((list(self.rows), [strings[code] for code in usedCodes.tolist()],
+                                    None if self.annotationCodes is None else self.annotationVocabulary.strings),
+                                   protocol=4))
+        digest.update(np.ascontiguousarray(ends - starts, dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(docCodes, dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(self.scores[positions], dtype=np.float64).tobytes())
+        if self.annotationCodes is not None:
+            digest.update(np.ascontiguousarray(self.annotationCodes[positions], dtype=np.int64).tobytes())
+
+    def columns(self, topicId):
+        """Returns the lists (docIds, scores, annotations) of the entries of topicId, sorted by score."""
+        start, end = self.span(topicId)
+        docIds = self.getDocIds(topicId)
+        scores = self.scores[start:end].tolist()
+        if self.annotationCodes is None: return docIds, scores, [''] * len(docIds)
+        annotations = self.annotationVocabulary.strings
+        return docIds, scores, [annotations[code] for code in self.annotationCodes[start:end].tolist()]
+
+    def __getitem__(self, topicId):
+        start, end = self.span(topicId)
+        docIds = self.getDocIds(topicId)
+        scores = self.scores[start:end].tolist()
+        if self.annotationCodes is None:
+            return [(docId, score, '') for docId, score in zip(docIds, scores)]
+        annotations = self.annotationVocabulary.strings
+        return [(docId, score, annotations[code])
+                for docId, score, code in zip(docIds, scores, self.annotationCodes[start:end].tolist())]
+
+    def __contains__(self, topicId):
+        return topicId in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
 
 class TrecRun:
     """Represents a TREC-like run."""
 
     # Collects the entries of the run:
     # runEntries[topicID] = [ (docID, score, annotation) ] sorted by score
+    # In columnar mode entries is a ColumnarEntries exposing the same interface.
     entries = None
 
     name = None
 
-    def __init__(self, source, name=''):
-        """Builds a type-run starting from a file (if source is a string containing a file name)
-        or from another dictionary source[topicID] = [ (docID, score, annotation) ] (the list of docID, scores
-        may be not sorted)."""
+    # incremented by every change of the entries made through the methods of TrecRun
+    version = 0
+
+    # (version, digest) of the last computed fingerprint
+    _fingerprint = None
+
+    def __init__(self, source, name='', columnar=False, bulk=True, cacheDir=None, incremental=False,
+                 depth=None, topics=None, vocabulary=None, contentHash=False):
+        """Builds a type-run starting from a file (if source is a string containing a file name),
+        from a text stream (read until its end and closed, e.g., the body of a request) or from another
+        dictionary source[topicID] = [ (docID, score, annotation) ] (the list of docID, scores may be not sorted).
+        If columnar is True the entries are stored in NumPy arrays (see ColumnarEntries), which
+        takes a fraction of the memory needed by lists of tuples.
+        If bulk is True columnar runs are read by the block parser of pytrec_eval.parsing (which also
+        accepts whitespace-separated files), otherwise line by line.
+        If cacheDir is not None, runs read from files are cached in binary form in cacheDir
+        (True for pytrec_eval.cache.DEFAULT_CACHE_DIR) and loaded from there (memory-mapped) while
+        the file is unchanged. If contentHash is True cache entries are keyed by a hash of the content of
+        the file instead of its path, size and modification time (see pytrec_eval.cache.entryPath).
+        If incremental is True pytrec_eval.evaluate keeps the per-topic scores of the run and, when it is
+        evaluated again, recomputes only the topics changed in the meantime (see pytrec_eval.incremental).
+        If depth is not None only the depth entries with the highest scores of each topic are kept (files are
+        parsed keeping a bounded heap per topic). If topics (e.g., qrels.getTopicIds()) is not None only the
+        entries of those topics are kept, lines of other topics are skipped while parsing.
+        If vocabulary is not None (a pytrec_eval.Vocabulary shared, e.g., by the runs of a collection and
+        their qrels) the run is columnar and its docIDs are encoded against vocabulary (see shareVocabulary)."""
+        if depth is not None and depth < 1: raise ValueError('depth must be positive')
+        self.columnar = columnar or vocabulary is not None
+        self.depth = depth
+        self.topics = None if topics is None else frozenset(topics)
+        self.bulk = bulk
+        self.incremental = incremental
+        # _changes[v] = topic changed by the change producing version _baseVersion + v + 1; changes
+        # older than the oldest version referenced by _evaluations are dropped
+        self._changes = []
+        self._baseVersion = 0
+        # state of the incremental evaluations of the run (see pytrec_eval.incremental)
+        self._evaluations = {}
         if type(source) == str:
-            self._parseFile(source)
+            if cacheDir is None:
+                self._parseFile(source)
+            else:
+                self._loadCached(source, cacheDir, contentHash)
             self.name = name if name != '' else self._extract_runname(source)
         elif type(source) == dict:
+            if depth is not None or topics is not None: source = self._truncate(source)
+            self.entries = ColumnarEntries.fromDict(source) if self.columnar else source
+            self.name = name
+        elif hasattr(source, 'read'):
+            self._parseFile(source)
+            self.name = name
+        elif type(source) == ColumnarEntries:
             self.entries = source
+            self.columnar = True
             self.name = name
         else:
             raise RuntimeError("Wrong parameter for TrecRun's constructor. Accepted str and dict, given", type(source))
 
-        for topicId, entryList in self.entries.items():
-            entryList.sort(key=lambda x: x[1], reverse=True)
+        if not self.columnar:
+            for topicId, entryList in self.entries.items():
+                entryList.sort(key=lambda x: x[1], reverse=True)
+        elif vocabulary is not None:
+            self.entries.useVocabulary(vocabulary)
 
     def _extract_runname(self, filename):
-        if filename.endswith('.trecrun'):
+        if stripSuffix(filename).endswith('.trecrun'):
+            filename = stripSuffix(filename)
             return filename[filename.rfind('/') + 1: filename.rfind('.')]
         else:
             return filename
 
+    def _truncate(self, entries):
+        """Returns the entries of the topics in self.topics, cut at self.depth."""
+        if self.topics is not None:
+            entries = {topicId: entryList for topicId, entryList in entries.items() if topicId in self.topics}
+        if self.depth is not None:
+            # nlargest is stable: ties keep the input order, as sort does
+            entries = {topicId: heapq.nlargest(self.depth, entryList, key=lambda x: x[1])
+                       for topicId, entryList in entries.items()}
+        return entries
+
+    @instrumented('TrecRun.parse', lambda self, *args: countEntries(self.entries))
     def _parseFile(self, source):
+        if self.columnar:
+            return self._parseFileColumnar(source)
+        if self.depth is not None:
+            return self._parseFileTopK(source)
         self.entries = {}
-        f = open(source, 'r', encoding='utf-8')
+        f = openFile(source)
         for line in f:
             line = line.strip()
             if line == "": continue
@@ -48,11 +296,117 @@ class TrecRun:
                 annotation = ''
             else:
                 raise BaseException('Unparsable run')
+            if self.topics is not None and topicId not in self.topics: continue
             score = float(score)
             if topicId not in self.entries: self.entries[topicId] = []
             self.entries[topicId].append((docId, score, annotation))
         f.close()
 
+    def _parseFileTopK(self, source):
+        # heaps[topicID] = min-heap of the best depth (score, -line, entry) of the topic: on equal
+        # scores earlier lines win, as with a stable sort
+        heaps = {}
+        f = openFile(source)
+        for lineNumber, line in enumerate(f):
+            line = line.strip()
+            if line == "": continue
+            splitLine = line.split('\t')
+            if len(splitLine) == 6:
+                topicId, Q0, docId, rank, score, annotation = splitLine
+            elif len(splitLine) == 5:
+                topicId, Q0, docId, rank, score = splitLine
+                annotation = ''
+            else:
+                raise BaseException('Unparsable run')
+            if self.topics is not None and topicId not in self.topics: continue
+            score = float(score)
+            heap = heaps.get(topicId)
+            if heap is None: heap = heaps[topicId] = []
+            if len(heap) < self.depth:
+                heapq.heappush(heap, (score, -lineNumber, (docId, score, annotation)))
+            elif (score, -lineNumber) > heap[0][:2]:
+                heapq.heapreplace(heap, (score, -lineNumber, (docId, score, annotation)))
+        f.close()
+        self.entries = {topicId: [item[2] for item in sorted(heap, reverse=True)] for topicId, heap in heaps.items()}
+
+    def _parseFileColumnar(self, source):
+        if self.bulk:
+            topicVocabulary, topicCodes, docVocabulary, docCodes, scores, annotationVocabulary, annotationCodes = \
+                parseRunColumns(source, self.topics)
+            self._setColumns(topicVocabulary, topicCodes, docVocabulary, docCodes, scores, annotationVocabulary,
+                             annotationCodes)
+            return
+        topicVocabulary, docVocabulary, annotationVocabulary = Vocabulary(), Vocabulary(), Vocabulary([''])
+        topicCodes, docCodes, scores, annotationCodes = array('i'), array('i'), array('d'), array('i')
+        f = openFile(source)
+        for line in f:
+            line = line.strip()
+            if line == "": continue
+            splitLine = line.split('\t')
+            if len(splitLine) == 6:
+                topicId, Q0, docId, rank, score, annotation = splitLine
+            elif len(splitLine) == 5:
+                topicId, Q0, docId, rank, score = splitLine
+                annotation = ''
+            else:
+                raise BaseException('Unparsable run')
+            if self.topics is not None and topicId not in self.topics: continue
+            topicCodes.append(topicVocabulary.encode(topicId))
+            docCodes.append(docVocabulary.encode(docId))
+            scores.append(float(score))
+            annotationCodes.append(annotationVocabulary.encode(annotation))
+        f.close()
+        self._setColumns(topicVocabulary, topicCodes, docVocabulary, docCodes, scores, annotationVocabulary,
+                         annotationCodes)
+
+    def _setColumns(self, topicVocabulary, topicCodes, docVocabulary, docCodes, scores, annotationVocabulary,
+                    annotationCodes):
+        self.entries = ColumnarEntries.fromColumns(topicVocabulary.strings, topicCodes, docCodes, scores,
+                                                   docVocabulary, annotationCodes, annotationVocabulary, self.depth)
+        if self.depth is not None:
+            # drops the docIDs of the entries cut from the vocabulary (codes keep the order of first appearance)
+            used, codes = np.unique(self.entries.docCodes, return_inverse=True)
+            strings = self.entries.docVocabulary.strings
+            self.entries.docVocabulary = Vocabulary.fromList([strings[code] for code in used.tolist()])
+            self.entries.docCodes = codes.astype(np.int32)
+
+    @instrumented('TrecRun.loadCached', lambda self, *args: countEntries(self.entries))
+    def _loadCached(self, source, cacheDir, contentHash):
+        options = {'bulk': self.bulk}
+        if self.depth is not None: options['depth'] = self.depth
+        if self.topics is not None: options['topics'] = sorted(self.topics)
+        path = cache.entryPath(source, 'run', cacheDir, contentHash, **options)
+        cached = cache.load(path)
+        if cached is None:
+            columnar, self.columnar = self.columnar, True
+            self._parseFile(source)
+            self.columnar = columnar
+            columns = self.entries
+            arrays = {'offsets': columns.offsets, 'docCodes': columns.docCodes, 'scores': columns.scores}
+            stringLists = {'topicIds': list(columns.rows), 'docIds': columns.docVocabulary.strings}
+            if columns.annotationCodes is not None:
+                arrays['annotationCodes'] = columns.annotationCodes
+                stringLists['annotations'] = columns.annotationVocabulary.strings
+            cache.store(path, arrays, stringLists)
+        else:
+            arrays, stringLists = cached
+            annotated = 'annotationCodes' in arrays
+            self.entries = ColumnarEntries(stringLists['topicIds'], arrays['offsets'], arrays['docCodes'],
+                                           arrays['scores'], Vocabulary.fromList(stringLists['docIds']),
+                                           arrays['annotationCodes'] if annotated else None,
+                                           Vocabulary.fromList(stringLists['annotations']) if annotated else None)
+        if not self.columnar:
+            self.entries = dict(self.entries.items())
+
+    def shareVocabulary(self, vocabulary):
+        """Makes the run columnar (if it is not) and encodes its docIDs against vocabulary, which can be
+        shared by many runs and by QRels: docIDs are then stored once for all of them, the join with
+        qrels sharing the vocabulary compares integer codes and so do pytrec_eval.pool and overlap."""
+        if not self.columnar:
+            self.entries = ColumnarEntries.fromDict(self.entries)
+            self.columnar = True
+        self.entries.useVocabulary(vocabulary)
+
     def restrictTopicsTo(self, qrels):
         """
         Remove all topics that are not in qrels
@@ -81,13 +435,85 @@ class TrecRun:
 
     def removeEntries(self, topicId):
         """Removes all the entries referring to topicId."""
-        self.entries.pop(topicId, '')
+        if self.columnar:
+            self.entries.removeTopic(topicId)
+        else:
+            self.entries.pop(topicId, '')
+        self._touch([topicId])
+
+    def replaceEntries(self, entries):
+        """Replaces all the entries of each topic in entries, a dictionary
+        entries[topicID] = [ (docID, score, annotation) ] (the lists may be not sorted); topics that are
+        not in the run are added."""
+        if self.columnar:
+            self.entries.replaceTopics(entries)
+        else:
+            for topicId, entryList in entries.items():
+                self.entries[topicId] = sorted(entryList, key=lambda x: x[1], reverse=True)
+        self._touch(list(entries))
+
+    def _touch(self, topicIds):
+        self._changes.extend(topicIds)
+        self.version += len(topicIds)
+        oldest = min((state.version for state in self._evaluations.values()), default=self.version)
+        if oldest > self._baseVersion:
+            del self._changes[:oldest - self._baseVersion]
+            self._baseVersion = oldest
+
+    def changedTopics(self, version):
+        """Returns the set of topics whose entries were changed (replaced or removed) through the methods
+        of TrecRun since the run had the given version, None if the changes since then are not known."""
+        if version < self._baseVersion: return None
+        return set(self._changes[version - self._baseVersion:])
+
+    def inheritEvaluations(self, run, removedTopics):
+        """Makes this run, obtained from run by removing removedTopics, reuse the state of the incremental
+        evaluations of run (see pytrec_eval.incremental)."""
+        self.incremental = run.incremental
+        self._changes = []
+        self._baseVersion = self.version
+        self._evaluations = {key: state.copy(self.version) for key, state in run._evaluations.items()
+                             if state.version == run.version}
+        self._touch(list(removedTopics))
+
+    def fingerprint(self):
+        """Returns a digest (hex string) of the entries of the run, which changes whenever the entries do.
+        It is recomputed only after changes made through the methods of TrecRun (e.g., removeEntries,
+        restrictTopicsTo); changes made by modifying entries directly are not detected."""
+        if self._fingerprint is None or self._fingerprint[0] != self.version:
+            digest = hashlib.sha1()
+            if self.columnar:
+                self.entries.updateDigest(digest)
+            else:
+                digest.update(pickle.dumps(self.entries, protocol=4))
+            self._fingerprint = (self.version, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def _columns(self, topicId):
+        """Returns the sequences (docIds, scores, annotations) of the entries of topicId, sorted by score."""
+        if self.columnar: return self.entries.columns(topicId)
+        entryList = self.entries[topicId]
+        return tuple(zip(*entryList)) if entryList else ((), (), ())
 
     def write(self, outStream=sys.stdout):
-        """Writes the run in the specified stream using TREC-format"""
-        for topicId, entryList in self.entries.items():
-            for (rank, (docId, score, annotation)) in enumerate(entryList, start=1):
-                outStream.write('{}\tQ0\t{}\t{}\t{}\t{}\n'.format(topicId, docId, rank, score, annotation))
+        """Writes the run in the specified stream using TREC-format.
+        Whole topics are formatted at once and written in chunks of about WRITE_BUFFER characters.
+        If outStream is a file name the run is written into that file, compressed according to
+        its extension (see pytrec_eval.compression)."""
+        if type(outStream) == str:
+            with openFile(outStream, 'w') as f:
+                return self.write(f)
+        chunks, size = [], 0
+        for topicId in self.entries:
+            docIds, scores, annotations = self._columns(topicId)
+            if not docIds: continue
+            text = '\n'.join(map(_LINE, repeat(topicId), docIds, range(1, len(docIds) + 1), scores, annotations))
+            chunks.append(text)
+            size += len(text)
+            if size >= WRITE_BUFFER:
+                outStream.write('\n'.join(chunks) + '\n')
+                chunks, size = [], 0
+        if chunks: outStream.write('\n'.join(chunks) + '\n')
 
     def __str__(self):
         return self.name
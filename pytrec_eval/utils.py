@@ -1,26 +1,84 @@
 import sys
 from scipy.stats import stats
 import pytrec_eval
+from pytrec_eval import incremental, instrumentation, result_cache
+from pytrec_eval.compression import SUFFIXES
+from pytrec_eval.concurrent_io import iterRuns, writeRuns
+from pytrec_eval.engine import JoinedRun
+from pytrec_eval.parallel import evaluateRuns, loadRuns
 
 __author__ = 'alberto'
 
 
+@instrumentation.instrumented('evaluate', lambda run, *args, **kwargs: instrumentation.countEntries(run.entries))
 def evaluate(run, qrels, measures=pytrec_eval.STD_METRICS, detailed=False):
     """Evaluates a TREC-run by using the specified qrels to compute the given measures.
     Measure is a list of functions.
-    If detailed is True then the value of each measure is reported for each topic."""
+    If detailed is True then the value of each measure is reported for each topic.
+    Measures having a vectorized kernel (all the built-in ones) share a single join
+    between the run and the qrels.
+    If the result cache is enabled (see pytrec_eval.enableResultCache) results are memoized.
+    If instrumentation is enabled (see pytrec_eval.enableInstrumentation) the evaluation and each
+    measure computed are recorded."""
+    resultCache = result_cache.current
+    if resultCache is None: return _evaluate(run, qrels, measures, detailed)
+    measureList = measures if type(measures) == list else [measures]
+    keys = [resultCache.key(run, qrels, measure, detailed) for measure in measureList]
+    results = [None if key is None else resultCache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        computed = _evaluate(run, qrels, [measureList[i] for i in missing], detailed)
+        for i, result in zip(missing, computed):
+            if keys[i] is not None: resultCache.put(keys[i], result)
+            results[i] = result
+    return results if type(measures) == list else results[0]
+
+
+def _evaluate(run, qrels, measures, detailed):
+    measureList = measures if type(measures) == list else [measures]
+    if any(incremental.isIncremental(run, measure) for measure in measureList):
+        incrementalMeasures = [measure for measure in measureList if incremental.isIncremental(run, measure)]
+        incrementalResults = dict(zip(incrementalMeasures,
+                                      incremental.evaluate(run, qrels, incrementalMeasures, detailed)))
+        others = [measure for measure in measureList if measure not in incrementalResults]
+        otherResults = dict(zip(others, _evaluate(run, qrels, others, detailed))) if others else {}
+        results = [incrementalResults[m] if m in incrementalResults else otherResults[m] for m in measureList]
+        return results if type(measures) == list else results[0]
+    joined = None
     if type(measures) == list:
         results = []
         for measure in measures:
-            results.append(measure(run, qrels, detailed=detailed))
+            if hasattr(measure, 'kernel') and joined is None:
+                joined = JoinedRun(run, qrels)
+            results.append(_evaluateMeasure(run, qrels, measure, detailed, joined))
     else:
-        results = measures(run, qrels, detailed=detailed)
+        results = _evaluateMeasure(run, qrels, measures, detailed,
+                                   JoinedRun(run, qrels) if hasattr(measures, 'kernel') else None)
     return results
 
 
-def evaluateAll(runs, qrels, measures=pytrec_eval.STD_METRICS, streamOut=sys.stdout):
-    """Evaluates all the runs contained in runs (a list of runs).
-    Prints the result of the evaluation in streamOut."""
+def evaluateCutoffs(run, qrels, kinds, cutoffs, detailed=False):
+    """Evaluates the measures of the given kinds ('P', 'recall', 'ndcg') at all the ranks in cutoffs
+    (see cutoffMeasures) in a single pass.
+    Returns a dictionary results['kind@rank'] = what evaluate returns for that measure."""
+    measures = pytrec_eval.cutoffMeasures(kinds, cutoffs)
+    return {measure.__name__: result for measure, result in zip(measures, evaluate(run, qrels, measures, detailed))}
+
+
+def _evaluateMeasure(run, qrels, measure, detailed, joined):
+    with instrumentation.metricPhase(measure, lambda: instrumentation.countEntries(run.entries)):
+        if joined is not None and hasattr(measure, 'kernel'):
+            return measure.kernel(joined, detailed)
+        return measure(run, qrels, detailed=detailed)
+
+
+@instrumentation.instrumented('evaluateAll', lambda runs, *args, **kwargs: len(runs) if hasattr(runs, '__len__')
+                              else None)
+def evaluateAll(runs, qrels, measures=pytrec_eval.STD_METRICS, streamOut=sys.stdout, processes=1, threads=1):
+    """Evaluates all the runs contained in runs (a list of runs, or of names of run files).
+    Prints the result of the evaluation in streamOut.
+    If processes > 1 the runs are parsed and evaluated by up to processes worker processes, otherwise
+    if threads > 1 up to threads run files are parsed concurrently while the runs are evaluated."""
     if callable(measures): measures = [measures]
     mList = [measure.__name__ for measure in measures]
 
@@ -28,24 +86,33 @@ def evaluateAll(runs, qrels, measures=pytrec_eval.STD_METRICS, streamOut=sys.std
     for m in mList: print(m, end='\t', file=streamOut)
     print('')
 
-    for run in runs:
-        results = evaluate(run, qrels, measures)
-        print(run.name, end='\t', file=streamOut)
+    for name, results in evaluateRuns(runs, qrels, measures, processes=processes, threads=threads):
+        print(name, end='\t', file=streamOut)
         for m in results: print(m, sep='', end='\t', file=streamOut)
         print('')
 
 
-def writeAll(runList, outputDir):
-    """writes all the runs into TREC-run files placed in outputDir"""
-    for run in runList:
-        f = open(outputDir + '/' + run.name, 'w', encoding='utf-8')
-        run.write(f)
-        f.close()
+def writeAll(runList, outputDir, compression=None, threads=1):
+    """writes all the runs into TREC-run files placed in outputDir.
+    If compression is one of the extensions in pytrec_eval.compression.SUFFIXES (e.g. '.gz')
+    the files are compressed and their names end with compression.
+    If threads > 1 up to threads files are written concurrently."""
+    if compression is not None and compression not in SUFFIXES:
+        raise ValueError('Unknown compression ' + compression)
+    writeRuns(runList, [outputDir + '/' + run.name + (compression or '') for run in runList], threads)
 
 
-def loadAll(runFilenames):
-    """Load all runs in the list runFilenames and returns a list of TrecRun s."""
-    return [pytrec_eval.TrecRun(name) for name in runFilenames]
+def loadAll(runFilenames, threads=1, processes=1, **kwargs):
+    """Load all runs in the list runFilenames and returns a list of TrecRun s.
+    If threads > 1 up to threads files are parsed concurrently (see pytrec_eval.concurrent_io.iterRuns,
+    which also loads runs lazily); if processes > 1 files are parsed by up to processes worker processes.
+    Other keyword arguments are passed to the constructor of TrecRun (e.g., columnar=True, or vocabulary=
+    pytrec_eval.Vocabulary() to encode the docIDs of all the runs against a single vocabulary)."""
+    if processes > 1:
+        return loadRuns(runFilenames, processes, **kwargs)
+    if threads <= 1:
+        return [pytrec_eval.TrecRun(name, **kwargs) for name in runFilenames]
+    return list(iterRuns(runFilenames, threads, **kwargs))
 
 
 def showRelevanceScores(trecRun, qrels, topicId, top_n=10, file=sys.stdout):
@@ -108,5 +175,11 @@ def keep_qrels_topics(run, qrels):
     :type qrels: QRels
     :return: TrecRun
     """
-    new_run = {topic_id: entries for topic_id, entries in run.entries.items() if topic_id in qrels.allJudgements}
-    return pytrec_eval.TrecRun(new_run, run.name + '_only_qrels_topics')
\ No newline at end of file
+    if run.columnar:
+        new_run = run.entries.subset([topic_id for topic_id in run.entries if topic_id in qrels.allJudgements])
+    else:
+        new_run = {topic_id: entries for topic_id, entries in run.entries.items() if topic_id in qrels.allJudgements}
+    new_run = pytrec_eval.TrecRun(new_run, run.name + '_only_qrels_topics')
+    if run.incremental:
+        new_run.inheritEvaluations(run, [topic_id for topic_id in run.entries if topic_id not in new_run.entries])
+    return new_run
\ No newline at end of file
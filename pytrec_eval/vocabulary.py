@@ -0,0 +1,74 @@
+import threading
+from itertools import islice
+
+__author__ = 'alberto'
+
+
+class Vocabulary:
+    """Maps identifiers (strings) to dense integer codes 0, 1, 2, ... and back.
+    Codes are assigned in order of first appearance and never change. Encoding is thread-safe,
+    so that a vocabulary can be shared by runs parsed by several threads."""
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self._codes = {}
+        # serializes the insertions into this vocabulary
+        self._lock = threading.Lock()
+        for s in strings:
+            self.encode(s)
+
+    @classmethod
+    def fromList(cls, strings):
+        """Returns a vocabulary where the code of strings[i] is i (strings must be distinct)."""
+        vocabulary = cls()
+        vocabulary.strings = list(strings)
+        vocabulary._codes = dict(zip(vocabulary.strings, range(len(vocabulary.strings))))
+        return vocabulary
+
+    def encode(self, s):
+        """Returns the code of s, adding s to the vocabulary if it is not there yet."""
+        code = self._codes.get(s)
+        if code is None:
+            with self._lock:
+                # s may have been added by another thread in the meantime
+                code = self._codes.setdefault(s, len(self.strings))
+                if code == len(self.strings): self.strings.append(s)
+        return code
+
+    def encodeAll(self, strings):
+        """Returns the list of the codes of strings, adding to the vocabulary the strings that are
+        not there yet (in order of first appearance)."""
+        codes = self._codes
+        with self._lock:
+            size = len(codes)
+            # len(codes) is evaluated before the insertion of s, hence new strings get consecutive codes
+            result = [codes.setdefault(s, len(codes)) for s in strings]
+            self.strings.extend(islice(codes, size, None))
+        return result
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def lookupAll(self, strings):
+        """Returns the list of the codes of strings, which must all be in the vocabulary (KeyError otherwise)."""
+        return list(map(self._codes.__getitem__, strings))
+
+    def lookup(self, s, default=-1):
+        """Returns the code of s or default if s is not in the vocabulary."""
+        return self._codes.get(s, default)
+
+    def decode(self, code):
+        """Returns the string having the specified code."""
+        return self.strings[code]
+
+    def __contains__(self, s):
+        return s in self._codes
+
+    def __len__(self):
+        return len(self.strings)
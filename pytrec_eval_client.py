@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+
+__author__ = 'alberto'
+
+
+# Client of the local evaluation server (see pytrec_eval.server).
+# This module depends on the standard library only and does not import pytrec_eval, so that
+# short-lived processes (e.g., the steps of a CI pipeline) pay neither the import of pytrec_eval
+# nor the one of NumPy, SciPy and pandas. Runs given as file names are read by the server; other
+# runs (e.g., TrecRun s) are written into a temporary file, which is streamed as the body of the
+# request (POST /evaluate?... and /ttest?... with Content-Type text/plain).
+
+DEFAULT_PORT = 8765
+
+# size of the chunks in which the body of a request is sent
+CHUNK_SIZE = 1 << 20
+
+
+class EvaluationClient:
+    """Client of an EvaluationServer listening on host:port. Its methods mirror the ones of pytrec_eval;
+    runs are names of run files (read by the server) or objects having a method write(textStream), such
+    as TrecRun s (sent in the body of the request), measures are names (see pytrec_eval.parseMeasure)
+    or metrics whose __name__ is a valid name."""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=None):
+        self.url = 'http://{}:{}'.format(host, port)
+        self.timeout = timeout
+
+    def _send(self, httpRequest):
+        try:
+            with urllib.request.urlopen(httpRequest, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError('Evaluation server: ' + json.loads(e.read().decode('utf-8')).get('error', str(e)))
+
+    def _call(self, path, request=None):
+        data = None if request is None else json.dumps(request).encode('utf-8')
+        return self._send(urllib.request.Request(self.url + path, data, {'Content-Type': 'application/json'}))
+
+    def _callWithRun(self, path, request, run):
+        """Calls path with the run: its file name in the JSON request if run is a string, otherwise the
+        run in the body of the request and the other parameters in the query string."""
+        if type(run) == str: return self._call(path, dict(request, run=os.path.abspath(run)))
+        with tempfile.TemporaryFile() as body:
+            text = io.TextIOWrapper(body, encoding='utf-8', write_through=True)
+            run.write(text)
+            text.detach()
+            size = body.tell()
+            body.seek(0)
+            query = urllib.parse.urlencode(dict(request, name=getattr(run, 'name', 'run')), doseq=True)
+            httpRequest = urllib.request.Request(self.url + path + '?' + query, _chunks(body),
+                                                 {'Content-Type': 'text/plain; charset=utf-8',
+                                                  'Content-Length': str(size)})
+            return self._send(httpRequest)
+
+    @staticmethod
+    def _measureName(measure):
+        return measure if type(measure) == str else measure.__name__
+
+    def qrelsNames(self):
+        """Returns the names of the qrels loaded by the server."""
+        return self._call('/qrels')
+
+    def loadQRels(self, name, fileName):
+        """Makes the server load the qrels in fileName as name."""
+        self._call('/qrels', {'name': name, 'fileName': os.path.abspath(fileName)})
+
+    def evaluate(self, run, qrels, measures=('avgPrec', 'ndcg'), detailed=False):
+        """Returns what pytrec_eval.evaluate returns; qrels is the name of qrels loaded by the server."""
+        measureList = list(measures) if type(measures) in (list, tuple) else [measures]
+        request = {'qrels': qrels, 'detailed': detailed,
+                   'measures': [self._measureName(measure) for measure in measureList]}
+        results = self._callWithRun('/evaluate', request, run)['results']
+        if detailed: results = [tuple(result) for result in results]
+        return results if type(measures) in (list, tuple) else results[0]
+
+    def rankRuns(self, runs, qrels, measure):
+        """Returns a list of pairs (runName, score) ordered by decreasing score (see pytrec_eval.rankRuns);
+        runs are names of run files."""
+        request = {'qrels': qrels, 'runs': [os.path.abspath(run) for run in runs],
+                   'measure': self._measureName(measure)}
+        return [tuple(pair) for pair in self._call('/rank', request)]
+
+    def ttest(self, victimRun, otherRuns, qrels, measure):
+        """Returns a dictionary d[otherRunName] = p-value (see pytrec_eval.ttest); otherRuns are names of run files."""
+        request = {'qrels': qrels, 'others': [os.path.abspath(run) for run in otherRuns],
+                   'measure': self._measureName(measure)}
+        return self._callWithRun('/ttest', request, victimRun)
+
+
+def _chunks(stream):
+    """Yields the content of the binary stream in chunks of CHUNK_SIZE bytes."""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk: break
+        yield chunk